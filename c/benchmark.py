@@ -1,69 +1,227 @@
-import pathlib, subprocess, time, os
+import argparse, datetime, json, math, os, pathlib, platform, statistics, subprocess, sys, time
+from build import BuildCache
 
-def generate_unique_name(base:str = "file"):
-    counter = 0
-    while os.path.exists(base+hex(counter)[2:]):
-        counter += 1
-    return base+hex(counter)[2:]
+# gcc -O3 -fopenmp -m64 -funroll-loops -march=native main.c -o main
+# exclude -march=native as we want our benchmarks to be for a more general executable.
+DEFAULT_FLAGS = ["-O3", "-fopenmp", "-m64", "-funroll-loops"]
 
-def benchmark(file:pathlib.Path, compile_flags:list, runs:int=4):
+def benchmark(file:pathlib.Path, compile_flags:list, runs:int=4, cache:BuildCache = None):
     """
     Compiles, runs, and returns the excecution time of the given C file.
-    Compilation is done using gcc with the provided flags.
+    Compilation is done using gcc with the provided flags through a `BuildCache` so unchanged programs aren't recompiled.
     The file is run `runs` times and the results are averaged.
     """
-    # generate a unique name for the excecutable to ensure
-    excecutable = generate_unique_name("excecutable")
+    cache = cache or BuildCache()
 
     # compile the given C file.
     try:
-        subprocess.run(["gcc", *compile_flags, file, "-o", excecutable])
+        excecutable = cache.build(file, compile_flags)
     except subprocess.CalledProcessError as err:
         print(f"Failed to compile: {file}.")
+        print(err.stderr)
         return err
 
     # benchmark the file
     times = []
     for i in range(runs):
-        try:
-            start_time = time.perf_counter()
-            code = subprocess.run([f"./{excecutable}"]).returncode
-            end_time = time.perf_counter()
-        except subprocess.CalledProcessError as err:
-            print(f"File: {file} failed to excecute with error: {err} on run: {i + 1}")
+        sample = measure(excecutable)
+        if sample["returncode"] != 0:
+            print(f"File: {file} failed to excecute with return code: {sample['returncode']} on run: {i + 1}")
+            return subprocess.CalledProcessError(sample["returncode"], str(excecutable))
 
-            # delete the generated excecutable
-            os.remove(excecutable)
+        times.append(sample["wall"])
 
-            return err
+    # average and return the results
+    return sum(times)/len(times), sample["returncode"]
 
-        times.append(end_time - start_time)
+def measure(excecutable:pathlib.Path, args:list = (), env:dict = None) -> dict:
+    """
+    Runs `excecutable` once and returns its wall time, user and system cpu time (seconds),
+    peak resident set size (KiB) and return code. The program's output is discarded.
+    """
+    start_time = time.perf_counter()
+    process = subprocess.Popen([str(excecutable), *map(str, args)], stdout=subprocess.DEVNULL, env=env)
+    # wait4 gives the resource usage of just this child.
+    _, status, usage = os.wait4(process.pid, 0)
+    end_time = time.perf_counter()
+    process.returncode = os.waitstatus_to_exitcode(status)
 
-    # delete the generated excecutable
-    os.remove(excecutable)
+    return {
+        "wall": end_time - start_time,
+        "user": usage.ru_utime,
+        "sys": usage.ru_stime,
+        # ru_maxrss is in KiB on Linux but bytes on macOS.
+        "max_rss": usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss,
+        "returncode": process.returncode,
+    }
 
-    # average and return the results
-    return sum(times)/len(times), code
+def percentile(values:list, fraction:float) -> float:
+    """
+    Returns the `fraction` percentile of `values` using linear interpolation.
+    """
+    values = sorted(values)
+    position = (len(values) - 1)*fraction
+    low, high = math.floor(position), math.ceil(position)
+    return values[low] + (values[high] - values[low])*(position - low)
+
+def summarise(values:list, confidence:float = 0.95) -> dict:
+    """
+    Returns summary statistics of `values` including a distribution free confidence interval for the median.
+    The interval is given by the order statistics either side of the median (normal approximation to the binomial).
+    """
+    values = sorted(values)
+    n = len(values)
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence/2)
+    low = max(math.floor(n/2 - z*math.sqrt(n)/2), 0)
+    high = min(math.ceil(n/2 + z*math.sqrt(n)/2), n - 1)
+
+    return {
+        "n": n,
+        "min": values[0],
+        "max": values[-1],
+        "mean": statistics.fmean(values),
+        "stdev": statistics.stdev(values) if n > 1 else 0.0,
+        "median": statistics.median(values),
+        "p10": percentile(values, 0.1),
+        "p90": percentile(values, 0.9),
+        "ci": [values[low], values[high]],
+    }
+
+def run_variant(excecutable:pathlib.Path, runs:int = 10, warmups:int = 1, args:list = (), env:dict = None) -> dict:
+    """
+    Runs `excecutable` `warmups` times without recording anything and then `runs` times,
+    returning the raw samples and a summary of each measurement.
+    """
+    for _ in range(warmups):
+        measure(excecutable, args, env)
+
+    samples = [measure(excecutable, args, env) for _ in range(runs)]
+    failures = [sample["returncode"] for sample in samples if sample["returncode"] != 0]
+
+    return {
+        "samples": samples,
+        "failures": len(failures),
+        "wall": summarise([sample["wall"] for sample in samples]),
+        "user": summarise([sample["user"] for sample in samples]),
+        "sys": summarise([sample["sys"] for sample in samples]),
+        "max_rss": max(sample["max_rss"] for sample in samples),
+    }
+
+def benchmark_variants(variants:dict, runs:int = 10, warmups:int = 1, cache:BuildCache = None) -> dict:
+    """
+    Builds and benchmarks every variant. `variants` maps a name to `(source, flags)` where source is a
+    path to a C file or the source code itself (e.g. the output of `main.generate_program`).
+    Returns the results keyed by name along with information about the machine.
+    """
+    cache = cache or BuildCache()
+    executables = cache.build_many(list(variants.values()))
+
+    results = {}
+    for (name, (source, flags)), excecutable in zip(variants.items(), executables):
+        print(f"Benchmarking: {name}")
+        results[name] = {"flags": list(flags), "key": excecutable.name, **run_variant(excecutable, runs, warmups)}
+
+    return {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "machine": {"platform": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count(), "compiler": cache.version.splitlines()[0]},
+        "runs": runs,
+        "warmups": warmups,
+        "variants": results,
+    }
+
+def generated_variants(start:int, stop:int, moduli:list = (256,), scale:int = 10**6, flags:list = DEFAULT_FLAGS) -> dict:
+    """
+    Returns variants (see `benchmark_variants`) of the programs generated by `main.generate_program` for the range
+    `start` to `stop` (scaled by `scale`) with and without the tiered 64 bit `test()` for each modulus.
+    """
+    sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / "main"))
+    import main
+
+    variants = {}
+    for modulus in moduli:
+        for tiered in (False, True):
+            name = f"generated-{modulus}" + ("-tiered" if tiered else "")
+            variants[name] = (main.generate_program(start, stop, modulus=modulus, scale=scale, tiered=tiered), flags)
+    return variants
+
+def save_results(results:dict, path:pathlib.Path|str):
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=4)
+
+def load_results(path:pathlib.Path|str) -> dict:
+    with open(path, 'r') as file:
+        return json.load(file)
+
+def compare(results:dict, baseline:dict, threshold:float = 0.05) -> dict:
+    """
+    Compares the median wall time of every variant with the same variant in `baseline`.
+    A variant is a regression if its median is more than `threshold` (a fraction) slower than the baseline
+    and the lower end of its confidence interval is also slower than the baseline median.
+    Improvements are flagged the same way. Variants missing from the baseline are reported as new.
+    """
+    comparison = {}
+    for name, result in results["variants"].items():
+        if name not in baseline["variants"]:
+            comparison[name] = {"status": "new"}
+            continue
+
+        old = baseline["variants"][name]["wall"]
+        new = result["wall"]
+        ratio = new["median"]/old["median"]
+
+        if ratio > 1 + threshold and new["ci"][0] > old["median"]:
+            status = "regression"
+        elif ratio < 1 - threshold and new["ci"][1] < old["median"]:
+            status = "improvement"
+        else:
+            status = "unchanged"
+
+        comparison[name] = {"status": status, "ratio": ratio, "median": new["median"], "baseline": old["median"]}
+
+    return comparison
+
+def report(results:dict, comparison:dict = None):
+    """
+    Prints a table of the results (and the comparison with a baseline if given).
+    """
+    for name, result in results["variants"].items():
+        wall = result["wall"]
+        line = (f"{name}: median {wall['median']:.3f}s (95% CI {wall['ci'][0]:.3f}-{wall['ci'][1]:.3f}s, p10 {wall['p10']:.3f}s, p90 {wall['p90']:.3f}s), "
+                f"user {result['user']['median']:.3f}s, sys {result['sys']['median']:.3f}s, peak RSS {result['max_rss']} KiB")
+        if result["failures"]:
+            line += f", {result['failures']} failed runs"
+        if comparison and name in comparison:
+            compared = comparison[name]
+            line += f" [{compared['status']}" + (f" x{compared['ratio']:.3f}]" if "ratio" in compared else "]")
+        print(line)
 
 
 if __name__ == "__main__":
-    # gcc -O3 -fopenmp -m64 -funroll-loops -march=native main.c -o main
-    # exclude -march=native as we want our benchmarks to be for a more general executable.
-    flags = ["-O3", "-fopenmp", "-m64", "-funroll-loops"]
-
-    print("Benchmarking file: main.c")
-    result1 = benchmark("main.c", flags)
-    print("\n")
-    print("Benchmarking file: main2.c")
-    result2 = benchmark("main2.c", flags)
-    if len(result1) == 2:
-        print("\n")
-        print(f"Excecution time for main.c: {round(result1[0],3)}s")
-        print(f"Return code for main.c: {result1[1]}")
-    if len(result2) == 2:
-        print()
-        print(f"Excecution time for main2.c: {round(result2[0],3)}s")
-        print(f"Return code for main2.c: {result2[1]}")
-    if len(result1) + len(result2) == 4:
-        print()
-        print(("main2.c" if result1[0] > result2[0] else "main.c") + f" was faster by: {round(abs(result1[0] - result2[0]),3)}s")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Benchmark C verifier programs.")
+    parser.add_argument("files", nargs="*", default=["main.c", "main2.c"], help="C files to benchmark.")
+    parser.add_argument("--flags", nargs="*", default=DEFAULT_FLAGS, help="Compiler flags.")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--warmups", type=int, default=1)
+    parser.add_argument("--json", help="Write the results to this file.")
+    parser.add_argument("--baseline", help="Compare the results with this results file.")
+    parser.add_argument("--threshold", type=float, default=0.05, help="Slowdown (as a fraction) treated as a regression.")
+    parser.add_argument("--generate", type=int, nargs=2, metavar=("START", "STOP"), help="Benchmark generated programs (plain and tiered) for this range instead of the files.")
+    parser.add_argument("--moduli", type=int, nargs="*", default=[256], help="Moduli of the generated programs.")
+    parser.add_argument("--scale", type=int, default=10**6, help="Scale of the range of the generated programs.")
+    arguments = parser.parse_args()
+
+    if arguments.generate:
+        variants = generated_variants(*arguments.generate, arguments.moduli, arguments.scale, arguments.flags)
+    else:
+        variants = {file: (file, arguments.flags) for file in arguments.files}
+    results = benchmark_variants(variants, arguments.runs, arguments.warmups)
+    comparison = compare(results, load_results(arguments.baseline), arguments.threshold) if arguments.baseline else None
+
+    print()
+    report(results, comparison)
+
+    if arguments.json:
+        save_results(results, arguments.json)
+
+    if comparison and any(compared["status"] == "regression" for compared in comparison.values()):
+        sys.exit(1)
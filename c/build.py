@@ -0,0 +1,130 @@
+"""
+A content addressed build cache for C programs.
+
+Executables are stored under a hash of the source, the compiler flags and the compiler's version so each unique
+program is only compiled once. Compiling writes to a temporary file that is renamed into place which makes it safe
+for several processes to build (even the same program) at once.
+"""
+import hashlib, os, pathlib, subprocess, tempfile, time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CACHE = pathlib.Path(__file__).parent / ".build-cache"
+
+class BuildCache():
+    """
+    Compiles C sources with `compiler` and caches the executables in `directory`.
+    Executables are evicted oldest first (by last use) once there are more than `max_entries`
+    or once they haven't been used for `max_age` seconds.
+    """
+    def __init__(self, directory:pathlib.Path|str = DEFAULT_CACHE, compiler:str = "gcc", max_entries:int = None, max_age:float = None):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.compiler = compiler
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._version = None
+
+    @property
+    def version(self) -> str:
+        """
+        The output of `compiler --version`, which is part of every key.
+        """
+        if self._version is None:
+            self._version = subprocess.run([self.compiler, "--version"], capture_output=True, text=True, check=True).stdout
+        return self._version
+
+    @staticmethod
+    def read_source(source:str|pathlib.Path) -> str:
+        """
+        Returns the source code for `source` which is either the code itself or a path to a C file.
+        """
+        if isinstance(source, pathlib.Path) or (isinstance(source, str) and source.endswith(".c") and "\n" not in source):
+            with open(source, 'r') as file:
+                return file.read()
+        return source
+
+    def key(self, source:str|pathlib.Path, flags:list) -> str:
+        """
+        Returns the hash that identifies the executable built from `source` with `flags`.
+        """
+        digest = hashlib.sha256()
+        for part in (self.read_source(source), "\0".join(map(str, flags)), self.compiler, self.version):
+            digest.update(part.encode())
+            digest.update(b"\0\0")
+        return digest.hexdigest()
+
+    def path(self, source:str|pathlib.Path, flags:list) -> pathlib.Path:
+        """
+        Returns the path the executable for `source` and `flags` is (or would be) cached at.
+        """
+        return self.directory / self.key(source, flags)
+
+    def build(self, source:str|pathlib.Path, flags:list) -> pathlib.Path:
+        """
+        Returns the path of the executable built from `source` with `flags`, compiling it if it isn't cached.
+        Raises a `subprocess.CalledProcessError` (with the compiler's output) if compilation fails.
+        """
+        code = self.read_source(source)
+        executable = self.path(code, flags)
+
+        if executable.exists():
+            # record the use for eviction.
+            os.utime(executable)
+            return executable
+
+        # compile to temporary files so that concurrent builds never see a partial executable.
+        with tempfile.TemporaryDirectory(dir=self.directory) as temp:
+            temp = pathlib.Path(temp)
+            (temp / "program.c").write_text(code)
+            subprocess.run([self.compiler, *map(str, flags), str(temp / "program.c"), "-o", str(temp / "program")],
+                           capture_output=True, text=True, check=True)
+            os.replace(temp / "program", executable)
+
+        self.evict()
+        return executable
+
+    def build_many(self, builds:list[tuple[str|pathlib.Path, list]], workers:int = None) -> list[pathlib.Path]:
+        """
+        Builds every `(source, flags)` pair in `builds` with up to `workers` compilers running at once.
+        Returns the executables in the same order as `builds`. Each unique program is only compiled once.
+        """
+        unique = {}
+        keys = []
+        for source, flags in builds:
+            code = self.read_source(source)
+            key = self.key(code, flags)
+            unique.setdefault(key, (code, flags))
+            keys.append(key)
+
+        with ThreadPoolExecutor(workers or os.cpu_count()) as executor:
+            executables = dict(zip(unique, executor.map(lambda build: self.build(*build), unique.values())))
+
+        return [executables[key] for key in keys]
+
+    def evict(self):
+        """
+        Removes executables older than `max_age` and then the least recently used executables until there are at most `max_entries`.
+        """
+        entries = []
+        for path in self.directory.iterdir():
+            if path.is_file():
+                try:
+                    entries.append((path.stat().st_mtime, path))
+                except FileNotFoundError:
+                    continue
+
+        entries.sort()
+        now = time.time()
+        count = len(entries)
+        for used, path in entries:
+            if (self.max_age is not None and now - used > self.max_age) or (self.max_entries is not None and count > self.max_entries):
+                path.unlink(missing_ok=True)
+                count -= 1
+
+    def clear(self):
+        """
+        Removes every cached executable.
+        """
+        for path in self.directory.iterdir():
+            if path.is_file():
+                path.unlink(missing_ok=True)
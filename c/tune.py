@@ -0,0 +1,114 @@
+"""
+Autotuner for generated verifier programs.
+
+Sweeps compiler flag sets, sieve moduli, OpenMP schedules and thread counts for a range of numbers and reports the
+throughput (numbers verified per second) and parallel efficiency of each configuration. One program is built per
+flag set and modulus with `schedule(runtime)` so schedules and thread counts are swept through the OMP_SCHEDULE and
+OMP_NUM_THREADS environment variables without recompiling.
+"""
+import argparse, json, os, pathlib, sys
+import benchmark
+from build import BuildCache
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / "main"))
+import main
+
+DEFAULT_FLAG_SETS = {
+    "default": benchmark.DEFAULT_FLAGS,
+    "native": [*benchmark.DEFAULT_FLAGS, "-march=native"],
+}
+DEFAULT_SCHEDULES = ["static", "static,64", "dynamic,1", "dynamic,64", "guided"]
+DEFAULT_MODULI = [256, 2**12, 2**16]
+
+def default_threads() -> list[int]:
+    """
+    Returns 1 and every power of two up to the number of cores, plus the number of cores itself.
+    """
+    cpus = os.cpu_count() or 1
+    threads = {cpus}
+    count = 1
+    while count < cpus:
+        threads.add(count)
+        count *= 2
+    return sorted(threads)
+
+def numbers_tested(start:int, stop:int, scale:int, modulus:int) -> int:
+    """
+    Returns the number of integers covered by a program generated with these arguments (see main/template.c).
+    """
+    return (scale*stop//modulus - scale*start//modulus + 1)*modulus
+
+def tune(start:int, stop:int, scale:int = 10**6, flag_sets:dict = None, moduli:list = None, schedules:list = None,
+         threads:list = None, runs:int = 3, warmups:int = 1, cache:BuildCache = None) -> dict:
+    """
+    Benchmarks every combination of flag set, modulus, schedule and thread count on the numbers from `start`*`scale`
+    to `stop`*`scale` and returns every result along with the best configuration.
+    Efficiency is the throughput divided by the thread count times the single thread throughput of the same build and schedule.
+    """
+    flag_sets = flag_sets or DEFAULT_FLAG_SETS
+    moduli = moduli or DEFAULT_MODULI
+    schedules = schedules or DEFAULT_SCHEDULES
+    threads = threads or default_threads()
+    cache = cache or BuildCache()
+
+    builds = [(name, modulus) for name in flag_sets for modulus in moduli]
+    executables = cache.build_many([(main.generate_program(start, stop, modulus=modulus, scale=scale, schedule="runtime"), flag_sets[name])
+                                    for name, modulus in builds])
+
+    results = []
+    for (name, modulus), excecutable in zip(builds, executables):
+        numbers = numbers_tested(start, stop, scale, modulus)
+        for schedule in schedules:
+            single = None
+            for count in threads:
+                env = {**os.environ, "OMP_NUM_THREADS": str(count), "OMP_SCHEDULE": schedule}
+                wall = benchmark.run_variant(excecutable, runs, warmups, env=env)["wall"]
+                throughput = numbers/wall["median"]
+                if count == 1:
+                    single = throughput
+
+                result = {"flags": name, "modulus": modulus, "schedule": schedule, "threads": count,
+                          "median": wall["median"], "ci": wall["ci"], "throughput": throughput,
+                          "efficiency": throughput/(count*single) if single else None}
+                results.append(result)
+                print(format_result(result))
+
+    best = max(results, key=lambda result: result["throughput"])
+    return {
+        "start": start, "stop": stop, "scale": scale,
+        "results": results,
+        "best": {**best, "compile_flags": flag_sets[best["flags"]],
+                 "environment": {"OMP_NUM_THREADS": str(best["threads"]), "OMP_SCHEDULE": best["schedule"]}},
+    }
+
+def format_result(result:dict) -> str:
+    efficiency = f"{result['efficiency']*100:.1f}%" if result["efficiency"] is not None else "-"
+    return (f"{result['flags']:>10} {result['modulus']:>10} {result['schedule']:>12} {result['threads']:>4} threads: "
+            f"{result['throughput']:.4g} numbers/s, efficiency {efficiency}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune generated verifier programs for this machine.")
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--stop", type=int, default=100)
+    parser.add_argument("--scale", type=int, default=10**6, help="start and stop are multiplied by this.")
+    parser.add_argument("--moduli", type=int, nargs="*", default=DEFAULT_MODULI)
+    parser.add_argument("--schedules", nargs="*", default=DEFAULT_SCHEDULES)
+    parser.add_argument("--threads", type=int, nargs="*", default=None)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--warmups", type=int, default=1)
+    parser.add_argument("--json", help="Write every result to this file.")
+    arguments = parser.parse_args()
+
+    tuned = tune(arguments.start, arguments.stop, arguments.scale, moduli=arguments.moduli, schedules=arguments.schedules,
+                 threads=arguments.threads, runs=arguments.runs, warmups=arguments.warmups)
+
+    best = tuned["best"]
+    print()
+    print(f"Best: {format_result(best)}")
+    print(f"gcc {' '.join(best['compile_flags'])}, modulus {best['modulus']}, "
+          f"OMP_NUM_THREADS={best['threads']} OMP_SCHEDULE={best['schedule']}")
+
+    if arguments.json:
+        with open(arguments.json, 'w') as file:
+            json.dump(tuned, file, indent=4)
@@ -0,0 +1,213 @@
+"""
+A NumPy batch verifier for ranges of consecutive numbers.
+
+The numbers are split into blocks of `modulus` numbers, q`modulus` + r. Only the residues r of the forms that don't
+fall (see Calculation 1) need testing and each of them starts from its precomputed end form, exactly as in the
+generated C programs. The candidates of a batch of blocks are held in uint64 lanes that are stepped together with
+the shortcut step (3x + 1) / 2 for odd lanes and x / 2 for even lanes. Lanes retire once they fall below their
+starting number.
+
+Lanes that could overflow 64 bits (including candidates too large to start in a lane) are escalated to plain Python
+integers so the results are exact for any range. Numbers in the first block are also tested in Python as the
+precomputation only holds for q >= 1.
+"""
+from __future__ import annotations
+import time
+import numpy as np
+from main import Form
+
+# lanes above this can't take an odd step without overflowing: x + (x >> 1) + 1 < 2^64.
+LIMIT = ((2**64 - 1)//3)*2 - 2
+# lanes are compacted once this fraction of them has retired.
+COMPACT_FRACTION = 0.25
+# the default number of lanes stepped together which bounds the memory used (roughly 40 bytes per lane).
+DEFAULT_BATCH_LANES = 1 << 20
+
+def stopping_time(n:int, x:int = None, steps:int = 0) -> int:
+    """
+    Returns the stopping time of `n` (the number of steps until it is smaller than `n`) with Python integers.
+    If `x` is given the count continues from `x`, which n reaches after `steps` steps without falling.
+    """
+    x = n if x is None else x
+    while x >= n:
+        if x & 1:
+            x = (3*x + 1) >> 1
+            steps += 2
+        else:
+            x >>= 1
+            steps += 1
+    return steps
+
+class BatchVerifier():
+    """
+    Verifies ranges of numbers with the survivors of `modulus` (a power of two) stepped in uint64 lanes.
+    `batch_blocks` blocks of `modulus` numbers are stepped together (about `DEFAULT_BATCH_LANES` lanes if None).
+    Survivor tables above 2^16 are read from `cache` (a `store.TableCache`) if one is given.
+    """
+    def __init__(self, modulus:int = 256, batch_blocks:int = None, cache = None):
+        if modulus < 2 or modulus & (modulus - 1):
+            raise ValueError('modulus must be a power of two greater than 1.')
+
+        self.modulus = modulus
+
+        if modulus > 2**16:
+            import sieve
+            table = sieve.survivor_table(modulus, cache=cache)
+            start_b, end_a, end_b, steps = table.start_b.tolist(), table.end_a.tolist(), table.end_b.tolist(), table.steps.tolist()
+        else:
+            results = Form.compute_set(modulus, filter_fallen=True)
+            start_b = [result.start.b for result in results]
+            end_a = [result.end.a for result in results]
+            end_b = [result.end.b for result in results]
+            steps = [result.steps for result in results]
+
+        self.start_b = np.array(start_b, dtype=np.uint64)
+        self.end_a = np.array(end_a, dtype=np.uint64)
+        self.end_b = np.array(end_b, dtype=np.uint64)
+        self.steps = np.array(steps, dtype=np.int64)
+        # the largest q for which each end form still fits in a lane.
+        self.max_q = np.array([(2**64 - 1 - b)//a for a, b in zip(end_a, end_b)], dtype=np.uint64)
+        self.batch_blocks = batch_blocks or max(DEFAULT_BATCH_LANES//len(start_b), 1)
+
+    def __repr__(self):
+        return f'BatchVerifier(modulus={self.modulus}, survivors={len(self.start_b)})'
+
+    def _lanes(self, first:int, last:int, start:int, stop:int):
+        """
+        Returns the starting numbers, precomputed values and steps of the candidates in blocks `first` to `last` - 1
+        that lie in [start, stop). Candidates that don't fit in a lane are returned separately as Python integers.
+        """
+        q = np.arange(first, last, dtype=np.uint64).repeat(len(self.start_b))
+        survivor = np.tile(np.arange(len(self.start_b)), last - first)
+        modulus = np.uint64(self.modulus)
+
+        n = q*modulus + self.start_b[survivor]
+        keep = (n >= np.uint64(start)) & (n < np.uint64(stop)) if stop < 2**64 else n >= np.uint64(start)
+        fits = q <= self.max_q[survivor]
+
+        lanes = keep & fits
+        x = self.end_a[survivor[lanes]]*q[lanes] + self.end_b[survivor[lanes]]
+        escalated = [(int(n[i]), int(self.end_a[survivor[i]])*int(q[i]) + int(self.end_b[survivor[i]]), int(self.steps[survivor[i]]))
+                     for i in np.flatnonzero(keep & ~fits)]
+        return n[lanes], x, self.steps[survivor[lanes]], escalated
+
+    def _step(self, n:np.ndarray, x:np.ndarray, steps:np.ndarray):
+        """
+        Steps the lanes until they have all fallen or been escalated.
+        Returns the starting numbers and stopping times of the lanes and the escalated `(n, x, steps)` lanes.
+        """
+        done_n, done_steps, escalated = [], [], []
+        done = np.zeros(len(n), dtype=bool)
+        one = np.uint64(1)
+        while len(n):
+            odd = (x & one).astype(bool)
+
+            risky = odd & (x > np.uint64(LIMIT)) & ~done
+            if risky.any():
+                escalated.extend(zip(n[risky].tolist(), x[risky].tolist(), steps[risky].tolist()))
+                done |= risky
+
+            half = x >> one
+            x = np.where(odd, x + half + one, half)
+            steps += np.where(odd, 2, 1)
+
+            fallen = (x < n) & ~done
+            if fallen.any():
+                done_n.append(n[fallen])
+                done_steps.append(steps[fallen])
+                done |= fallen
+
+            if done.sum() > COMPACT_FRACTION*len(n):
+                keep = ~done
+                n, x, steps, done = n[keep], x[keep], steps[keep], done[keep]
+
+        return done_n, done_steps, escalated
+
+    def verify_batch(self, first:int, last:int, start:int = 0, stop:int = None) -> dict:
+        """
+        Tests the numbers in blocks `first` to `last` - 1 (limited to [start, stop)) and returns the batch's statistics.
+        Stopping times are only computed for the survivors of the sieve, the other numbers are known to fall.
+        """
+        began = time.perf_counter()
+        start = max(start, first*self.modulus, 2)
+        stop = last*self.modulus if stop is None else min(stop, last*self.modulus)
+
+        stopping_times = {}
+        python = 0
+        if first == 0:
+            # the precomputation only holds for q >= 1.
+            for n in range(start, min(stop, self.modulus)):
+                stopping_times[n] = stopping_time(n)
+            first = 1
+
+        lanes = 0
+        done_n, done_steps, escalated = [], [], []
+        if first < last and stop > first*self.modulus:
+            if (last*self.modulus) < 2**64:
+                n, x, steps, escalated = self._lanes(first, last, start, stop)
+                lanes = len(n)
+                done_n, done_steps, escalated_lanes = self._step(n, x, steps)
+                escalated += escalated_lanes
+            else:
+                # the numbers themselves don't fit in a lane.
+                escalated = [(n, self.end_a[i].item()*q + self.end_b[i].item(), self.steps[i].item())
+                             for q in range(first, last) for i, b in enumerate(self.start_b.tolist())
+                             if start <= (n := q*self.modulus + b) < stop]
+
+        for n, x, steps in escalated:
+            stopping_times[n] = stopping_time(n, x, steps)
+            python += 1
+
+        lane_n = np.concatenate(done_n) if done_n else np.zeros(0, dtype=np.uint64)
+        lane_steps = np.concatenate(done_steps) if done_steps else np.zeros(0, dtype=np.int64)
+        histogram = {steps: int(count) for steps, count in enumerate(np.bincount(lane_steps)) if count}
+        for steps in stopping_times.values():
+            histogram[steps] = histogram.get(steps, 0) + 1
+
+        max_steps, max_steps_n = 0, None
+        if len(lane_steps):
+            record = int(np.argmax(lane_steps))
+            max_steps, max_steps_n = int(lane_steps[record]), int(lane_n[record])
+        for n, steps in stopping_times.items():
+            if steps > max_steps or (steps == max_steps and n < max_steps_n):
+                max_steps, max_steps_n = steps, n
+
+        tested = len(lane_steps) + len(stopping_times)
+        elapsed = time.perf_counter() - began
+        numbers = max(stop - start, 0)
+        stats = {
+            "start": start, "stop": stop, "numbers": numbers, "tested": tested,
+            "lanes": lanes, "escalated": python, "elapsed": elapsed,
+            "throughput": numbers/elapsed if elapsed else 0.0,
+            "max_steps": max_steps, "max_steps_n": max_steps_n,
+            "mean_steps": (int(lane_steps.sum()) + sum(stopping_times.values()))/tested if tested else 0.0,
+            "histogram": dict(sorted(histogram.items())),
+        }
+        return stats
+
+    def iter_range(self, start:int, stop:int):
+        """
+        Yields the statistics of each batch of `batch_blocks` blocks covering the numbers from `start` to `stop` - 1.
+        """
+        for first in range(start//self.modulus, -(-stop//self.modulus), self.batch_blocks):
+            yield self.verify_batch(first, min(first + self.batch_blocks, -(-stop//self.modulus)), start, stop)
+
+    def verify_range(self, start:int, stop:int) -> dict:
+        """
+        Verifies every number from `start` to `stop` - 1 and returns the combined statistics and those of each batch.
+        """
+        summary = {"start": start, "stop": stop, "numbers": 0, "tested": 0, "lanes": 0, "escalated": 0, "elapsed": 0.0,
+                   "max_steps": 0, "max_steps_n": None, "histogram": {}, "batches": []}
+        for batch in self.iter_range(start, stop):
+            for key in ("numbers", "tested", "lanes", "escalated", "elapsed"):
+                summary[key] += batch[key]
+            if batch["max_steps"] > summary["max_steps"]:
+                summary["max_steps"], summary["max_steps_n"] = batch["max_steps"], batch["max_steps_n"]
+            for steps, count in batch["histogram"].items():
+                summary["histogram"][steps] = summary["histogram"].get(steps, 0) + count
+            summary["batches"].append({key: value for key, value in batch.items() if key != "histogram"})
+
+        tested = sum(summary["histogram"].values())
+        summary["mean_steps"] = sum(steps*count for steps, count in summary["histogram"].items())/tested if tested else 0.0
+        summary["throughput"] = summary["numbers"]/summary["elapsed"] if summary["elapsed"] else 0.0
+        return summary
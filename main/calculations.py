@@ -1,35 +1,205 @@
-import main
+"""
+Calculations that find the patterns and optimisations used by the verifier programs.
 
-print("-- Calculation 1: Forms 256n + k that don't fall and their precomputations. --")
-# obtain a list of all forms 256n + k where k ranges from 0 to 255, that don't fall below their starting value.
-# together, these forms cover all natural numbers that don't fall.
-results = main.Form.compute_set(256, filter_fallen=True)
-for count, result in enumerate(results, 1):
-    print(f"{str(count).rjust(3)}) {result.start} \t({result.steps})->\t {result.end}")
+    python calculations.py              Calculations 1 and 3 (and the heading of 2)
+    python calculations.py 2 --a 1-100  Calculation 2 for a = 1 to 100
+    python calculations.py 3 --k 24     Calculation 3 up to 2^24
 
-print("\nThis means that for every chunk of 256 numbers i.e. numbers of the form 256n + k where k ranges from 0 to 255, \
-there are only 19 values that don't fall below their starting value and these values can be precomputed 14 or 15 steps. 19/256 ≈ 7.42%")
+Nothing is computed on import. The independent parts of the selected calculations (each modulus of Calculations 2
+and 3) run in parallel worker processes and every line is printed as soon as it and the lines before it are ready.
+Results are cached in `DEFAULT_CACHE`, keyed by the calculation, its parameter and a hash of the code that computes
+them, so re-running a report only reads the cache. The survivor tables of powers of two above 2^16 are kept in a
+`store.TableCache` in `DEFAULT_TABLES` so larger moduli are refined from them rather than computed again.
+"""
+import argparse, hashlib, json, os, pathlib, sys
+from concurrent.futures import ProcessPoolExecutor
 
-print("\n\n\n")
-print("-- Calculation 2: Ratios for precomputation --")
-print("Commented out because it's 100 lines")
-#for i in range(1, 101):
-#    results = main.Form.compute_set(i, filter_fallen=True)
-#    print(f"{str(i).rjust(3)}) {len(results)*100/i}%")
+DEFAULT_CACHE = pathlib.Path(__file__).parent / ".calculations-cache" / "results.jsonl"
+DEFAULT_TABLES = DEFAULT_CACHE.parent / "tables"
+# results computed with different code are never reused.
+SOURCES = [pathlib.Path(__file__).parent / name for name in ("main.py", "sieve.py", "calculations.py")]
 
-print("\nSome very power-of-2-ish patterns going on here.")
+# region calculations
+# These run in the worker processes and return plain JSON values so they can be cached.
+def survivor_rows(modulus:int, tables = None) -> list[list[int]]:
+    """
+    Calculation 1: the start, steps and end of every form `modulus`n + k that doesn't fall below its starting value.
+    Powers of two above 2^16 come from the vectorized sieve (through `tables`, a `store.TableCache`, if given).
+    """
+    import main
+    if modulus > 2**16 and modulus & (modulus - 1) == 0:
+        import sieve
+        table = sieve.survivor_table(modulus, cache=tables)
+        return [[modulus, *row] for row in zip(table.start_b.tolist(), table.steps.tolist(), table.end_a.tolist(), table.end_b.tolist())]
+    return [[result.start.a, result.start.b, result.steps, result.end.a, result.end.b]
+            for result in main.Form.compute_set(modulus, filter_fallen=True)]
 
-print("\n\n\n")
-print("-- Calculation 3: Ratios for precomputation for powers of 2 --")
-for i in range(1, 19):
-    results = main.Form.compute_set(2**i, filter_fallen=True)
-    num=f"2^{i} = {2**i}"
-    print(f"{num.rjust(13)})\t{len(results)}/{2**i} = {len(results)*100/2**i}%")
+def survivor_count(a:int, tables = None) -> int:
+    """
+    Calculations 2 and 3: the number of forms `a`n + k that don't fall below their starting value.
+    Powers of two above 2^16 are refined from the survivors of 2^16 with the vectorized sieve, or from the largest
+    smaller table in `tables` (a `store.TableCache`) if one is given.
+    """
+    import main
+    if a > 2**16 and a & (a - 1) == 0:
+        import sieve
+        return len(sieve.survivor_table(a, cache=tables))
+    return len(main.Form.compute_set(a, filter_fallen=True))
 
-print("\nA076227")
+FUNCTIONS = {"survivor_rows": survivor_rows, "survivor_count": survivor_count}
 
-# 2^16 gives ~3%
+def _run(name:str, parameter:int, tables = None):
+    return FUNCTIONS[name](parameter, tables)
+# endregion
 
+class ResultCache():
+    """
+    An append only file of JSON lines `{"version", "key", "result"}`. Lines from other versions of the code are ignored.
+    """
+    def __init__(self, path:pathlib.Path|str = DEFAULT_CACHE, version:str = None):
+        self.path = pathlib.Path(path)
+        self.version = version or source_version()
+        self.results = {}
+        if self.path.exists():
+            with open(self.path, 'r') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a partial line from an interrupted run.
+                        continue
+                    if entry.get("version") == self.version:
+                        self.results[entry["key"]] = entry["result"]
+
+    def get(self, key:str):
+        return self.results.get(key)
+
+    def put(self, key:str, result):
+        self.results[key] = result
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'a') as file:
+            file.write(json.dumps({"version": self.version, "key": key, "result": result}) + "\n")
+
+    def clear(self):
+        self.results = {}
+        if self.path.exists():
+            os.remove(self.path)
+
+def source_version() -> str:
+    digest = hashlib.sha256()
+    for path in SOURCES:
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+class Report():
+    """
+    An ordered list of lines, some of which wait for a result. Results come from the cache or are computed in a
+    process pool that is only started if something is missing. `tables` (a `store.TableCache`) is given to the calculations.
+    """
+    def __init__(self, cache:ResultCache = None, processes:int = None, tables = None):
+        self.cache = cache
+        self.processes = processes
+        self.tables = tables
+        self.items = []
+        self._tasks = {}
+        self._values = {}
+        self._executor = None
+
+    def line(self, text:str = ""):
+        self.items.append((None, text))
+
+    def result(self, name:str, parameter:int, format):
+        """
+        Adds the lines `format(result)` (a string or list of strings) for the result of `name(parameter)`.
+        """
+        key = f"{name}:{parameter}"
+        if key not in self._tasks and (self.cache is None or self.cache.get(key) is None):
+            self._tasks[key] = (name, parameter)
+        self.items.append((key, format))
+
+    def _submit(self) -> dict:
+        if not self._tasks:
+            return {}
+        if self.processes == 1:
+            # computed lazily in order when there is no pool.
+            return {}
+        self._executor = ProcessPoolExecutor(self.processes)
+        return {key: self._executor.submit(_run, name, parameter, self.tables) for key, (name, parameter) in self._tasks.items()}
+
+    def _value(self, key:str, futures:dict):
+        if key in self._values:
+            return self._values[key]
+        if self.cache is not None and (cached := self.cache.get(key)) is not None:
+            return cached
+
+        name, parameter = self._tasks[key]
+        value = self._values[key] = futures[key].result() if key in futures else _run(name, parameter, self.tables)
+        if self.cache is not None:
+            self.cache.put(key, value)
+        return value
+
+    def run(self, file = None):
+        """
+        Prints every line, each as soon as it and the lines before it are ready.
+        """
+        file = file or sys.stdout
+        futures = self._submit()
+        try:
+            for key, text in self.items:
+                if key is not None:
+                    text = text(self._value(key, futures))
+                for line in ([text] if isinstance(text, str) else text):
+                    print(line, file=file, flush=True)
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+
+# region reports
+def calculation_1(report:Report, modulus:int = 256):
+    report.line(f"-- Calculation 1: Forms {modulus}n + k that don't fall and their precomputations. --")
+
+    def rows(rows:list) -> list[str]:
+        import main
+        # together, these forms cover all natural numbers that don't fall.
+        lines = [f"{str(count).rjust(3)}) {main.Form(start_a, start_b)} \t({steps})->\t {main.Form(end_a, end_b)}"
+                 for count, (start_a, start_b, steps, end_a, end_b) in enumerate(rows, 1)]
+        steps = [str(steps) for steps in sorted({row[2] for row in rows})]
+        lines.append(f"\nThis means that for every chunk of {modulus} numbers i.e. numbers of the form {modulus}n + k where k ranges "
+                     f"from 0 to {modulus - 1}, there are only {len(rows)} values that don't fall below their starting value and these "
+                     f"values can be precomputed {' or '.join([', '.join(steps[:-1]), steps[-1]] if len(steps) > 1 else steps)} steps. {len(rows)}/{modulus} ≈ {len(rows)*100/modulus:.2f}%")
+        return lines
+    report.result("survivor_rows", modulus, rows)
+
+def calculation_2(report:Report, values:list[int] = None):
+    """
+    Without `values` only the heading is printed (as in the default report) because it's 100 lines.
+    """
+    report.line("-- Calculation 2: Ratios for precomputation --")
+    if values is None:
+        report.line("Not run by default because it's 100 lines, run `python calculations.py 2`")
+    for a in values or []:
+        report.result("survivor_count", a, lambda count, a=a: f"{str(a).rjust(3)}) {count*100/a}%")
+    report.line("\nSome very power-of-2-ish patterns going on here.")
+
+def calculation_3(report:Report, k:int = 18):
+    report.line("-- Calculation 3: Ratios for precomputation for powers of 2 --")
+    for i in range(1, k + 1):
+        num = f"2^{i} = {2**i}"
+        report.result("survivor_count", 2**i, lambda count, i=i, num=num: f"{num.rjust(13)})\t{count}/{2**i} = {count*100/2**i}%")
+    report.line("\nA076227")
+
+def parse_values(text:str) -> list[int]:
+    """
+    Parses a list of values and inclusive ranges such as "1-100" or "3,5,7-9".
+    """
+    values = []
+    for part in text.split(","):
+        first, _, last = part.strip().partition("-")
+        values.extend(range(int(first), int(last or first) + 1))
+    if not values or min(values) < 1:
+        raise ValueError('values must be at least 1.')
+    return values
+# endregion
 
 ##NOTE: Interesting pattern #1
 # this shows that for every chunk of numbers of the form 256n + k where k ranges from 0 to 255
@@ -39,3 +209,44 @@ print("\nA076227")
     # print(f"{math.log(result.end.a, 3)}")
 
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calculations of the forms an + b that don't fall.")
+    parser.add_argument("calculations", type=int, nargs="*", help="The calculations to run (1, 2 or 3; 1 and 3 by default).")
+    parser.add_argument("--modulus", type=int, default=256, help="The modulus of Calculation 1.")
+    parser.add_argument("--a", type=parse_values, default=parse_values("1-100"), help='The values of a for Calculation 2, e.g. "1-100" or "3,5,7-9".')
+    parser.add_argument("--k", type=int, default=18, help="The largest power of 2 of Calculation 3.")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes (every core if not given, 1 to compute in this process).")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help="The cache file.")
+    parser.add_argument("--tables", default=DEFAULT_TABLES, help="The directory the survivor tables are cached in.")
+    parser.add_argument("--no-cache", action="store_true", help="Compute everything again without reading or writing the cache.")
+    parser.add_argument("--clear-cache", action="store_true")
+    arguments = parser.parse_args()
+    if invalid := [calculation for calculation in arguments.calculations if calculation not in (1, 2, 3)]:
+        parser.error(f"invalid calculations: {invalid} (choose from 1, 2, 3)")
+    # by default Calculation 2 is only a heading.
+    calculations = arguments.calculations or [1, 2, 3]
+
+    cache = tables = None
+    if not arguments.no_cache:
+        import store
+        cache = ResultCache(arguments.cache)
+        tables = store.TableCache(arguments.tables)
+        if arguments.clear_cache:
+            cache.clear()
+            tables.clear()
+
+    report = Report(cache, arguments.processes, tables)
+    for number, calculation in enumerate(sorted(set(calculations))):
+        if number:
+            report.line("\n\n\n")
+        if calculation == 1:
+            calculation_1(report, arguments.modulus)
+        elif calculation == 2:
+            calculation_2(report, arguments.a if arguments.calculations else None)
+        else:
+            calculation_3(report, arguments.k)
+
+    try:
+        report.run()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,140 @@
+"""
+A combined 2-adic and 3-adic sieve.
+
+`Form.compute_set(2^k, filter_fallen=True)` removes the residues of 2^k n + b that fall below their start. When
+numbers are scanned upwards there is a second reason to skip a number: if a smaller number reaches it then it has
+already been checked as part of that smaller number's sequence. Working backwards with the inverse steps
+
+    Form.HALVE.inverse()    = Form(2n)          the predecessor 2n, always valid
+    Form.SHORTCUT.inverse() = Form(2/3n - 1/3)  the predecessor (2n - 1) / 3, valid (and odd) when n = 2 mod 3
+
+every residue class 3^m n + r is searched for a chain of predecessors that is smaller than it. For example every
+n = 2 mod 3 has the smaller predecessor (2n - 1) / 3 and every n = 4 mod 9 has (8n - 5) / 9 (through 2n and then
+(4n - 1) / 3). These classes are removed modulo 3^m and combined with the 2^k survivors through the Chinese
+remainder theorem giving survivors modulo 2^k 3^m.
+
+Like the 2^k precomputation the exclusions only hold once n is at least the modulus (n >= 1 in 3^m n + r).
+"""
+from __future__ import annotations
+from main import Form, Transform
+
+DOUBLE = Form.HALVE.inverse()
+UNSHORTCUT = Form.SHORTCUT.inverse()
+
+# OEIS A076227: the number of surviving residues modulo 2^k for k = 0, 1, 2, ...
+A076227 = [1, 1, 1, 2, 3, 4, 8, 13, 19, 38, 64, 128, 226, 367, 734, 1295, 2114, 4228, 7495, 14990, 27328, 46611,
+           93222, 168807, 286581, 573162, 1037374, 1762293, 3524586, 6385637, 12771274, 23642078, 41347483]
+
+def predecessors(form:Form):
+    """
+    Yields the forms of the predecessors of every number in `form`: its double and, when every number
+    in the form is 2 mod 3, the odd predecessor (2n - 1) / 3.
+    """
+    yield DOUBLE(form)
+    if type(form.a) is int and type(form.b) is int and form.a % 3 == 0 and form.b % 3 == 2:
+        yield UNSHORTCUT(form)
+
+def _threes(a:int) -> int:
+    """
+    Returns the number of times 3 divides `a`.
+    """
+    count = 0
+    while a % 3 == 0:
+        a //= 3
+        count += 1
+    return count
+
+def smaller_predecessor(form:Form) -> Form|None:
+    """
+    Searches the predecessors of `form` for one that is smaller than it for every n >= 1 and returns it,
+    or None if there isn't one. Each (2n - 1) / 3 step divides a by 3 so there are only as many of them as
+    factors of 3 in a and a branch is abandoned once doubling has made a too big to come back below the form's.
+    """
+    stack = [form]
+    while stack:
+        node = stack.pop()
+        for predecessor in predecessors(node):
+            if predecessor.a <= form.a and predecessor(1) < form(1):
+                return predecessor
+
+            # the smallest a reachable from here uses every remaining (2n - 1) / 3 step.
+            threes = _threes(predecessor.a)
+            if threes and predecessor.a*2**threes <= form.a*3**threes:
+                stack.append(predecessor)
+
+    return None
+
+def excluded_residues(m:int) -> list[int]:
+    """
+    Returns the residues r modulo 3^m for which every number 3^m n + r (n >= 1) has a smaller predecessor.
+    """
+    modulus = 3**m
+    return [r for r in range(modulus) if smaller_predecessor(Form(modulus, r)) is not None]
+
+def survivor_residues(m:int) -> list[int]:
+    """
+    Returns the residues modulo 3^m that aren't excluded by a smaller predecessor.
+    """
+    excluded = set(excluded_residues(m))
+    return [r for r in range(3**m) if r not in excluded]
+
+def compute_set(k:int, m:int, cache = None) -> list[Transform]:
+    """
+    Returns the survivors modulo 2^k 3^m in the format of `Form.compute_set(2^k 3^m, filter_fallen=True)`:
+    one `Transform` per residue that neither falls (modulo 2^k) nor has a smaller predecessor (modulo 3^m),
+    in order of residue. Each end form is the 2^k survivor's end form applied to the finer form.
+    The 2^k survivors above 2^16 are read from `cache` (a `store.TableCache`) if one is given.
+    """
+    twos, threes = 2**k, 3**m
+    modulus = twos*threes
+    if twos <= 2**16:
+        survivors = Form.compute_set(twos, filter_fallen=True)
+    else:
+        import sieve
+        survivors = sieve.survivor_table(twos, cache=cache).transforms()
+    residues = survivor_residues(m)
+
+    # x = r2 mod 2^k and x = r3 mod 3^m  =>  x = r2 + 2^k ((r3 - r2) 2^-k mod 3^m).
+    inverse = pow(twos, -1, threes) if threes > 1 else 0
+    results = []
+    for survivor in survivors:
+        r2 = survivor.start.b
+        for r3 in residues:
+            c = (r3 - r2)*inverse % threes if threes > 1 else 0
+            # the numbers 2^k 3^m n + r2 + 2^k c are the 2^k form at 3^m n + c.
+            end = Form._new(survivor.end.a*threes, survivor.end.a*c + survivor.end.b)
+            results.append(Transform._new(Form._new(modulus, r2 + twos*c), end, None, survivor.steps, False))
+
+    results.sort(key=lambda result: result.start.b)
+    return results
+
+def density(k:int, m:int) -> float:
+    """
+    Returns the fraction of numbers that survive modulo 2^k 3^m.
+    """
+    twos = A076227[k] if k < len(A076227) else len(Form.compute_set(2**k, filter_fallen=True))
+    return twos*len(survivor_residues(m))/(2**k*3**m)
+
+def report(ks:list[int], ms:list[int]) -> list[dict]:
+    """
+    Returns the survivor densities modulo 2^k alone (with A076227 for comparison) and modulo 2^k 3^m for every k and m.
+    """
+    threes = {m: len(survivor_residues(m)) for m in ms}
+    rows = []
+    for k in ks:
+        twos = len(Form.compute_set(2**k, filter_fallen=True)) if k <= 16 else A076227[k]
+        row = {"k": k, "survivors": twos, "A076227": A076227[k] if k < len(A076227) else None, "density": twos/2**k}
+        for m in ms:
+            row[f"3^{m}"] = twos*threes[m]/(2**k*3**m)
+        rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    ms = [0, 1, 2, 3, 4, 5]
+    for m in ms:
+        print(f"3^{m}: {len(survivor_residues(m))}/{3**m} residues survive")
+    print()
+    for row in report(range(0, 17, 2), ms):
+        print(f"2^{row['k']:<2} {row['survivors']:>5} (A076227: {row['A076227']}) {row['density']*100:7.3f}%  " +
+              "  ".join(f"x3^{m}: {row[f'3^{m}']*100:6.3f}%" for m in ms[1:]))
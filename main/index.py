@@ -0,0 +1,207 @@
+"""
+A compact index of the survivors of a modulus 2^k.
+
+The residues r whose forms 2^k n + r don't fall (see `Form.compute_set(2^k, filter_fallen=True)`) are stored as a
+2^k bit bitset, so checking whether a number needs testing is one memory access. A rank table (the number of
+survivors before every block of `RANK_BITS` residues) maps a survivor's residue to its row in the dense table of
+precomputed end forms in constant time, and the dense table's residues are the select table.
+
+At 2^32 the bitset is 512 MiB and the rank table 64 MiB, far less than the billions of Python objects
+`compute_set` would need.
+"""
+from __future__ import annotations
+import numpy as np
+from main import Form, Transform
+
+# residues per rank table entry.
+RANK_BITS = 256
+RANK_BYTES = RANK_BITS//8
+# the number of set bits in every byte.
+POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+# residues whose bits are built together.
+BUILD_CHUNK = 1 << 24
+
+class SurvivorIndex():
+    """
+    Survivor bitset, rank table and dense end form table for the modulus 2^`k`.
+    Build one with `SurvivorIndex.build(k)` or from an existing survivor table with `from_table`.
+    """
+    def __init__(self, modulus:int, start_b:np.ndarray, end_a:np.ndarray, end_b:np.ndarray, steps:np.ndarray):
+        """
+        modulus: A power of two.
+        start_b, end_a, end_b, steps: The survivors' residues, end forms and steps.
+        """
+        if modulus < 2 or modulus & (modulus - 1):
+            raise ValueError('modulus must be a power of two greater than 1.')
+
+        self.modulus = modulus
+        self.mask = modulus - 1
+        self.start_b = np.asarray(start_b, dtype=np.int64)
+        self.end_a = np.asarray(end_a, dtype=np.int64)
+        self.end_b = np.asarray(end_b, dtype=np.int64)
+        self.steps = np.asarray(steps, dtype=np.int64)
+
+        # rows are ranked by residue so the table must be in residue order (refined tables aren't).
+        if len(self.start_b) and (np.diff(self.start_b) < 0).any():
+            order = np.argsort(self.start_b)
+            self.start_b, self.end_a, self.end_b, self.steps = (column[order] for column in (self.start_b, self.end_a, self.end_b, self.steps))
+
+        # the bitset is padded to a whole number of rank blocks.
+        size = -(-modulus//RANK_BITS)*RANK_BYTES
+        self.bits = np.zeros(size, dtype=np.uint8)
+        for chunk in range(0, modulus, BUILD_CHUNK):
+            lo, hi = np.searchsorted(self.start_b, [chunk, chunk + BUILD_CHUNK])
+            residues = self.start_b[lo:hi] - chunk
+            # each bit is set at most once so adding them is the same as or-ing them.
+            weights = np.left_shift(1, residues & 7).astype(np.uint8)
+            byte_counts = np.bincount(residues >> 3, weights=weights, minlength=min(BUILD_CHUNK, modulus)//8 or 1)
+            self.bits[chunk//8:chunk//8 + len(byte_counts)] = byte_counts.astype(np.uint8)
+
+        # rank[i] is the number of survivors below residue i*RANK_BITS.
+        counts = np.zeros(len(self.bits)//RANK_BYTES + 1, dtype=np.int64)
+        for start in range(0, len(self.bits), BUILD_CHUNK):
+            block = POPCOUNT[self.bits[start:start + BUILD_CHUNK]].reshape(-1, RANK_BYTES).sum(axis=1, dtype=np.int64)
+            counts[start//RANK_BYTES + 1:start//RANK_BYTES + 1 + len(block)] = block
+        self.rank_table = np.cumsum(counts).astype(np.uint32 if len(self.start_b) < 2**32 else np.uint64)
+
+    @classmethod
+    def from_table(cls, table) -> SurvivorIndex:
+        """
+        Builds the index from a `sieve.SieveTable` of the survivors (e.g. loaded from `store`).
+        """
+        table = table.survivors()
+        return cls(table.modulus, table.start_b, table.end_a, table.end_b, table.steps)
+
+    @classmethod
+    def build(cls, k:int, cache = None) -> SurvivorIndex:
+        """
+        Builds the index for the modulus 2^k. Moduli above 2^16 are refined from the survivors of 2^16 with the
+        vectorized sieve (which is much faster than sieving every residue), or taken from `cache` (a `store.TableCache`) if one is given
+        (see `sieve.survivor_table`).
+        """
+        modulus = 1 << k
+        if modulus <= 2**16:
+            results = Form.compute_set(modulus, filter_fallen=True)
+            return cls(modulus, [result.start.b for result in results], [result.end.a for result in results],
+                       [result.end.b for result in results], [result.steps for result in results])
+
+        import sieve
+        return cls.from_table(sieve.survivor_table(modulus, cache=cache))
+
+    def __len__(self):
+        return len(self.start_b)
+
+    def __repr__(self):
+        return f'SurvivorIndex(modulus={self.modulus}, survivors={len(self)})'
+
+    @property
+    def density(self) -> float:
+        return len(self)/self.modulus
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self.bits, self.rank_table, self.start_b, self.end_a, self.end_b, self.steps))
+
+    # region scalar lookups
+    def is_survivor(self, n:int) -> bool:
+        """
+        Returns True if n's residue survives, i.e. n doesn't fall within the precomputed steps and must be tested.
+        """
+        r = n & self.mask
+        return bool(self.bits[r >> 3] >> (r & 7) & 1)
+
+    def rank(self, r:int) -> int:
+        """
+        Returns the number of survivors with a residue smaller than `r`.
+        """
+        block = r//RANK_BITS
+        start = block*RANK_BYTES
+        below = int.from_bytes(self.bits[start:r >> 3].tobytes(), 'little').bit_count()
+        below += (int(self.bits[r >> 3]) & ((1 << (r & 7)) - 1)).bit_count()
+        return int(self.rank_table[block]) + below
+
+    def select(self, i:int) -> int:
+        """
+        Returns the residue of the `i`th survivor.
+        """
+        return int(self.start_b[i])
+
+    def transform(self, n:int) -> Transform|None:
+        """
+        Returns the precomputed `Transform` of the form containing n, or None if n's residue doesn't survive.
+        """
+        r = n & self.mask
+        if not self.is_survivor(r):
+            return None
+
+        i = self.rank(r)
+        return Transform._new(Form._new(self.modulus, r), Form._new(int(self.end_a[i]), int(self.end_b[i])), None, int(self.steps[i]), False)
+
+    def precompute(self, n:int) -> tuple[int, int]|None:
+        """
+        Returns the value n reaches after its precomputed steps and the number of steps, or None if n's residue doesn't survive.
+        Like the generated programs this relies on n being at least the modulus.
+        """
+        r = n & self.mask
+        if not self.is_survivor(r):
+            return None
+
+        i = self.rank(r)
+        return int(self.end_a[i])*(n >> (self.modulus.bit_length() - 1)) + int(self.end_b[i]), int(self.steps[i])
+    # endregion
+
+    # region vectorized lookups
+    def survives(self, values:np.ndarray) -> np.ndarray:
+        """
+        Returns a boolean mask of the values (non negative integers) whose residues survive.
+        """
+        r = np.asarray(values) & self.mask
+        return (self.bits[r >> 3] >> (r & 7).astype(np.uint8) & 1).astype(bool)
+
+    def filter(self, values:np.ndarray) -> np.ndarray:
+        """
+        Returns the values whose residues survive.
+        """
+        values = np.asarray(values)
+        return values[self.survives(values)]
+
+    def ranks(self, residues:np.ndarray) -> np.ndarray:
+        """
+        Vectorized `rank` of surviving residues, i.e. their rows in the dense table.
+        """
+        residues = np.asarray(residues, dtype=np.int64)
+        block = residues//RANK_BITS
+        offsets = np.arange(RANK_BYTES)
+        # the bytes of each residue's rank block that come before the residue's byte.
+        byte_index = block[:, None]*RANK_BYTES + offsets
+        before = offsets < (residues[:, None] >> 3) - block[:, None]*RANK_BYTES
+        below = (POPCOUNT[self.bits[byte_index]]*before).sum(axis=1)
+        partial = self.bits[residues >> 3] & ((1 << (residues & 7)) - 1).astype(np.uint8)
+        return self.rank_table[block].astype(np.int64) + below + POPCOUNT[partial]
+
+    def iter_range(self, start:int, stop:int, max_size:int = 1 << 20):
+        """
+        Yields arrays (of up to about `max_size` values) of the numbers from `start` to `stop` - 1 whose residues survive.
+        The values are int64 so the range must lie within 0 and 2^63.
+        """
+        if start < 0 or stop > 2**63:
+            raise ValueError(f'The range: {start} to {stop} must lie within 0 and 2^63.')
+        if len(self) == 0:
+            return
+
+        blocks = max(max_size//len(self), 1)
+        shift = self.modulus.bit_length() - 1
+        for first in range(start >> shift, ((stop - 1) >> shift) + 1, blocks):
+            q = np.arange(first, min(first + blocks, ((stop - 1) >> shift) + 1), dtype=np.int64)
+            values = ((q[:, None] << shift) + self.start_b).ravel()
+            if values[0] < start or values[-1] >= stop:
+                values = values[(values >= start) & (values < stop)]
+            if len(values):
+                yield values
+
+    def filter_range(self, start:int, stop:int) -> np.ndarray:
+        """
+        Returns the numbers from `start` to `stop` - 1 whose residues survive (see `iter_range` for large ranges).
+        """
+        return np.concatenate(list(self.iter_range(start, stop)) or [np.zeros(0, dtype=np.int64)])
+    # endregion
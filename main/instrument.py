@@ -0,0 +1,301 @@
+"""
+Opt-in instrumentation for `Form` stepping and sieve generation.
+
+Nothing here costs anything until `enable()` is called. Enabling swaps instrumented wrappers in for the methods being
+measured and `disable()` puts the original methods back, so code that runs with instrumentation disabled runs
+exactly the code it always has. For example:
+
+    import instrument
+    with instrument.enabled() as stats:
+        Form.compute_set(2**12, filter_fallen=True)
+    stats.report()
+    stats.save_json("stats.json")
+    stats.save_profile("stats.prof")  # python -m pstats stats.prof
+
+While enabled the following are recorded:
+- counters of steps, `Form` allocations and fall computations.
+- phases: the time spent in (and the counters accumulated by) each call of `compute_set`, `refine_set`, `tree`,
+  `Transform.refine` and the sieve's table functions, plus any `phase(name)` blocks of your own.
+  Nested phases are tracked so both inclusive and exclusive (own) times are known.
+- histograms of the stopping times of the forms that fall, per residue class of b modulo `histogram_modulus`.
+"""
+from __future__ import annotations
+import contextlib, json, marshal, sys, time
+from main import Form, Transform, TreeExplorer
+
+COUNTERS = ('steps', 'forms', 'falls')
+
+class Phase():
+    """
+    The accumulated calls, times and counters of one phase.
+    """
+    __slots__ = ('name', 'calls', 'total', 'own', 'counters', 'callers')
+
+    def __init__(self, name:str):
+        self.name = name
+        self.calls = 0
+        self.total = 0.0
+        self.own = 0.0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        # the number of calls and inclusive time of this phase by the phase it was called from.
+        self.callers = {}
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls, "total": self.total, "own": self.own,
+            "per_call": {counter: value/self.calls for counter, value in self.counters.items()} if self.calls else {},
+            "counters": dict(self.counters),
+            "callers": {caller: {"calls": calls, "total": total} for caller, (calls, total) in self.callers.items()},
+        }
+
+class Stats():
+    """
+    Everything recorded while instrumentation is enabled.
+    """
+    def __init__(self, histogram_modulus:int = 16):
+        self.histogram_modulus = histogram_modulus
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.phases = {}
+        self.histograms = {}
+        # frames of (name, start time, counters at the start, time spent in nested phases).
+        self._stack = []
+
+    # region recording
+    def enter(self, name:str):
+        self._stack.append([name, time.perf_counter(), dict(self.counters), 0.0])
+
+    def exit(self):
+        name, started, counters, nested = self._stack.pop()
+        elapsed = time.perf_counter() - started
+
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = Phase(name)
+        phase.calls += 1
+        phase.total += elapsed
+        phase.own += elapsed - nested
+        for counter, value in self.counters.items():
+            phase.counters[counter] += value - counters[counter]
+
+        caller = self._stack[-1][0] if self._stack else None
+        calls, total = phase.callers.get(caller, (0, 0.0))
+        phase.callers[caller] = (calls + 1, total + elapsed)
+
+        if self._stack:
+            self._stack[-1][3] += elapsed
+
+    def record_fall(self, b:int, steps:int, count:int = 1):
+        """
+        Adds `count` forms with residue b (modulo `histogram_modulus`) that fell after `steps` steps to the histograms.
+        """
+        histogram = self.histograms.setdefault(b % self.histogram_modulus, {})
+        histogram[steps] = histogram.get(steps, 0) + count
+    # endregion
+
+    # region export
+    def to_dict(self) -> dict:
+        return {
+            "counters": dict(self.counters),
+            "phases": {name: phase.to_dict() for name, phase in self.phases.items()},
+            "histogram_modulus": self.histogram_modulus,
+            "histograms": {str(residue): dict(sorted(histogram.items())) for residue, histogram in sorted(self.histograms.items())},
+        }
+
+    def save_json(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=4)
+
+    def profile_stats(self) -> dict:
+        """
+        Returns the phases in the format of `pstats` (the `stats` attribute of `cProfile.Profile`) with one
+        pseudo function per phase. Call counts are the phase calls and the callers are the enclosing phases.
+        """
+        def key(name:str):
+            return ("instrument", 0, name)
+
+        stats = {}
+        for name, phase in self.phases.items():
+            callers = {key(caller): (calls, calls, total, total) for caller, (calls, total) in phase.callers.items() if caller is not None}
+            stats[key(name)] = (phase.calls, phase.calls, phase.own, phase.total, callers)
+        return stats
+
+    def save_profile(self, path):
+        """
+        Writes the phases to `path` in the format written by `cProfile` so they can be read with `pstats.Stats(path)`.
+        """
+        with open(path, 'wb') as file:
+            marshal.dump(self.profile_stats(), file)
+
+    def report(self, file = None):
+        """
+        Prints the counters, a table of the phases and a summary of the histograms.
+        """
+        file = file or sys.stdout
+        print("Counters: " + ", ".join(f"{counter}={value}" for counter, value in self.counters.items()), file=file)
+        for name, phase in sorted(self.phases.items(), key=lambda item: -item[1].total):
+            per_call = ", ".join(f"{counter}={value/phase.calls:.1f}" for counter, value in phase.counters.items())
+            print(f"{name}: {phase.calls} calls, {phase.total:.4f}s total, {phase.own:.4f}s own, per call: {per_call}", file=file)
+        for residue, histogram in sorted(self.histograms.items()):
+            count = sum(histogram.values())
+            mean = sum(steps*value for steps, value in histogram.items())/count
+            print(f"b = {residue} mod {self.histogram_modulus}: {count} falls, mean {mean:.2f} steps, max {max(histogram)} steps", file=file)
+    # endregion
+
+# the active stats (None when disabled) and the originals of the wrapped attributes.
+stats:Stats|None = None
+_originals = {}
+
+@contextlib.contextmanager
+def phase(name:str):
+    """
+    Times the block as the phase `name` when instrumentation is enabled and does nothing otherwise.
+    """
+    if stats is None:
+        yield
+        return
+
+    stats.enter(name)
+    try:
+        yield
+    finally:
+        stats.exit()
+
+# region wrappers
+def _timed(name:str, function):
+    def wrapper(*args, **kwargs):
+        stats.enter(name)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stats.exit()
+    wrapper.__wrapped__ = function
+    return wrapper
+
+def _counting_new(function):
+    def wrapper(cls, a, b):
+        stats.counters['forms'] += 1
+        return function(cls, a, b)
+    return wrapper
+
+def _counting_init(function):
+    def wrapper(self, a, b):
+        stats.counters['forms'] += 1
+        return function(self, a, b)
+    return wrapper
+
+def _counting_fall(function):
+    def wrapper(self, form, steps):
+        result = function(self, form, steps)
+        stats.counters['steps'] += result.steps - steps
+        if result.has_fallen:
+            stats.counters['falls'] += 1
+            if type(result.start.b) is int:
+                stats.record_fall(result.start.b, result.steps)
+        return result
+    return wrapper
+
+def _counting_full(function):
+    def wrapper(self, form, steps):
+        result = function(self, form, steps)
+        stats.counters['steps'] += result.steps - steps
+        return result
+    return wrapper
+
+def _counting_step_forms(function):
+    def wrapper(modulus, start_b, end_a, end_b, steps, full = False):
+        before = int(steps.sum())
+        columns = function(modulus, start_b, end_a, end_b, steps, full)
+        end_steps, has_fallen = columns[2], columns[3]
+        stats.counters['steps'] += int(end_steps.sum()) - before
+        if not full:
+            import numpy as np
+            fallen = has_fallen.astype(bool)
+            stats.counters['falls'] += int(fallen.sum())
+            residues = start_b[fallen] % stats.histogram_modulus
+            for residue in np.unique(residues).tolist():
+                counts = np.bincount(end_steps[fallen][residues == residue])
+                for count_steps in np.flatnonzero(counts).tolist():
+                    stats.record_fall(residue, count_steps, int(counts[count_steps]))
+        return columns
+    return wrapper
+
+def _patch(owner, name:str, wrap):
+    """
+    Replaces `owner.name` with `wrap(original)`, keeping classmethods and staticmethods as they are.
+    """
+    original = owner.__dict__[name]
+    _originals[(owner, name)] = original
+    if isinstance(original, classmethod):
+        replacement = classmethod(wrap(original.__func__))
+    elif isinstance(original, staticmethod):
+        replacement = staticmethod(wrap(original.__func__))
+    else:
+        replacement = wrap(original)
+    setattr(owner, name, replacement)
+
+def _targets() -> list:
+    """
+    Returns `(owner, name, wrap)` for every attribute that is instrumented.
+    """
+    targets = [
+        (Form, '__init__', _counting_init),
+        (Form, '_new', _counting_new),
+        (Form, '_compute_fall_from', _counting_fall),
+        (Form, '_compute_full_from', _counting_full),
+        (Form, 'compute_set', lambda function: _timed('Form.compute_set', function)),
+        (Form, 'refine_set', lambda function: _timed('Form.refine_set', function)),
+        (Form, 'tree', lambda function: _timed('Form.tree', function)),
+        (Transform, 'refine', lambda function: _timed('Transform.refine', function)),
+        (TreeExplorer, 'nested', lambda function: _timed('TreeExplorer.nested', function)),
+    ]
+
+    try:
+        import sieve
+    except ImportError:
+        # NumPy isn't installed so the sieve can't be used (or measured).
+        return targets
+
+    targets += [
+        (sieve, 'step_forms', _counting_step_forms),
+        (sieve, 'compute_table', lambda function: _timed('sieve.compute_table', function)),
+        (sieve, 'compute_range', lambda function: _timed('sieve.compute_range', function)),
+        (sieve, 'refine_table', lambda function: _timed('sieve.refine_table', function)),
+    ]
+    return targets
+# endregion
+
+def enable(histogram_modulus:int = 16) -> Stats:
+    """
+    Starts recording into a new `Stats` which is returned. Does nothing but return the current stats if already enabled.
+    """
+    global stats
+    if stats is not None:
+        return stats
+
+    stats = Stats(histogram_modulus)
+    for owner, name, wrap in _targets():
+        _patch(owner, name, wrap)
+    return stats
+
+def disable() -> Stats|None:
+    """
+    Restores the original methods and returns the stats that were recorded.
+    """
+    global stats
+    for (owner, name), original in _originals.items():
+        setattr(owner, name, original)
+    _originals.clear()
+
+    recorded, stats = stats, None
+    return recorded
+
+@contextlib.contextmanager
+def enabled(histogram_modulus:int = 16):
+    """
+    Enables instrumentation for the duration of the block and yields the `Stats` being recorded.
+    """
+    recorded = enable(histogram_modulus)
+    try:
+        yield recorded
+    finally:
+        disable()
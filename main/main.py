@@ -1,5 +1,7 @@
 from __future__ import annotations
-import copy, math, pathlib
+import math, pathlib
+from collections import OrderedDict
+from fractions import Fraction
 
 class Transform():
     """
@@ -7,14 +9,18 @@ class Transform():
     NOTE: This class serves to store transformation information but
     does not validate the data it holds. The is_valid method can be used
     to check if the data is valid.
+    Transform objects are immutable.
     """
+    __slots__ = ('start', 'end', '_transform', 'steps', 'has_fallen', 'min_value')
+
     def __init__(self, start:Form, end:Form, transform:Form = None, steps:int = None, has_fallen:bool = None, min_value:int = None):
         """
         start: The starting form.
         end: The ending form.
+        transform: The form t such that t(start) == end. If None it is derived from start and end when first used.
         steps: The number of steps it took to reach the ending form.
         has_fallen: True if the form has fallen below the starting form, False if it has not, None if it is unknown.
-        min_value: The minimum value at which the form has fallen below the starting form. If None then the fall is unconditional
+        min_value: The smallest value of n at which the form has fallen below the starting form. If None then the fall is unconditional
         and occurs for all values of n > 0.
         """
         assert isinstance(start, Form), "start must be of type Form."
@@ -24,12 +30,73 @@ class Transform():
         assert has_fallen is None or isinstance(has_fallen, bool), "has_fallen must be of type bool."
         assert min_value  is None or isinstance(min_value, int), "min_value must be of type int."
 
-        self.start = start
-        self.end = end
-        self.transform = transform
-        self.steps = steps
-        self.has_fallen = has_fallen
-        self.min_value = min_value
+        setattr = object.__setattr__
+        setattr(self, 'start', start)
+        setattr(self, 'end', end)
+        setattr(self, '_transform', transform)
+        setattr(self, 'steps', steps)
+        setattr(self, 'has_fallen', has_fallen)
+        setattr(self, 'min_value', min_value)
+
+    @classmethod
+    def _new(cls, start:Form, end:Form, transform:Form = None, steps:int = None, has_fallen:bool = None, min_value:int = None):
+        """
+        Fast internal constructor that skips validation. Only use this on hot paths where the arguments are known to be valid.
+        """
+        self = object.__new__(cls)
+        setattr = object.__setattr__
+        setattr(self, 'start', start)
+        setattr(self, 'end', end)
+        setattr(self, '_transform', transform)
+        setattr(self, 'steps', steps)
+        setattr(self, 'has_fallen', has_fallen)
+        setattr(self, 'min_value', min_value)
+        return self
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Transform objects are immutable.')
+
+    __delattr__ = __setattr__
+
+    @property
+    def transform(self) -> Form:
+        """
+        The form t such that t(start) == end.
+        """
+        if self._transform is None:
+            # the transform is fully determined by the start and end forms so it is only derived when it is needed.
+            object.__setattr__(self, '_transform', self.start._transform_to(self.end))
+        return self._transform
+
+    def __reduce__(self):
+        return (Transform._new, (self.start, self.end, self._transform, self.steps, self.has_fallen, self.min_value))
+
+    def _pack(self) -> tuple:
+        """
+        Returns the Transform as a compact tuple of numbers for sending between processes.
+        The transform itself is not included as it is determined by the start and end forms.
+        """
+        return (self.start.a, self.start.b, self.end.a, self.end.b, self.steps, self.has_fallen, self.min_value)
+
+    @staticmethod
+    def _unpack(packed:tuple) -> Transform:
+        """
+        Rebuilds a Transform packed by `_pack`.
+        """
+        start_a, start_b, end_a, end_b, steps, has_fallen, min_value = packed
+        start, end = Form._new(start_a, start_b), Form._new(end_a, end_b)
+        return Transform._new(start, end, None, steps, has_fallen, min_value)
+
+    def __eq__(self, other:Transform):
+        if not isinstance(other, Transform):
+            return NotImplemented
+
+        # the transform is left out as it is determined by the start and end forms.
+        return (self.start, self.end, self.steps, self.has_fallen, self.min_value) == \
+               (other.start, other.end, other.steps, other.has_fallen, other.min_value)
+
+    def __hash__(self):
+        return hash((self.start, self.end, self.steps, self.has_fallen, self.min_value))
 
     def __repr__(self):
         # TODO: The condition means it returns an empty string.
@@ -39,6 +106,29 @@ class Transform():
 
     __str__ = __repr__
 
+    def refine(self, parts:int = 2) -> tuple[Transform]:
+        """
+        Splits the start form into `parts` parts (see `Form.split_form`) and computes each of them.
+        Each part reaches the end form split the same way after the same number of steps so the computation
+        resumes from there rather than from the start of the part.
+        The parts are computed with compute_full if self came from compute_full (has_fallen is None) and
+        with compute_fall otherwise. Parts of a form that has fallen fall at the same step.
+        """
+        start, end = self.start, self.end
+        results = []
+        for i in range(parts):
+            part = Form._new(parts*start.a, start.b + i*start.a)
+            form = Form._new(parts*end.a, end.b + i*end.a)
+
+            if self.has_fallen is None:
+                results.append(part._compute_full_from(form, self.steps))
+            elif self.has_fallen:
+                results.append(part._fallen(form, self.steps))
+            else:
+                results.append(part._compute_fall_from(form, self.steps))
+
+        return tuple(results)
+
     def is_valid(self):
         """
         Returns True if the data stored in the Transform object is valid, False otherwise.
@@ -60,10 +150,17 @@ class Transform():
             if self.min_value != self.start.compute_fall().min_value:
                 return False
 
+        return True
+
 class Form():
     """
     Represents all numbers of the linear form an + b
+    `a` and `b` are held exactly as `int`s (or `Fraction`s where needed, e.g. for transforms
+    that halve) so that results stay correct far beyond the 2^53 limit of floats.
+    Form objects are immutable and hashable so they can be safely shared, interned or cached.
     """
+    __slots__ = ('a', 'b')
+
     # We can't define it yet but we can type it.
     # BASIS = Form(1, 0)
     BASIS: 'Form'
@@ -71,33 +168,74 @@ class Form():
     ODD: 'Form'
     # EVEN = Form(2, 0)
     EVEN: 'Form'
+    # HALVE = Form(1/2, 0)
+    HALVE: 'Form'
+    # TRIPLE = Form(3, 1)
+    TRIPLE: 'Form'
+    # SHORTCUT = Form(3/2, 1/2)
+    SHORTCUT: 'Form'
+
+    def __init__(self, a:int|Fraction|float|str|bytes, b:int|Fraction|float|str|bytes):
+        """
+        Creates the form an + b.
+        `a` and `b` are converted to exact values. Integral values are stored as `int`
+        and anything else as a `Fraction`. `a` must be greater than 0.
+        `b` can be negative so that forms can also model transforms such as inverses e.g. (2n - 1) / 3.
+        """
+        a = Form._exact(a)
+        if not a > 0:
+            raise ValueError('Value a must be greater than 0.')
+
+        b = Form._exact(b)
+
+        object.__setattr__(self, 'a', a)
+        object.__setattr__(self, 'b', b)
 
-    def __init__(self, a:int|float|str|bytes, b:int|float|str|bytes):
+    @staticmethod
+    def _exact(value:int|Fraction|float|str|bytes) -> int|Fraction:
         """
-        doc string 123
+        Converts `value` to an exact `int` or `Fraction`. Fractions with a denominator of 1 become `int`s.
         """
-        try:
-            a = float(a)
-            assert a > 0
-        except ValueError:
-            raise ValueError(f'Failed to convert value: {a} of type: {type(a)} to type float.')
-        except AssertionError:
-            raise ValueError('Value a must be greater than 0.')
+        if type(value) is int:
+            return value
 
-        if not math.isfinite(a):
-            raise ValueError('Value a must be finite.')
+        if isinstance(value, bytes):
+            value = value.decode()
 
         try:
-            b = float(b)
-            assert not b < 0 # b can be 0 but no smaller.
-        except ValueError:
-            raise ValueError(f'Failed to convert value: {b} of type: {type(b)} to type float.')
+            if isinstance(value, float) and not math.isfinite(value):
+                raise ValueError
+            value = Fraction(value)
+        except (ValueError, TypeError, ZeroDivisionError):
+            raise ValueError(f'Failed to convert value: {value} of type: {type(value)} to an exact number.')
+
+        return value.numerator if value.denominator == 1 else value
+
+    @classmethod
+    def _new(cls, a:int|Fraction, b:int|Fraction):
+        """
+        Fast internal constructor that skips conversion and validation.
+        Only use this on hot paths where `a` and `b` are known to be exact and valid.
+        """
+        self = object.__new__(cls)
+        object.__setattr__(self, 'a', a)
+        object.__setattr__(self, 'b', b)
+        return self
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Form objects are immutable.')
+
+    __delattr__ = __setattr__
 
-        if not math.isfinite(b):
-            raise ValueError('Value b must be finite.')
+    # Forms are immutable so copies can share the original.
+    def __copy__(self):
+        return self
 
-        self.a = float(a)
-        self.b = float(b)
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (Form._new, (self.a, self.b))
 
     #region operators
     # +
@@ -173,27 +311,14 @@ class Form():
     def __lt__(self, other:'Form'):
         """
         Return True if self is smaller than other for large enough values of n, otherwise return False.
-        Also returns the point at which the forms intersect.
+        Use `intersect` to find the point at which the forms cross.
         """
         if not isinstance(other, Form):
             raise ValueError(f'Cannot compare Form with type: {type(other)}.')
 
-        if self.a == other.a:
-            # if a is the same, then the form with the smaller b is smaller.
-            return self.b < other.b
-        else:
-            # if a is different, then the forms (modeled as lines) will intersect at some point.
-            # an + b = xn + y
-            # an - xn = n(a - x) = y - b
-            # n = (y - b) / (a - x) = (b - y) / (x - a)
-
-            # This is the x value of the intersection point.
-            point = (other.b - self.b) / (self.a - other.a)
-
-            # check a point beyond the intersection point.
-            check = (point + 1)*self.a + self.b < (point + 1)*other.a + other.b
-
-            return check, point
+        # for large enough n the form with the smaller a is smaller.
+        # if a is the same, then the form with the smaller b is smaller.
+        return self.a < other.a or (self.a == other.a and self.b < other.b)
 
     # <=
     __le__ = lambda self, other: self < other or self == other
@@ -202,30 +327,33 @@ class Form():
     def __gt__(self, other:'Form'):
         """
         Return True if self is bigger than other for large enough values of n, otherwise return False.
-        Also returns the point at which the forms intersect.
+        Use `intersect` to find the point at which the forms cross.
         """
         if not isinstance(other, Form):
             raise ValueError(f'Cannot compare Form with type: {type(other)}.')
 
-        if self.a == other.a:
-            # if a is the same, then the form with the smaller b is smaller.
-            return self.b > other.b
-        else:
-            # if a is different, then the forms (modeled as lines) will intersect at some point.
-            # an + b = xn + y
-            # an - xn = n(a - x) = y - b
-            # n = (y - b) / (a - x) = (b - y) / (x - a)
+        return self.a > other.a or (self.a == other.a and self.b > other.b)
 
-            # This is the x value of the intersection point.
-            point = (other.b - self.b) / (self.a - other.a)
+    # >=
+    __ge__ = lambda self, other: self > other or self == other
 
-            # check a point beyond the intersection point.
-            check = (point + 1)*self.a + self.b > (point + 1)*other.a + other.b
+    def intersect(self, other:'Form') -> int|Fraction|None:
+        """
+        Returns the exact value of n at which self and other intersect.
+        Returns None if the forms are parallel (a is the same).
+        """
+        if not isinstance(other, Form):
+            raise ValueError(f'Cannot compare Form with type: {type(other)}.')
 
-            return check, point
+        if self.a == other.a:
+            return None
 
-    # >=
-    __ge__ = lambda self, other: self > other or self == other
+        # the forms (modeled as lines) will intersect at some point.
+        # an + b = xn + y
+        # an - xn = n(a - x) = y - b
+        # n = (y - b) / (a - x)
+        point = Fraction(other.b - self.b) / (self.a - other.a)
+        return point.numerator if point.denominator == 1 else point
 
     #endregion
     #region misc
@@ -235,11 +363,10 @@ class Form():
 
     # repr
     def __repr__(self):
-        a = int(self.a) if self.a.is_integer() else self.a
-        b = int(self.b) if self.b.is_integer() else self.b
+        a, b = self.a, self.b
 
-        # Form(an + b) or Form(an)
-        return f'Form({a}n{" + "+str(b) if b > 0 else ""})'
+        # Form(an + b), Form(an - b) or Form(an)
+        return f'Form({a}n{" + "+str(b) if b > 0 else " - "+str(-b) if b < 0 else ""})'
 
         # Form(a, b) as an alternative format
         # return f'Form({a}, {b})'
@@ -253,13 +380,26 @@ class Form():
         """
         Returns the value of the form at n.
         """
-        if type(n) in (int, float):
-            n = float(n)
+        if type(n) in (int, float, Fraction):
             return self.a * n + self.b
         elif isinstance(n, Form):
             return Form(self.a * n.a, self.a * n.b + self.b)
         else:
             raise ValueError(f'Cannot call Form with type: {type(n)}.')
+
+    def _transform_to(self, other:'Form'):
+        """
+        Returns the transform t such that t(self) == other, skipping validation.
+        t.a * self.a = other.a  =>  t.a = other.a / self.a
+        t.a * self.b + t.b = other.b  =>  t.b = other.b - t.a * self.b
+        """
+        if other.a == self.a:
+            # this avoids creating a Fraction for the common case of an identity scale.
+            return Form._new(1, other.b - self.b)
+
+        a = Fraction(other.a) / self.a
+        b = other.b - a * self.b
+        return Form._new(a.numerator if a.denominator == 1 else a, b.numerator if type(b) is Fraction and b.denominator == 1 else b)
     #endregion
 
     def parity(self):
@@ -299,17 +439,21 @@ class Form():
         else:
             return None # if a is odd then the parity of the form cannot be determined.
 
-    def step(self, shortcut = False): # TODO: add shortcut form
+    def step(self, shortcut = False):
         """
         Returns the next form in the Collatz sequence and the transform required to get there.
         Return None if the next form cannot be determined.
+        If shortcut is True odd forms take the shortcut step (3n + 1) / 2 as 3n + 1 is always even.
         """
-        if self.is_even():
-            return Form(self.a // 2, self.b // 2), Form(0.5, 0.5)
-        elif self.is_odd():
-            return Form(3*self.a, 3*self.b + 1), Form(3, 1)
+        a, b = self.a, self.b
+        if a % 2:
+            return None # if a is odd then the parity of the form cannot be determined.
+        elif b % 2:
+            if shortcut:
+                return Form._new(3*a // 2, (3*b + 1) // 2), Form.SHORTCUT
+            return Form._new(3*a, 3*b + 1), Form.TRIPLE
         else:
-            return None
+            return Form._new(a // 2, b // 2), Form.HALVE
 
     def compute_fall(self):
         """
@@ -319,28 +463,52 @@ class Form():
         If the fall is conditional then the minimum value for the fall is returned along with the form.
         returns `False, form, steps` or `True, form, steps` or `True, form, steps, min_value`
         """
-        form = copy.copy(self)
-        steps = 0
-        transform = Form.BASIS
+        return self._compute_fall_from(self, 0)
 
+    def _compute_fall_from(self, form:'Form', steps:int):
+        """
+        Continues compute_fall from `form`, which self reaches after `steps` steps without falling.
+        """
+        if type(self.a) is int and type(self.b) is int and type(form.a) is int and type(form.b) is int:
+            a, b, steps, has_fallen = Form._run_parity(self.a, self.b, form.a, form.b, steps, False)
+            form = Form._new(a, b)
+            if has_fallen:
+                return self._fallen(form, steps)
+            return Transform._new(self, form, None, steps, False)
+
+        # NOTE: The transform is fully determined by the start and end forms so
+        # it is derived from them when needed rather than composed on every step.
         while True:
             # compute the next step
             step = form.step()
 
             if step is None:
-                return Transform(self, form, transform, steps, False)
+                return Transform._new(self, form, None, steps, False)
 
             form = step[0]
-            transform:Form = step[1](transform)
 
             steps += 1
-            comp = form < self
-            if comp[0]:
-                # the intersect must be strictly smaller than 1 for self to be bigger for every valid case (n > 0, n ∈ Z)
-                if comp[1] < 1:
-                    return Transform(self, form, transform, steps, True)
-                else:
-                    return Transform(self, form, transform, steps, True, comp[1])
+            if form < self:
+                return self._fallen(form, steps)
+
+    def _fallen(self, form:'Form', steps:int):
+        """
+        Returns the Transform for self falling below itself to `form` after `steps` steps.
+        """
+        # the intersect must be strictly smaller than 1 for self to be bigger for every valid case (n > 0, n ∈ Z)
+        # intersect = (self.b - form.b) / (form.a - self.a) which is kept as a fraction of integers where possible.
+        numerator, denominator = self.b - form.b, form.a - self.a
+        if denominator == 0:
+            return Transform._new(self, form, None, steps, True)
+
+        if denominator < 0:
+            numerator, denominator = -numerator, -denominator
+
+        if numerator < denominator:
+            return Transform._new(self, form, None, steps, True)
+        else:
+            # the smallest integer strictly beyond the intersect.
+            return Transform._new(self, form, None, steps, True, numerator // denominator + 1)
 
     def compute_full(self):
         """
@@ -348,18 +516,63 @@ class Form():
         If the parity is unknown from the start then a copy of the original form is returned.
         Also returns the number of steps it took to reach the unknown parity.
         """
-        form = copy.copy(self)
-        steps = 0
-        transform = Form.BASIS
+        return self._compute_full_from(self, 0)
+
+    def _compute_full_from(self, form:'Form', steps:int):
+        """
+        Continues compute_full from `form`, which self reaches after `steps` steps.
+        """
+        if type(form.a) is int and type(form.b) is int:
+            a, b, steps, _ = Form._run_parity(self.a, self.b, form.a, form.b, steps, True)
+            form = Form._new(a, b)
+            return Transform._new(self, form, None, steps)
 
         while form.parity(): # True for known parity (-1 or 1), False for unknown parity (0).
             # will never be None due to the parity check.
-            step = form.step()
-            transform = step[1](transform)
-            form = step[0]
+            form = form.step()[0]
             steps += 1
 
-        return Transform(self, form, transform, steps)
+        return Transform._new(self, form, None, steps)
+
+    @staticmethod
+    def _run_parity(a0:int, b0:int, a:int, b:int, steps:int, full:bool):
+        """
+        Integer fast path for compute_fall and compute_full on forms with integer coefficients.
+        Continues the form `a`n + `b`, reached from `a0`n + `b0` after `steps` steps, without creating any Forms.
+        While a is even the parity of the form is the parity of b so the parity sequence is just the
+        Collatz sequence of b. Each odd step is combined with the halving that must follow it, i.e. the
+        shortcut step (3n + 1) / 2, and runs of halvings are taken in one shift by counting trailing zeros.
+        Returns `a, b, steps, has_fallen` for the form at which it fell (if `full` is False) or its parity became unknown.
+        """
+        while not a & 1:
+            if b & 1:
+                # an odd step always leaves the form bigger so it can't fall here.
+                a = 3*a >> 1
+                b = (3*b + 1) >> 1
+                steps += 2
+                continue
+
+            # the number of halvings before b becomes odd (b = 0 stays even) or a becomes odd.
+            zeros = (a & -a).bit_length() - 1
+            if b:
+                zeros = min(zeros, (b & -b).bit_length() - 1)
+
+            if not full:
+                # the form falls once a has been halved t times where a < a0 * 2^t i.e. a // a0 < 2^t.
+                # forms that haven't fallen have a >= a0 so the quotient is at least 1.
+                quotient, remainder = divmod(a, a0)
+                shift = quotient.bit_length()
+                if not remainder and quotient == 1 << (shift - 1) and 0 < shift - 1 <= zeros and b >> (shift - 1) < b0:
+                    # a reaches exactly a0 first and b is smaller.
+                    shift -= 1
+                if shift <= zeros:
+                    return a >> shift, b >> shift, steps + shift, True
+
+            a >>= zeros
+            b >>= zeros
+            steps += zeros
+
+        return a, b, steps, False
 
     def split_form(self, parts:int):
         """
@@ -369,46 +582,116 @@ class Form():
         # for parts = 2: (2a)n + b, (2a)n + (b + 1)
         # for parts = 3: (3a)n + b, (3a)n + (b + 1), (3a)n + (b + 2)
         # for parts = p: (pa)n + b, (pa)n + (b + 1), (pa)n + (b + 2), ..., (pa)n + (b + p - 1)
-        parts_list = []
-        for i in range(parts):
-            parts_list.append(Form(parts*self.a, self.b + i*self.a))
-
-        return tuple(parts_list)
+        a, b = parts*self.a, self.b
+        return tuple([Form._new(a, b + i*self.a) for i in range(parts)])
 
     @classmethod
-    def compute_set(cls, a:int, full:bool = False, filter_fallen:bool = False) -> list[Transform]:
+    def compute_set(cls, a:int, full:bool = False, filter_fallen:bool = False, vectorized:bool = False,
+                    processes:int = 1, chunk_size:int = None) -> list[Transform]:
         """
         Computes all forms: `a`n + b where b ranges from 0 to `a` - 1.
         This runs compute_fall or compute_full on each and returns a list of the results.
         if filter_fallen is True remove results that fall below their starting form.
+        if vectorized is True the forms are stepped together using NumPy (see `sieve.compute_table`).
+        This requires `a` to be a power of two. Use `sieve.compute_table` directly to keep the results as arrays.
+        processes is the number of worker processes to shard the residues across (every core if None) and
+        chunk_size is the number of residues given to a worker at a time (see `parallel.compute_set`).
         """
-        results = []
-        for b in range(a):
+        if processes != 1:
+            import parallel
+            if vectorized:
+                return parallel.compute_table(a, full, filter_fallen, processes, chunk_size).transforms()
+            return parallel.compute_set(a, full, filter_fallen, processes, chunk_size or parallel.DEFAULT_CHUNK_SIZE)
+
+        if vectorized:
+            # imported here so that NumPy is only required when it is used.
+            import sieve
+            return sieve.compute_table(a, full, filter_fallen).transforms()
+
+        return list(cls.iter_set(a, full, filter_fallen))
+
+    @classmethod
+    def iter_set(cls, a:int, full:bool = False, filter_fallen:bool = False, start:int = 0, stop:int = None,
+                 batch_size:int = None, vectorized:bool = False):
+        """
+        Generator version of `compute_set` that yields each result as soon as it is computed rather than building a list.
+        Only the forms `a`n + b where b ranges from `start` to `stop` - 1 (`a` - 1 if stop is None) are computed.
+        If batch_size is given lists of up to `batch_size` results are yielded instead of single results.
+        if vectorized is True the forms are computed in chunks using NumPy (see `sieve.iter_table`).
+        """
+        stop = a if stop is None else min(stop, a)
+
+        if vectorized:
+            import sieve
+            results = (result for table in sieve.iter_table(a, full, filter_fallen, start, stop) for result in table)
+        else:
+            results = cls._iter_set(a, full, filter_fallen, start, stop)
+
+        if batch_size is None:
+            yield from results
+            return
+
+        batch = []
+        for result in results:
+            batch.append(result)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    @classmethod
+    def _iter_set(cls, a:int, full:bool, filter_fallen:bool, start:int, stop:int):
+        for b in range(start, stop):
             if full:
                 new = Form(a, b).compute_full()
             else:
                 new = Form(a, b).compute_fall()
 
             if not (filter_fallen and new.has_fallen):
-                results.append(new)
+                yield new
 
-        return results
+    @classmethod
+    def refine_set(cls, results:list[Transform], parts:int = 2, filter_fallen:bool = False) -> list[Transform]:
+        """
+        Refines the results of `compute_set(a)` into the results of `compute_set(parts*a)`.
+        Each result is split with `Transform.refine` which resumes from its end form rather than its start
+        so only the work beyond the previous level is done. With filter_fallen the results that have
+        fallen are skipped entirely which makes the cost proportional to the number of survivors.
+        The results are returned in the same order as `compute_set`.
+        """
+        refined = []
+        for result in results:
+            if filter_fallen and result.has_fallen:
+                continue
+
+            for new in result.refine(parts):
+                if not (filter_fallen and new.has_fallen):
+                    refined.append(new)
+
+        refined.sort(key=lambda result: result.start.b)
+        return refined
 
-    def tree(self, split:int, depth:int):
+    def tree(self, split:int, depth:int, processes:int = 1):
         """
-        Recursivly calls compute_fall on the form splitting it by `split` whenever it's parity becomes unknown.
-        Stop after `depth` levels of recursion.
+        Calls compute_fall on the form splitting it by `split` whenever it's parity becomes unknown.
+        Stop after `depth` levels and return the tree as nested tuples of Transforms (for the forms that fell)
+        and Forms (for the forms at `depth`).
+        The tree is built with an explicit stack so deep trees don't hit the recursion limit (see `TreeExplorer`).
+        processes is the number of worker processes to share the subtrees between (every core if None).
         """
-        if depth == 0:
-            return self
+        if processes != 1:
+            import parallel
+            return parallel.tree(self, split, depth, processes)
 
-        result = self.compute_fall()
-        if result.has_fallen:
-            return result
-        else:
-            # TODO: Consider splitting the form after the precomputation. i.e. replacing `self.split_form(split)` with `result.end.split_form(split)`
-            # this would still cover all cases and would be more efficient but is also a little less intuitive.
-            return tuple([form.tree(split, depth - 1) for form in self.split_form(split)])
+        return TreeExplorer(self, split, depth).nested()
+
+    def explore(self, split:int, depth:int, max_nodes:int = None, cache:TreeCache = None) -> TreeExplorer:
+        """
+        Returns a `TreeExplorer` that streams the leaves of `tree(split, depth)` and counts the survivors at each depth.
+        """
+        return TreeExplorer(self, split, depth, max_nodes, cache)
 
     def inverse(self):
         """
@@ -416,27 +699,322 @@ class Form():
         in terms of y then solves for x and returns the resulting form
         y = ax + b  =>  x = (y - b) / a = (1/a)y - b/a
         """
-        return Form(1/self.a, -self.b/self.a)
+        return Form(Fraction(1) / self.a, Fraction(-self.b) / self.a)
 
 
+class TreeCache():
+    """
+    A bounded least recently used cache of `compute_fall` results keyed by the starting form.
+    Sharing a cache between explorers deduplicates the subtrees they have in common, e.g. exploring
+    Form(1, 0) and then Form(2, 1), exploring the same form with splits of 2 and 4 or exploring again to a greater depth.
+    """
+    def __init__(self, max_size:int = 2**16):
+        self.max_size = max_size
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.results)
+
+    def get(self, form:Form) -> Transform|None:
+        result = self.results.get((form.a, form.b))
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.results.move_to_end((form.a, form.b))
+        return result
+
+    def put(self, result:Transform):
+        self.results[(result.start.a, result.start.b)] = result
+        if len(self.results) > self.max_size:
+            self.results.popitem(last=False)
+
+class TreeExplorer():
+    """
+    Iteratively explores the tree of `Form.tree`.
+    Each form that hasn't fallen is refined into `split` parts with `Transform.refine` which resumes the parts from
+    the form's precomputed end form rather than recomputing them from the start. The parts are exactly the forms
+    `split_form(split)` so the tree is the same, only cheaper to compute.
+
+    The tree is walked depth first with an explicit stack which holds at most `depth`*(`split` - 1) + 1 forms
+    so memory stays bounded no matter how large the tree is. Iterating over the explorer yields `(depth, transform)`
+    for every leaf: the forms that fell and the survivors at the final depth. While iterating `survivors[d]` and
+    `fallen[d]` count the forms at depth d that haven't and have fallen.
+
+    If `max_nodes` is given then at most that many forms are computed, the forms left on the stack once the budget is
+    used up are yielded as leaves (they haven't fallen) and `truncated` is set.
+    If `result` (the `compute_fall` result of `form`, e.g. refined from its parent) is given the root isn't computed again.
+    """
+    def __init__(self, form:Form, split:int, depth:int, max_nodes:int = None, cache:TreeCache = None, result:Transform = None):
+        if split < 2:
+            raise ValueError("split must be at least 2.")
+        if depth < 0:
+            raise ValueError("depth must be at least 0.")
+
+        self.form = form
+        self.split = split
+        self.depth = depth
+        self.max_nodes = max_nodes
+        self.cache = cache
+        self.result = result
+
+        self.survivors = [0]*(depth + 1)
+        self.fallen = [0]*(depth + 1)
+        self.nodes = 0
+        self.truncated = False
+
+    def _count(self, result:Transform, depth:int):
+        self.nodes += 1
+        if result.has_fallen:
+            self.fallen[depth] += 1
+        else:
+            self.survivors[depth] += 1
+
+    def _root(self) -> Transform:
+        result = self.result
+        if result is None and self.cache is not None:
+            result = self.cache.get(self.form)
+        if result is None:
+            result = self.form.compute_fall()
+            if self.cache is not None:
+                self.cache.put(result)
+        self._count(result, 0)
+        return result
+
+    def _children(self, result:Transform, depth:int) -> tuple[Transform]:
+        """
+        Returns the parts of `result` (which hasn't fallen) at `depth`.
+        """
+        children = None
+        if self.cache is not None:
+            children = [self.cache.get(form) for form in result.start.split_form(self.split)]
+            if None in children:
+                children = None
+
+        if children is None:
+            children = result.refine(self.split)
+            if self.cache is not None:
+                for child in children:
+                    self.cache.put(child)
+
+        for child in children:
+            self._count(child, depth)
+        return tuple(children)
+
+    def __iter__(self):
+        root = self._root()
+        stack = [(0, root)]
+        while stack:
+            depth, result = stack.pop()
+            if result.has_fallen or depth == self.depth:
+                yield depth, result
+            elif self.max_nodes is not None and self.nodes + self.split > self.max_nodes:
+                self.truncated = True
+                yield depth, result
+            else:
+                # reversed so that the leaves come out in the same order as the nested tree.
+                stack.extend((depth + 1, child) for child in reversed(self._children(result, depth + 1)))
+
+    def counts(self) -> list[dict]:
+        """
+        Returns the number of forms, survivors and the fraction of the numbers that survive at each depth.
+        """
+        return [{"depth": depth, "forms": self.survivors[depth] + self.fallen[depth], "survivors": self.survivors[depth],
+                 "density": self.survivors[depth]/self.split**depth}
+                for depth in range(self.depth + 1)]
+
+    def nested(self):
+        """
+        Returns the tree as nested tuples in the format of `Form.tree`.
+        """
+        if self.depth == 0:
+            return self.form
+
+        root = self._root()
+        if root.has_fallen:
+            return root
+
+        # each frame is the parts of a form, its depth and the subtrees of the parts built so far.
+        stack = [(self._children(root, 1), 1, [])]
+        while True:
+            children, depth, built = stack[-1]
+            if len(built) == len(children):
+                stack.pop()
+                if not stack:
+                    return tuple(built)
+                stack[-1][2].append(tuple(built))
+                continue
+
+            child = children[len(built)]
+            if depth == self.depth:
+                built.append(child.start)
+            elif child.has_fallen:
+                built.append(child)
+            else:
+                stack.append((self._children(child, depth + 1), depth + 1, []))
+
 template_path = pathlib.Path(__file__).parent / "template.c"
-def generate_program(start:int, stop:int, template:pathlib.Path = template_path, start_marker:str = "START", end_marker:str = "END"):
+def generate_program(start:int, stop:int, template:pathlib.Path = template_path, start_marker:str = "START", end_marker:str = "END",
+                     modulus:int = 256, unroll_limit:int = 64, scale:int = 10**10, schedule:str = "static", threes:int = 0,
+                     tiered:bool = False, records:bool = False, top:int = 16, cache = None):
     """
     Generates a program using the provided template C code
+    The values of the form `modulus`n + b that don't fall (see Calculation 1) are baked into the program so each
+    iteration of its loop only tests those values for its chunk of `modulus` numbers.
+    If `threes` is given the residues modulo 3^`threes` with a smaller predecessor are removed as well (see combined.py)
+    and each iteration tests a chunk of `modulus` 3^`threes` numbers.
+    If `tiered` is True the template's tiered `test()` is used, which runs in 64 bits while the values fit, escalates
+    to 128 bits when they don't and logs (and exits with status 3 for) numbers that would overflow 128 bits.
+    The precomputed values of the blocks where they all fit in 64 bits are computed in 64 bits too.
+    If `records` is True (only supported by range_template.c) the survivors are followed from themselves to 1 and the
+    records of every chunk are printed for records.Records, keeping the `top` largest entries of each kind.
+    Up to `unroll_limit` values are tested with unrolled `test()` calls, larger tables become static arrays.
+    `start` and `stop` are multiplied by `scale` and `schedule` is the OpenMP schedule of the main loop
+    (e.g. "static", "dynamic,64" or "runtime" to read it from OMP_SCHEDULE).
+    The template's MODULUS, SCALE, SCHEDULE, DECLARATIONS and TESTS markers are replaced with these values and the generated code.
+    Survivor tables above 2^16 are read from `cache` (a `store.TableCache`) if one is given.
     """
     with open(template, 'r') as file:
         template = file.read()
 
     program = template.replace(start_marker, str(start)).replace(end_marker, str(stop))
+    if tiered:
+        program = "#define TIERED\n" + program
+    if records:
+        if threes:
+            raise ValueError('records are only kept for power of two moduli (threes = 0).')
+        program = f"#define RECORDS\n#define TOP {top}\n" + program
+
+    multipliers, offsets = survivor_forms(modulus, threes, cache)
+    if len(multipliers) <= unroll_limit:
+        declarations, tests = "", _unrolled_tests(multipliers, offsets)
+    else:
+        declarations, tests = _table_tests(multipliers, offsets)
+    if tiered:
+        tests = _tiered_tests(multipliers, offsets, len(multipliers) > unroll_limit)
+    if records:
+        residues = ", ".join(f"{residue}ULL" for residue in survivor_residues(modulus, cache))
+        # the tests aren't used so only the residues are declared.
+        declarations = "\n".join([f"#define SURVIVORS {len(multipliers)}", f"static const unsigned long long residues[SURVIVORS] = {{{residues}}};"])
+
+    program = program.replace("MODULUS", str(modulus*3**threes)).replace("SCALE", str(scale)).replace("SCHEDULE", schedule)
+    program = program.replace("DECLARATIONS", declarations).replace("TESTS", tests)
 
     # TODO: compile it.
 
     return program
 
+range_template_path = pathlib.Path(__file__).parent / "range_template.c"
+def generate_range_program(modulus:int = 256, unroll_limit:int = 64, schedule:str = "static", threes:int = 0, tiered:bool = False,
+                           records:bool = False, top:int = 16, cache = None):
+    """
+    Generates a program from `range_template.c` that takes the range to test as arguments
+    (`program first last [blocks]`) so one executable can be reused for every range.
+    See `generate_program` for the other arguments.
+    """
+    return generate_program(0, 0, range_template_path, modulus=modulus, unroll_limit=unroll_limit, schedule=schedule, threes=threes,
+                            tiered=tiered, records=records, top=top, cache=cache)
+
+def survivor_forms(modulus:int, threes:int = 0, cache = None) -> tuple[list[int], list[int]]:
+    """
+    Returns the multipliers and offsets (a and b) of the precomputed forms of the values `modulus`n + b that don't fall.
+    These are the end forms of `Form.compute_set(modulus, filter_fallen=True)`.
+    If `threes` is given they are the survivors modulo `modulus` 3^`threes` of the combined sieve instead (see combined.py).
+    Survivor tables above 2^16 are read from `cache` (a `store.TableCache`) if one is given.
+    """
+    if threes:
+        import combined
+        results = combined.compute_set(modulus.bit_length() - 1, threes, cache)
+        return [result.end.a for result in results], [result.end.b for result in results]
+
+    if modulus > 2**16:
+        # large moduli are only practical with the vectorized engine.
+        import sieve
+        table = sieve.survivor_table(modulus, cache=cache)
+        return table.end_a.tolist(), table.end_b.tolist()
+
+    results = Form.compute_set(modulus, filter_fallen=True)
+    return [result.end.a for result in results], [result.end.b for result in results]
+
+def survivor_residues(modulus:int, cache = None) -> list[int]:
+    """
+    Returns the residues b of the values `modulus`n + b that don't fall, in increasing order.
+    Survivor tables above 2^16 are read from `cache` (a `store.TableCache`) if one is given.
+    """
+    if modulus > 2**16:
+        import sieve
+        return sieve.survivor_table(modulus, cache=cache).start_b.tolist()
+    return sorted(result.start.b for result in Form.compute_set(modulus, filter_fallen=True))
+
+def _unrolled_tests(multipliers:list[int], offsets:list[int], index:str = "i", kind:str = "unsigned __int128", indent:str = " "*8) -> str:
+    """
+    Returns one `test()` call per value. Multipliers used more than once are computed once per iteration.
+    `index` is the variable holding the block number and `kind` the type the shared products are computed in.
+    """
+    shared = sorted({a for a in multipliers if multipliers.count(a) > 1}, reverse=True)
+    width = max([len(str(a)) for a in shared], default=0) + 1
+
+    lines = [f"{indent}{kind} _{a} = {a} * {index};" for a in shared]
+    if lines:
+        lines.append("")
+
+    for a, b in zip(multipliers, offsets):
+        if a in shared:
+            lines.append(f"{indent}test({f'_{a}'.ljust(width)} + {b});")
+        else:
+            lines.append(f"{indent}test({a} * {index} + {b});")
+
+    return "\n".join(lines)
+
+def _table_tests(multipliers:list[int], offsets:list[int]) -> tuple[str, str]:
+    """
+    Returns static arrays of the multipliers and offsets and a loop that tests each of them.
+    """
+    def array(name:str, values:list[int]):
+        rows = [", ".join(f"{value}ULL" for value in values[i:i + 8]) for i in range(0, len(values), 8)]
+        return f"static const unsigned long long {name}[SURVIVORS] = {{\n    " + ",\n    ".join(rows) + "\n};"
+
+    declarations = "\n".join([f"#define SURVIVORS {len(multipliers)}", array("multipliers", multipliers), array("offsets", offsets)])
+    return declarations, _table_loop()
+
+def _table_loop(index:str = "i", indent:str = " "*8) -> str:
+    return "\n".join([
+        f"{indent}for (int j = 0; j < SURVIVORS; j++) {{",
+        f"{indent}    test(multipliers[j] * {index} + offsets[j]);",
+        f"{indent}}}",
+    ])
+
+def _tiered_tests(multipliers:list[int], offsets:list[int], table:bool) -> str:
+    """
+    Returns tests that compute the values in 64 bits for the blocks where every value fits and in 128 bits for the rest.
+    """
+    limit = min(((2**64 - 1 - b)//a for a, b in zip(multipliers, offsets)), default=0)
+    if table:
+        fast, slow = _table_loop("q", " "*12), _table_loop("i", " "*12)
+    else:
+        fast = _unrolled_tests(multipliers, offsets, "q", "unsigned long long", " "*12)
+        slow = _unrolled_tests(multipliers, offsets, "i", "unsigned __int128", " "*12)
+
+    return "\n".join([
+        f"        if (i <= {limit}ULL) {{",
+        "            // every value of this block fits in 64 bits.",
+        "            const unsigned long long q = (unsigned long long)i;",
+        fast,
+        "        } else {",
+        slow,
+        "        }",
+    ])
+
 # Now that the Form class is defined we can define the BASIS attribute.
 Form.BASIS = Form(1, 0)
 Form.ODD = Form(2, 1)
 Form.EVEN = Form(2, 0)
+# The transforms applied by a single step.
+Form.HALVE = Form(Fraction(1, 2), 0)
+Form.TRIPLE = Form(3, 1)
+Form.SHORTCUT = Form(Fraction(3, 2), Fraction(1, 2))
 
 # some useful links:
 # https://sweet.ua.pt/tos/3x+1.html
\ No newline at end of file
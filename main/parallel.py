@@ -0,0 +1,155 @@
+"""
+Multi-process versions of `Form.compute_set` and `Form.tree`.
+
+The residues of a set (and the subtrees of a tree) are independent so they are sharded across a
+`ProcessPoolExecutor`. Workers send back plain tuples of numbers (or NumPy arrays for the vectorized engine)
+rather than pickled `Form` objects and the results are merged in submission order so they are
+identical to a serial run.
+"""
+from __future__ import annotations
+import math, os
+from concurrent.futures import ProcessPoolExecutor
+from main import Form, Transform, TreeExplorer
+
+# The number of residues given to a worker at a time.
+DEFAULT_CHUNK_SIZE = 1 << 14
+
+def _compute_set_chunk(a:int, start:int, stop:int, full:bool, filter_fallen:bool) -> list[tuple]:
+    """
+    Worker: computes the forms `a`n + b for b in [start, stop) and returns the packed results.
+    """
+    results = []
+    for b in range(start, stop):
+        new = Form._new(a, b).compute_full() if full else Form._new(a, b).compute_fall()
+
+        if not (filter_fallen and new.has_fallen):
+            results.append(new._pack())
+
+    return results
+
+def _compute_table_chunk(a:int, start:int, stop:int, full:bool, filter_fallen:bool):
+    """
+    Worker: computes the forms `a`n + b for b in [start, stop) with the vectorized engine.
+    """
+    import sieve
+    return sieve.compute_range(a, start, stop, full, filter_fallen)
+
+def _chunks(a:int, chunk_size:int):
+    starts = range(0, a, chunk_size)
+    return starts, [min(start + chunk_size, a) for start in starts]
+
+def compute_set(a:int, full:bool = False, filter_fallen:bool = False, processes:int = None, chunk_size:int = DEFAULT_CHUNK_SIZE) -> list[Transform]:
+    """
+    Parallel equivalent of `Form.compute_set`.
+    The residues are split into chunks of `chunk_size` which are computed by `processes` worker processes
+    (every core if None).
+    """
+    if a < 1:
+        return []
+
+    starts, stops = _chunks(a, chunk_size)
+    n = len(starts)
+    with ProcessPoolExecutor(processes) as executor:
+        chunks = executor.map(_compute_set_chunk, [a]*n, starts, stops, [full]*n, [filter_fallen]*n)
+        return [Transform._unpack(packed) for chunk in chunks for packed in chunk]
+
+def compute_table(a:int, full:bool = False, filter_fallen:bool = False, processes:int = None, chunk_size:int = None):
+    """
+    Parallel equivalent of `sieve.compute_table`.
+    The residues are split into chunks of `chunk_size` (sieve.DEFAULT_CHUNK_SIZE if None) which are computed
+    by `processes` worker processes (every core if None).
+    """
+    import sieve
+    sieve._check_modulus(a)
+    chunk_size = chunk_size or sieve.DEFAULT_CHUNK_SIZE
+
+    starts, stops = _chunks(a, chunk_size)
+    n = len(starts)
+    with ProcessPoolExecutor(processes) as executor:
+        tables = list(executor.map(_compute_table_chunk, [a]*n, starts, stops, [full]*n, [filter_fallen]*n))
+
+    return sieve.SieveTable.concatenate(a, tables, full)
+
+def _pack_tree(node) -> tuple|list:
+    """
+    Packs the result of `Form.tree` into plain tuples and lists of numbers.
+    Forms become (a, b), Transforms become `Transform._pack()` and branches become lists.
+    """
+    if isinstance(node, Form):
+        return (node.a, node.b)
+    elif isinstance(node, Transform):
+        return node._pack()
+    else:
+        return [_pack_tree(child) for child in node]
+
+def _unpack_tree(packed:tuple|list):
+    """
+    Rebuilds the result of `Form.tree` packed by `_pack_tree`.
+    """
+    if isinstance(packed, list):
+        return tuple([_unpack_tree(child) for child in packed])
+    elif len(packed) == 2:
+        return Form._new(*packed)
+    else:
+        return Transform._unpack(packed)
+
+def _tree_chunk(packed:tuple, split:int, depth:int):
+    """
+    Worker: computes the tree of the form whose packed `compute_fall` result is `packed` (see `Form.tree`),
+    resuming from that result, and returns the packed tree.
+    """
+    result = Transform._unpack(packed)
+    return _pack_tree(TreeExplorer(result.start, split, depth, result=result).nested())
+
+class _Subtree():
+    """
+    Placeholder for a subtree handed out to a worker.
+    """
+    __slots__ = ('index',)
+
+    def __init__(self, index:int):
+        self.index = index
+
+def tree(form:Form, split:int, depth:int, processes:int = None, chunk_size:int = 1):
+    """
+    Parallel equivalent of `Form.tree`.
+    The top levels of the tree are expanded in this process until there are enough subtrees to keep
+    `processes` worker processes (every core if None) busy. The subtrees are then handed out `chunk_size` at a time.
+    Like `TreeExplorer` each form is refined from its parent's result and the workers resume from the results of their
+    subtrees' roots, so no steps are repeated.
+    """
+    processes = processes or os.cpu_count() or 1
+    # aim for a few subtrees per worker so that uneven subtrees balance out.
+    levels = math.ceil(math.log(4*processes, split)) if split > 1 else 0
+    tasks = []
+
+    def expand(result:Transform, depth:int, levels:int):
+        # this must mirror `TreeExplorer.nested`.
+        if depth == 0:
+            return result.start
+        elif result.has_fallen:
+            return result
+        elif levels == 0:
+            tasks.append((result._pack(), split, depth))
+            return _Subtree(len(tasks) - 1)
+        else:
+            return tuple([expand(part, depth - 1, levels - 1) for part in result.refine(split)])
+
+    def fill(node, subtrees:list):
+        if isinstance(node, _Subtree):
+            return subtrees[node.index]
+        elif isinstance(node, tuple):
+            return tuple([fill(child, subtrees) for child in node])
+        else:
+            return node
+
+    if depth == 0:
+        return form
+    top = expand(form.compute_fall(), depth, levels)
+    if not tasks:
+        return top
+
+    with ProcessPoolExecutor(processes) as executor:
+        subtrees = [_unpack_tree(packed) for packed in executor.map(_tree_chunk, *zip(*tasks), chunksize=chunk_size)]
+
+    return fill(top, subtrees)
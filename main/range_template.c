@@ -0,0 +1,395 @@
+// A verifier that takes its range as arguments (see main.generate_range_program and misc/runner.py).
+//
+// usage: program first last [blocks]
+// Tests every number from first to last - 1 (rounded out to whole blocks of MODULUS numbers)
+// and prints "done <block>" after every `blocks` blocks once every block below <block> has been tested.
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <omp.h>
+
+int ctz_128(unsigned __int128 num) {
+    // extract the lower 64 bits by casting directly.
+    unsigned long long lo = (unsigned long long)num;
+    // use a right shift to extract the upper 64 bits.
+    unsigned long long hi = (unsigned long long)(num >> 64);
+
+    if (lo == 0) return __builtin_ctzll(hi) + 64;
+
+    return __builtin_ctzll(lo);
+}
+
+#if defined(TIERED) || defined(RECORDS)
+// Numbers that would overflow 128 bits are logged to stderr and counted instead of silently wrapping around.
+unsigned long long overflows = 0;
+
+void log_overflow(unsigned __int128 value) {
+    char digits[40];
+    int i = 39;
+    digits[i] = '\0';
+    do {
+        digits[--i] = '0' + (int)(value % 10);
+        value /= 10;
+    } while (value);
+
+    #pragma omp atomic
+    overflows++;
+    fprintf(stderr, "overflow %s\n", digits + i);
+}
+#endif
+
+#ifdef TIERED
+// The tiered verifier (main.generate_program(..., tiered=True)) runs each number in 64 bits while it fits and only
+// continues in 128 bits once 3n + 1 would overflow. Numbers that would overflow 128 bits are logged (as their
+// precomputed value).
+
+// continues a number in 128 bits from an odd num.
+void test_wide(unsigned __int128 num, unsigned __int128 init_num) {
+    while (num >= init_num) {
+        unsigned __int128 next;
+        if (__builtin_mul_overflow(num, (unsigned __int128)3, &next) || __builtin_add_overflow(next, 1, &next)) {
+            log_overflow(init_num);
+            return;
+        }
+        num = next >> ctz_128(next);
+    }
+}
+
+void test(unsigned __int128 num) {
+    unsigned __int128 init_num = num;
+    num >>= ctz_128(num); // ensure that num starts odd.
+
+    if ((unsigned long long)(init_num >> 64) != 0) {
+        test_wide(num, init_num);
+        return;
+    }
+
+    unsigned long long n = (unsigned long long)num;
+    const unsigned long long init = (unsigned long long)init_num;
+    while (n >= init) {
+        // 3n + 1 fits in 64 bits exactly when n <= (2^64 - 2) / 3, which is cheaper than checking the arithmetic.
+        if (n > 6148914691236517204ULL) {
+            // escalate to 128 bits for the rest of this number.
+            test_wide(n, init_num);
+            return;
+        }
+        const unsigned long long next = 3*n + 1;
+        n = next >> __builtin_ctzll(next);
+    }
+}
+#else
+void test(unsigned __int128 num) {
+    // make a copy for comparison
+    unsigned __int128 init_num = num;
+
+    num >>= ctz_128(num); // ensure that num starts odd.
+
+    while (num >= init_num) {
+        num = 3 * num + 1;
+        num >>= ctz_128(num);
+    }
+}
+#endif
+
+// parses a decimal string as these values can be larger than an unsigned long long.
+int parse_128(const char *text, unsigned __int128 *value) {
+    *value = 0;
+    if (*text == '\0') return 0;
+    for (; *text; text++) {
+        if (*text < '0' || *text > '9') return 0;
+        *value = *value * 10 + (*text - '0');
+    }
+    return 1;
+}
+
+void print_128(unsigned __int128 value) {
+    char digits[40];
+    int i = 39;
+    digits[i] = '\0';
+    do {
+        digits[--i] = '0' + (int)(value % 10);
+        value /= 10;
+    } while (value);
+    fputs(digits + i, stdout);
+}
+
+// The precomputed forms of the values that don't fall (generated by main.generate_program).
+DECLARATIONS
+
+#ifdef RECORDS
+// With records (main.generate_range_program(..., records=True)) every survivor is followed from itself to 1 and the
+// stopping times, total stopping times and peaks of each chunk are printed as a "records <json>" line (in the format
+// of records.Records.to_dict) before its "done" line. Each thread takes one run of consecutive blocks so it sees its
+// numbers in order and the threads' records are merged in thread order.
+#define KINDS 3
+// far beyond the total stopping time of any number below 2^128.
+#define HISTOGRAM_SIZE 16384
+// 3n + 1 overflows 128 bits above this.
+#define MAX_ODD (((unsigned __int128)0 - 2) / 3)
+
+struct records {
+    unsigned long long count;
+    unsigned __int128 low, high;
+    unsigned long long steps_histogram[HISTOGRAM_SIZE], total_histogram[HISTOGRAM_SIZE];
+    // the largest entries of each kind, largest first and smaller numbers first on ties.
+    int tops[KINDS];
+    unsigned __int128 top_value[KINDS][TOP], top_n[KINDS][TOP];
+    // the running maxima of each kind in order of n.
+    int holders[KINDS], capacity[KINDS];
+    unsigned __int128 *holder_value[KINDS], *holder_n[KINDS];
+    // per survivor: count, sum of steps, max steps, sum of totals, max total and max peak.
+    unsigned long long class_count[SURVIVORS], class_steps[SURVIVORS], class_max_steps[SURVIVORS];
+    unsigned long long class_total[SURVIVORS], class_max_total[SURVIVORS];
+    unsigned __int128 class_peak[SURVIVORS];
+};
+
+void records_reset(struct records *r) {
+    r->count = 0;
+    memset(r->steps_histogram, 0, sizeof(r->steps_histogram));
+    memset(r->total_histogram, 0, sizeof(r->total_histogram));
+    memset(r->class_count, 0, sizeof(r->class_count));
+    memset(r->class_steps, 0, sizeof(r->class_steps));
+    memset(r->class_max_steps, 0, sizeof(r->class_max_steps));
+    memset(r->class_total, 0, sizeof(r->class_total));
+    memset(r->class_max_total, 0, sizeof(r->class_max_total));
+    memset(r->class_peak, 0, sizeof(r->class_peak));
+    for (int kind = 0; kind < KINDS; kind++) {
+        r->tops[kind] = 0;
+        r->holders[kind] = 0;
+    }
+}
+
+// numbers are added in increasing order so an entry that ties with another goes after it.
+void top_add(struct records *r, int kind, unsigned __int128 value, unsigned __int128 n) {
+    int size = r->tops[kind];
+    if (size == TOP && value <= r->top_value[kind][TOP - 1]) return;
+
+    int i = size < TOP ? size++ : TOP - 1;
+    for (; i > 0 && r->top_value[kind][i - 1] < value; i--) {
+        r->top_value[kind][i] = r->top_value[kind][i - 1];
+        r->top_n[kind][i] = r->top_n[kind][i - 1];
+    }
+    r->top_value[kind][i] = value;
+    r->top_n[kind][i] = n;
+    r->tops[kind] = size;
+}
+
+void holder_add(struct records *r, int kind, unsigned __int128 value, unsigned __int128 n) {
+    int size = r->holders[kind];
+    if (size && value <= r->holder_value[kind][size - 1]) return;
+
+    if (size == r->capacity[kind]) {
+        r->capacity[kind] = r->capacity[kind] ? 2 * r->capacity[kind] : 64;
+        r->holder_value[kind] = realloc(r->holder_value[kind], r->capacity[kind] * sizeof(unsigned __int128));
+        r->holder_n[kind] = realloc(r->holder_n[kind], r->capacity[kind] * sizeof(unsigned __int128));
+    }
+    r->holder_value[kind][size] = value;
+    r->holder_n[kind][size] = n;
+    r->holders[kind] = size + 1;
+}
+
+// follows the survivor n (number j of the block) to 1.
+void record(struct records *r, int j, unsigned __int128 n) {
+    unsigned __int128 x = n, peak = n;
+    unsigned int steps = 0, stopping = 0;
+    while (x != 1) {
+        if (x & 1) {
+            if (x > MAX_ODD) {
+                log_overflow(n);
+                return;
+            }
+            x = 3 * x + 1;
+            if (x > peak) peak = x;
+            steps++;
+        }
+
+        int k = ctz_128(x);
+        if (!stopping && (x >> k) < n) {
+            // the first halving that takes x below n.
+            int h = 1;
+            while ((x >> h) >= n) h++;
+            stopping = steps + h;
+        }
+        x >>= k;
+        steps += k;
+    }
+    if (steps >= HISTOGRAM_SIZE) {
+        log_overflow(n);
+        return;
+    }
+
+    if (!r->count) r->low = n;
+    r->high = n;
+    r->count++;
+    r->steps_histogram[stopping]++;
+    r->total_histogram[steps]++;
+
+    r->class_count[j]++;
+    r->class_steps[j] += stopping;
+    r->class_total[j] += steps;
+    if (stopping > r->class_max_steps[j]) r->class_max_steps[j] = stopping;
+    if (steps > r->class_max_total[j]) r->class_max_total[j] = steps;
+    if (peak > r->class_peak[j]) r->class_peak[j] = peak;
+
+    const unsigned __int128 values[KINDS] = {stopping, steps, peak};
+    for (int kind = 0; kind < KINDS; kind++) {
+        top_add(r, kind, values[kind], n);
+        holder_add(r, kind, values[kind], n);
+    }
+}
+
+// merges the records of the threads (in order) into `merged`.
+void records_merge(struct records *merged, struct records *all, int threads) {
+    records_reset(merged);
+    for (int t = 0; t < threads; t++) {
+        struct records *r = &all[t];
+        if (!r->count) continue;
+
+        if (!merged->count) merged->low = r->low;
+        merged->high = r->high;
+        merged->count += r->count;
+        for (int i = 0; i < HISTOGRAM_SIZE; i++) {
+            merged->steps_histogram[i] += r->steps_histogram[i];
+            merged->total_histogram[i] += r->total_histogram[i];
+        }
+        for (int j = 0; j < SURVIVORS; j++) {
+            merged->class_count[j] += r->class_count[j];
+            merged->class_steps[j] += r->class_steps[j];
+            merged->class_total[j] += r->class_total[j];
+            if (r->class_max_steps[j] > merged->class_max_steps[j]) merged->class_max_steps[j] = r->class_max_steps[j];
+            if (r->class_max_total[j] > merged->class_max_total[j]) merged->class_max_total[j] = r->class_max_total[j];
+            if (r->class_peak[j] > merged->class_peak[j]) merged->class_peak[j] = r->class_peak[j];
+        }
+        for (int kind = 0; kind < KINDS; kind++) {
+            for (int i = 0; i < r->tops[kind]; i++) top_add(merged, kind, r->top_value[kind][i], r->top_n[kind][i]);
+            for (int i = 0; i < r->holders[kind]; i++) holder_add(merged, kind, r->holder_value[kind][i], r->holder_n[kind][i]);
+        }
+    }
+}
+
+void print_histogram(const char *name, unsigned long long *histogram) {
+    printf(", \"%s\": {", name);
+    int separator = 0;
+    for (int i = 0; i < HISTOGRAM_SIZE; i++) {
+        if (!histogram[i]) continue;
+        printf("%s\"%d\": %llu", separator++ ? ", " : "", i, histogram[i]);
+    }
+    fputs("}", stdout);
+}
+
+void print_entries(int kind, int size, unsigned __int128 *values, unsigned __int128 *numbers) {
+    static const char *names[KINDS] = {"steps", "total", "peak"};
+    printf("%s\"%s\": [", kind ? ", " : "", names[kind]);
+    for (int i = 0; i < size; i++) {
+        fputs(i ? ", [" : "[", stdout);
+        print_128(values[i]);
+        fputs(", ", stdout);
+        print_128(numbers[i]);
+        fputs("]", stdout);
+    }
+    fputs("]", stdout);
+}
+
+void records_print(struct records *r, double elapsed) {
+    printf("records {\"modulus\": %llu, \"top\": %d, \"count\": %llu, \"start\": ", (unsigned long long)MODULUS, TOP, r->count);
+    if (r->count) {
+        print_128(r->low);
+        fputs(", \"stop\": ", stdout);
+        print_128(r->high + 1);
+    } else {
+        fputs("null, \"stop\": null", stdout);
+    }
+    printf(", \"elapsed\": %f", elapsed);
+    print_histogram("steps_histogram", r->steps_histogram);
+    print_histogram("total_histogram", r->total_histogram);
+
+    fputs(", \"tops\": {", stdout);
+    for (int kind = 0; kind < KINDS; kind++) print_entries(kind, r->tops[kind], r->top_value[kind], r->top_n[kind]);
+    fputs("}, \"holders\": {", stdout);
+    for (int kind = 0; kind < KINDS; kind++) print_entries(kind, r->holders[kind], r->holder_value[kind], r->holder_n[kind]);
+
+    fputs("}, \"classes\": {", stdout);
+    int separator = 0;
+    for (int j = 0; j < SURVIVORS; j++) {
+        if (!r->class_count[j]) continue;
+        printf("%s\"%llu\": [%llu, %llu, %llu, %llu, %llu, ", separator++ ? ", " : "", residues[j], r->class_count[j],
+               r->class_steps[j], r->class_max_steps[j], r->class_total[j], r->class_max_total[j]);
+        print_128(r->class_peak[j]);
+        fputs("]", stdout);
+    }
+    fputs("}}\n", stdout);
+}
+#endif
+
+int main(int argc, char **argv) {
+    unsigned __int128 first, last, blocks = 1024;
+    if (argc < 3 || !parse_128(argv[1], &first) || !parse_128(argv[2], &last) || (argc > 3 && (!parse_128(argv[3], &blocks) || blocks == 0))) {
+        fprintf(stderr, "usage: %s first last [blocks]\n", argv[0]);
+        return 2;
+    }
+
+    // each block i covers the numbers from i * MODULUS to (i + 1) * MODULUS - 1.
+    const unsigned __int128 _lower = first / MODULUS;
+    const unsigned __int128 _upper = (last + MODULUS - 1) / MODULUS;
+
+#ifdef RECORDS
+    const int threads = omp_get_max_threads();
+    // the records of every thread and, last, the merged records of a chunk.
+    struct records *all = calloc(threads + 1, sizeof(struct records));
+    if (!all) {
+        fprintf(stderr, "out of memory\n");
+        return 2;
+    }
+#endif
+
+    for (unsigned __int128 chunk = _lower; chunk < _upper; chunk += blocks) {
+        const unsigned __int128 chunk_end = chunk + blocks < _upper ? chunk + blocks : _upper;
+
+#ifdef RECORDS
+        const double began = omp_get_wtime();
+        for (int t = 0; t < threads; t++) records_reset(&all[t]);
+
+        // schedule(static) gives each thread one run of consecutive blocks, in thread order.
+        #pragma omp parallel
+        {
+            struct records *mine = &all[omp_get_thread_num()];
+            #pragma omp for schedule(static)
+            for (unsigned __int128 i = chunk; i < chunk_end; i++) {
+                for (int j = 0; j < SURVIVORS; j++) {
+                    const unsigned __int128 n = (unsigned __int128)MODULUS * i + residues[j];
+                    // the blocks at the ends of the range may hold numbers of other ranges.
+                    if (n >= first && n < last) record(mine, j, n);
+                }
+            }
+        }
+#else
+        // a runtime schedule is read from the environment when the program starts (see main.generate_program).
+        #pragma omp parallel for schedule(SCHEDULE)
+        for (unsigned __int128 i = chunk; i < chunk_end; i++) {
+TESTS
+        }
+#endif
+
+#if defined(TIERED) || defined(RECORDS)
+        // a chunk holding a number that couldn't be tested isn't reported as done.
+        if (overflows) {
+            fprintf(stderr, "%llu numbers would have overflowed 128 bits\n", overflows);
+            return 3;
+        }
+#endif
+
+#ifdef RECORDS
+        records_merge(&all[threads], all, threads);
+        records_print(&all[threads], omp_get_wtime() - began);
+#endif
+
+        // report progress so an interrupted run can be resumed from the last reported block.
+        fputs("done ", stdout);
+        print_128(chunk_end);
+        fputs("\n", stdout);
+        fflush(stdout);
+    }
+
+    return 0;
+}
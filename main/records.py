@@ -0,0 +1,409 @@
+"""
+Stopping time, total stopping time and path record statistics over ranges.
+
+Every number of a range is followed in uint64 lanes (counting the standard steps 3x + 1 and x / 2 separately)
+until it reaches 1, recording its stopping time (the steps until it is smaller than itself, which also verifies it),
+its total stopping time (the steps until it reaches 1) and its peak (the largest value on the way). Lanes that could
+overflow 64 bits are finished with plain Python integers so the results are exact.
+
+The results are kept in a `Records` aggregate which never holds per number data:
+- histograms of the stopping times and total stopping times.
+- the top N numbers by stopping time (delays), total stopping time and peak (paths).
+- the record holders of the range: the numbers whose stopping time, total stopping time or peak is larger than that of
+  every smaller number in the range. Over a range starting at 1 these are the classic delay and path records.
+- a summary of every residue class `modulus`n + r of the survivors of `Form.compute_set(modulus, filter_fallen=True)`,
+  with the residues that fall summarised together.
+
+Merging aggregates is associative and commutative (the record holders of two ranges are the holders of either that
+beat every smaller holder of both) so chunks can be analysed by any number of workers and merged in any order.
+
+Verification runs produce records as they go: range programs generated with records (see
+`main.generate_range_program`) print the records of every chunk they verify in the format of `Records.to_dict` and
+misc/runner.py --records merges them. Those cover the numbers the verifier follows, the survivors of its sieve (the
+other numbers fall within the sieve's steps), while `analyze_range` covers every number of a range.
+"""
+from __future__ import annotations
+import heapq, json, time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from main import Form
+
+# odd lanes above this would overflow 64 bits in 3x + 1.
+LIMIT = (2**64 - 2)//3
+# the default number of numbers analysed together (and given to a worker at a time).
+DEFAULT_CHUNK_SIZE = 1 << 20
+# lanes are compacted once this fraction of them has finished.
+COMPACT_FRACTION = 0.25
+# the kinds of statistics that are ranked and have record holders.
+KINDS = ('steps', 'total', 'peak')
+
+def trajectory(n:int, x:int = None, steps:int = 0, peak:int = None, stopping:int = None) -> tuple[int, int, int]:
+    """
+    Returns the stopping time, total stopping time and peak of `n` with Python integers. `n` must be at least 2.
+    If `x` is given the trajectory continues from `x`, which n reaches after `steps` steps with the given peak
+    (and the given stopping time if it has already fallen).
+    """
+    x = n if x is None else x
+    peak = n if peak is None else peak
+    while x != 1:
+        if x & 1:
+            x = 3*x + 1
+            peak = max(peak, x)
+        else:
+            x >>= 1
+            if stopping is None and x < n:
+                stopping = steps + 1
+        steps += 1
+    return stopping, steps, peak
+
+def _top(entries, count:int) -> list[tuple[int, int]]:
+    """
+    Returns the `count` largest `(value, n)` entries, smaller numbers first on ties.
+    """
+    return sorted(heapq.nlargest(count, entries, key=lambda entry: (entry[0], -entry[1])), key=lambda entry: (-entry[0], entry[1]))
+
+def _holders(entries) -> list[tuple[int, int]]:
+    """
+    Returns the `(value, n)` entries whose value is larger than that of every entry with a smaller n.
+    """
+    holders, best = [], -1
+    for value, n in sorted(entries, key=lambda entry: (entry[1], -entry[0])):
+        if value > best:
+            holders.append((value, n))
+            best = value
+    return holders
+
+def _merge_class(summary:list, other:list) -> list:
+    return [summary[0] + other[0], summary[1] + other[1], max(summary[2], other[2]),
+            summary[3] + other[3], max(summary[4], other[4]), max(summary[5], other[5])]
+
+class Records():
+    """
+    A mergeable aggregate of the stopping times, total stopping times and peaks of the numbers of a range.
+    `modulus` sets the residue classes that are summarised and `top` the number of entries kept in each top list.
+    """
+    def __init__(self, modulus:int = 256, top:int = 16):
+        if modulus < 2 or modulus & (modulus - 1):
+            raise ValueError('modulus must be a power of two greater than 1.')
+
+        self.modulus = modulus
+        self.top = top
+        self.count = 0
+        self.start = None
+        self.stop = None
+        self.elapsed = 0.0
+        # value -> count.
+        self.steps_histogram = {}
+        self.total_histogram = {}
+        # kind -> [(value, n)] largest first and kind -> [(value, n)] in order of n.
+        self.tops = {kind: [] for kind in KINDS}
+        self.holders = {kind: [] for kind in KINDS}
+        # residue -> [count, sum of steps, max steps, sum of totals, max total, max peak], residue -1 is every class that falls.
+        self.classes = {}
+
+    def __repr__(self):
+        return f'Records(modulus={self.modulus}, count={self.count}, start={self.start}, stop={self.stop})'
+
+    # region merging
+    def merge(self, other:Records) -> Records:
+        """
+        Adds the statistics of `other` (of the same modulus) to these and returns them.
+        """
+        if other.modulus != self.modulus:
+            raise ValueError(f'Cannot merge records with a modulus of {other.modulus} into records with a modulus of {self.modulus}.')
+
+        if other.count:
+            self.start = other.start if self.start is None else min(self.start, other.start)
+            self.stop = other.stop if self.stop is None else max(self.stop, other.stop)
+        self.count += other.count
+        self.elapsed += other.elapsed
+        for histogram, others in ((self.steps_histogram, other.steps_histogram), (self.total_histogram, other.total_histogram)):
+            for value, count in others.items():
+                histogram[value] = histogram.get(value, 0) + count
+        for kind in KINDS:
+            self.tops[kind] = _top(self.tops[kind] + other.tops[kind], self.top)
+            self.holders[kind] = _holders(self.holders[kind] + other.holders[kind])
+        for residue, summary in other.classes.items():
+            mine = self.classes.get(residue)
+            self.classes[residue] = list(summary) if mine is None else _merge_class(mine, summary)
+        return self
+
+    @classmethod
+    def combine(cls, records:list[Records]) -> Records:
+        """
+        Merges a list of records (e.g. one per chunk) into new records.
+        """
+        combined = cls(records[0].modulus, records[0].top) if records else cls()
+        for record in records:
+            combined.merge(record)
+        return combined
+    # endregion
+
+    # region adding numbers
+    def add(self, n:np.ndarray|list, steps:np.ndarray|list, total:np.ndarray|list, peak:np.ndarray|list, survivors:np.ndarray):
+        """
+        Adds the statistics of the numbers `n`, given either as arrays or (for numbers or peaks beyond 64 bits) lists of
+        Python integers. `survivors` maps each residue modulo the modulus to its class (-1 if it falls).
+        """
+        if not len(n):
+            return
+
+        arrays = isinstance(n, np.ndarray) and isinstance(peak, np.ndarray)
+        if arrays:
+            # lanes finish out of order and the record holders are found in order of n.
+            order = np.argsort(n, kind='stable')
+            n, steps, total, peak = n[order], np.asarray(steps)[order], np.asarray(total)[order], peak[order]
+        else:
+            order = sorted(range(len(n)), key=lambda i: n[i])
+            n, steps, total, peak = ([column[i] for i in order] for column in (n, steps, total, peak))
+
+        self.count += len(n)
+        self.start = int(n[0]) if self.start is None else min(self.start, int(n[0]))
+        self.stop = int(n[-1]) + 1 if self.stop is None else max(self.stop, int(n[-1]) + 1)
+
+        for histogram, values in ((self.steps_histogram, steps), (self.total_histogram, total)):
+            counts = np.bincount(np.asarray(values, dtype=np.int64))
+            for value in np.flatnonzero(counts).tolist():
+                histogram[value] = histogram.get(value, 0) + int(counts[value])
+
+        for kind, values in zip(KINDS, (steps, total, peak)):
+            if arrays:
+                # only the entries that tie with or beat the top'th largest value can make the top list.
+                threshold = np.partition(values, len(values) - min(self.top, len(values)))[len(values) - min(self.top, len(values))]
+                best = np.flatnonzero(values >= threshold)
+                self.tops[kind] = _top(self.tops[kind] + list(zip(values[best].tolist(), n[best].tolist())), self.top)
+
+                # the running maxima of the values in order of n.
+                running = np.maximum.accumulate(values)
+                new = np.ones(len(values), dtype=bool)
+                new[1:] = running[1:] > running[:-1]
+                holders = list(zip(values[new].tolist(), n[new].tolist()))
+            else:
+                entries = [(int(value), int(number)) for value, number in zip(values, n)]
+                self.tops[kind] = _top(self.tops[kind] + entries, self.top)
+                holders = _holders(entries)
+            self.holders[kind] = _holders(self.holders[kind] + holders)
+
+        if not arrays:
+            for number, value, number_total, number_peak in zip(n, steps, total, peak):
+                residue = int(survivors[int(number) % self.modulus])
+                summary = [1, int(value), int(value), int(number_total), int(number_total), int(number_peak)]
+                mine = self.classes.get(residue)
+                self.classes[residue] = summary if mine is None else _merge_class(mine, summary)
+            return
+
+        classes = survivors[(n % np.uint64(self.modulus)).astype(np.int64)]
+        keys, inverse = np.unique(classes, return_inverse=True)
+        # group the numbers by class so each class is one slice.
+        order = np.argsort(inverse, kind='stable')
+        starts = np.searchsorted(inverse[order], np.arange(len(keys)))
+        counts = np.bincount(inverse, minlength=len(keys))
+        columns = [counts, np.add.reduceat(steps[order], starts), np.maximum.reduceat(steps[order], starts),
+                   np.add.reduceat(total[order], starts), np.maximum.reduceat(total[order], starts), np.maximum.reduceat(peak[order], starts)]
+        for i, residue in enumerate(keys.tolist()):
+            summary = [int(column[i]) for column in columns]
+            mine = self.classes.get(residue)
+            self.classes[residue] = summary if mine is None else _merge_class(mine, summary)
+    # endregion
+
+    # region export
+    def to_dict(self) -> dict:
+        return {
+            "modulus": self.modulus, "top": self.top, "count": self.count, "start": self.start, "stop": self.stop, "elapsed": self.elapsed,
+            "steps_histogram": {str(value): count for value, count in sorted(self.steps_histogram.items())},
+            "total_histogram": {str(value): count for value, count in sorted(self.total_histogram.items())},
+            "tops": {kind: [list(entry) for entry in entries] for kind, entries in self.tops.items()},
+            "holders": {kind: [list(entry) for entry in entries] for kind, entries in self.holders.items()},
+            "classes": {str(residue): summary for residue, summary in sorted(self.classes.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data:dict) -> Records:
+        records = cls(data["modulus"], data["top"])
+        records.count, records.start, records.stop, records.elapsed = data["count"], data["start"], data["stop"], data["elapsed"]
+        records.steps_histogram = {int(value): count for value, count in data["steps_histogram"].items()}
+        records.total_histogram = {int(value): count for value, count in data["total_histogram"].items()}
+        records.tops = {kind: [tuple(entry) for entry in entries] for kind, entries in data["tops"].items()}
+        records.holders = {kind: [tuple(entry) for entry in entries] for kind, entries in data["holders"].items()}
+        records.classes = {int(residue): summary for residue, summary in data["classes"].items()}
+        return records
+
+    def save_json(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=4)
+
+    @classmethod
+    def load_json(cls, path) -> Records:
+        with open(path, 'r') as file:
+            return cls.from_dict(json.load(file))
+
+    def summary(self) -> dict:
+        """
+        Returns the means and the largest entries of the statistics.
+        """
+        steps = sum(value*count for value, count in self.steps_histogram.items())
+        total = sum(value*count for value, count in self.total_histogram.items())
+        return {
+            "start": self.start, "stop": self.stop, "count": self.count,
+            "mean_steps": steps/self.count if self.count else 0.0, "mean_total": total/self.count if self.count else 0.0,
+            **{f"max_{kind}": self.tops[kind][0] if self.tops[kind] else None for kind in KINDS},
+            "throughput": self.count/self.elapsed if self.elapsed else 0.0,
+        }
+    # endregion
+
+def survivor_classes(modulus:int, cache = None) -> np.ndarray:
+    """
+    Returns the class of every residue modulo `modulus`: the residue itself if it survives and -1 if it falls.
+    Survivor tables above 2^16 are read from `cache` (a `store.TableCache`) if one is given.
+    """
+    classes = np.full(modulus, -1, dtype=np.int64)
+    if modulus > 2**16:
+        import sieve
+        residues = sieve.survivor_table(modulus, cache=cache).start_b
+    else:
+        residues = np.array([result.start.b for result in Form.compute_set(modulus, filter_fallen=True)], dtype=np.int64)
+    classes[residues] = residues
+    return classes
+
+def _step(n:np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, list]:
+    """
+    Follows the lanes `n` (uint64 numbers of at least 2) to 1, taking 3x + 1 and the halving after it together.
+    Returns the numbers, stopping times, total stopping times and peaks of the lanes that finished and the
+    `(n, x, steps, peak, stopping)` state of the lanes that had to be escalated.
+    """
+    x, peak = n.copy(), n.copy()
+    steps = np.zeros(len(n), dtype=np.int64)
+    stopping = np.full(len(n), -1, dtype=np.int64)
+    finished, escalated = [], []
+    one, limit = np.uint64(1), np.uint64(LIMIT)
+    # finished lanes are set to 0 which stays 0 and is never counted again.
+    retired, falling = 0, len(n)
+    while len(n):
+        risky = x > limit
+        if risky.any():
+            risky &= (x & one).astype(bool)
+            escalated.extend(zip(n[risky].tolist(), x[risky].tolist(), steps[risky].tolist(), peak[risky].tolist(), stopping[risky].tolist()))
+            falling -= int((stopping[risky] < 0).sum())
+            x[risky] = 0
+            retired += int(risky.sum())
+
+        odd = x & one
+        # 3x + 1 for odd lanes, x for even lanes.
+        x = x + ((x << one) + one)*odd
+        np.maximum(peak, x, out=peak)
+        x >>= one
+        steps += 1 + odd.astype(np.int64)
+
+        if falling:
+            fallen = (x < n) & (stopping < 0) & (x != 0)
+            if fallen.any():
+                stopping[fallen] = steps[fallen]
+                falling -= int(fallen.sum())
+
+        reached = x == one
+        if reached.any():
+            finished.append((n[reached], stopping[reached], steps[reached], peak[reached]))
+            x[reached] = 0
+            retired += int(reached.sum())
+
+        if retired > COMPACT_FRACTION*len(n):
+            keep = x != 0
+            n, x, peak, steps, stopping = n[keep], x[keep], peak[keep], steps[keep], stopping[keep]
+            retired = 0
+
+    columns = [np.concatenate(column) if finished else np.zeros(0, dtype=np.uint64 if i in (0, 3) else np.int64)
+               for i, column in enumerate(zip(*finished) if finished else [[], [], [], []])]
+    return (*columns, escalated)
+
+def analyze_chunk(start:int, stop:int, modulus:int = 256, top:int = 16, survivors:np.ndarray = None, cache = None) -> Records:
+    """
+    Returns the records of the numbers from `start` to `stop` - 1 (numbers below 2 are skipped).
+    The survivor classes are computed (reading the table from `cache` if one is given) unless `survivors` is given.
+    """
+    began = time.perf_counter()
+    survivors = survivor_classes(modulus, cache) if survivors is None else survivors
+    records = Records(modulus, top)
+    start = max(start, 2)
+    if start >= stop:
+        return records
+
+    if stop <= LIMIT:
+        n, stopping, total, peak, escalated = _step(np.arange(start, stop, dtype=np.uint64))
+        records.add(n, stopping, total, peak, survivors)
+    else:
+        escalated = [(n, n, 0, n, -1) for n in range(start, stop)]
+
+    if escalated:
+        numbers, results = [], []
+        for n, x, steps, peak, stopping in escalated:
+            numbers.append(n)
+            results.append(trajectory(n, x, steps, peak, stopping if stopping >= 0 else None))
+        records.add(numbers, [result[0] for result in results], [result[1] for result in results], [result[2] for result in results], survivors)
+
+    records.elapsed = time.perf_counter() - began
+    return records
+
+def _analyze_chunk(start:int, stop:int, modulus:int, top:int, cache) -> Records:
+    """
+    Worker: analyses one chunk, computing the survivor classes once per process.
+    """
+    global _survivors
+    if _survivors is None or len(_survivors) != modulus:
+        _survivors = survivor_classes(modulus, cache)
+    return analyze_chunk(start, stop, modulus, top, _survivors)
+
+_survivors = None
+
+def analyze_range(start:int, stop:int, modulus:int = 256, top:int = 16, processes:int = None,
+                  chunk_size:int = DEFAULT_CHUNK_SIZE, cache = None) -> Records:
+    """
+    Returns the records of the numbers from `start` to `stop` - 1. The range is split into chunks of `chunk_size`
+    which are analysed by `processes` worker processes (every core if None, in this process if 1) and merged.
+    Survivor tables above 2^16 are read from `cache` (a `store.TableCache`) if one is given.
+    """
+    starts = list(range(start, stop, chunk_size))
+    stops = [min(first + chunk_size, stop) for first in starts]
+    if processes == 1:
+        survivors = survivor_classes(modulus, cache)
+        return Records.combine([analyze_chunk(first, last, modulus, top, survivors) for first, last in zip(starts, stops)] or [Records(modulus, top)])
+
+    n = len(starts)
+    records = Records(modulus, top)
+    with ProcessPoolExecutor(processes) as executor:
+        for chunk in executor.map(_analyze_chunk, starts, stops, [modulus]*n, [top]*n, [cache]*n):
+            records.merge(chunk)
+    return records
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Stopping time, total stopping time and peak records of a range.")
+    parser.add_argument("start", type=int)
+    parser.add_argument("stop", type=int)
+    parser.add_argument("--modulus", type=int, default=256, help="The modulus whose survivor classes are summarised.")
+    parser.add_argument("--top", type=int, default=16)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--output", help="A JSON file to write (or merge) the records into.")
+    parser.add_argument("--tables", help="A directory to cache the survivor tables in (see store.py).")
+    arguments = parser.parse_args()
+
+    cache = None
+    if arguments.tables:
+        import store
+        cache = store.TableCache(arguments.tables)
+
+    began = time.perf_counter()
+    records = analyze_range(arguments.start, arguments.stop, arguments.modulus, arguments.top, arguments.processes, arguments.chunk_size, cache)
+    elapsed = time.perf_counter() - began
+    print(f"{records.count} numbers in {elapsed:.2f}s ({records.count/elapsed:.4g} numbers/s)")
+    for key, value in records.summary().items():
+        print(f"{key}: {value}")
+    for kind in KINDS:
+        print(f"{kind} record holders: " + ", ".join(f"{n} ({value})" for value, n in records.holders[kind]))
+
+    if arguments.output:
+        import pathlib
+        if pathlib.Path(arguments.output).exists():
+            records = Records.load_json(arguments.output).merge(records)
+        records.save_json(arguments.output)
@@ -0,0 +1,271 @@
+"""
+A streaming enumerator of the reverse (predecessor) Collatz tree.
+
+Starting from 1 the tree is built breadth first with the inverse steps
+
+    Form.HALVE.inverse()  = Form(2n)          the predecessor 2n, always valid
+    Form.TRIPLE.inverse() = Form(1/3n - 1/3)  the predecessor (n - 1) / 3, valid (and odd) when n = 4 mod 6
+
+so level t holds exactly the numbers with a total stopping time of t. Levels are held as sorted runs of nodes in
+NumPy arrays and once a level holds more than `max_nodes` nodes its runs are spilled to temporary files, so only the
+level being read and the level being built are kept (on disk if need be) and memory stays bounded.
+
+Branches are pruned symbolically by the residue class Form(2*3^m, s) of each node. Applying the inverse steps to the
+class forms gives the classes of its predecessors, and only the classes with s = 4 mod 6 can take the (n - 1) / 3 step,
+which is the only step that shrinks a node. Multiples of 3 can only ever double so their branches are dropped as soon
+as they reach the bound, and from these class steps every class gets a limit for every number of remaining levels
+above which no node of the class can have a descendant below the bound (see `residue_limits`).
+"""
+from __future__ import annotations
+import os, pathlib, tempfile
+import numpy as np
+from main import Form
+
+DOUBLE = Form.HALVE.inverse()
+UNTRIPLE = Form.TRIPLE.inverse()
+
+# the default number of nodes held in memory at once.
+DEFAULT_MAX_NODES = 1 << 24
+
+# residue classes are tracked modulo 2*3^THREES.
+DEFAULT_THREES = 7
+
+def class_steps(threes:int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns where the inverse steps take every residue class 2*3^`threes`n + s: the class s of 2n, whether (n - 1) / 3
+    is valid for the class and the class modulo 2*3^(`threes` - 1) of (n - 1) / 3 (the step loses a factor of 3).
+    With no factors of 3 only the parity is known, so (n - 1) / 3 is assumed to be valid for every even class.
+    """
+    modulus = 2*3**threes
+    doubles, valid, untriples = np.zeros(modulus, dtype=np.int64), np.zeros(modulus, dtype=bool), np.zeros(modulus, dtype=np.int64)
+    for s in range(modulus):
+        doubles[s] = DOUBLE(Form(modulus, s)).b % modulus
+        if s % 2 == 0 and (threes == 0 or s % 3 == 1):
+            valid[s] = True
+            # (n - 1) / 3 of an even number is odd.
+            untriples[s] = UNTRIPLE(Form(modulus, s)).b if threes else 1
+    return doubles, valid, untriples
+
+def residue_limits(bound:int, depth:int, threes:int = DEFAULT_THREES) -> list[np.ndarray]:
+    """
+    Returns limits[r][s] for r = 0 to `depth`: a node in the class 2*3^`threes`n + s has a descendant below `bound` within
+    r levels only if it is below limits[r][s]. As 2n and (n - 1) / 3 increase with n, the limit is the largest of the
+    bound itself and the limits of the classes the node's predecessors fall in (mapped back through the steps).
+    """
+    steps = [class_steps(j) for j in range(threes + 1)]
+    current = [np.full(2*3**j, bound, dtype=object) for j in range(threes + 1)]
+    limits = [current[threes]]
+    for _ in range(depth):
+        previous, current = current, []
+        for j, (doubles, valid, untriples) in enumerate(steps):
+            # 2n < limit when n < ceil(limit / 2) and (n - 1) / 3 < limit when n < 3 limit + 1.
+            limit = np.maximum((previous[j][doubles] + 1)//2, bound)
+            limit[valid] = np.maximum(limit[valid], 3*previous[max(j - 1, 0)][untriples[valid]] + 1)
+            current.append(limit)
+        limits.append(current[threes])
+    return limits
+
+class ReverseTree():
+    """
+    Enumerates the numbers below `bound` by total stopping time, for the total stopping times 0 to `depth`.
+    Iterating yields `(level, batch)` where each batch is a sorted array and the batches of a level come in order.
+    """
+    def __init__(self, bound:int, depth:int, max_nodes:int = DEFAULT_MAX_NODES, directory:str|pathlib.Path = None,
+                 threes:int = DEFAULT_THREES):
+        """
+        threes: Nodes are pruned by their residue modulo 2*3^`threes` (see `residue_limits`).
+        max_nodes: The number of nodes held in memory at once (roughly), larger levels are spilled to disk.
+        directory: Where spilled levels are written (the system's temporary directory if None).
+        """
+        if bound < 2:
+            raise ValueError('bound must be at least 2.')
+        if depth < 0:
+            raise ValueError('depth must be at least 0.')
+        if max_nodes < 16:
+            raise ValueError('max_nodes must be at least 16.')
+        if threes < 0:
+            raise ValueError('threes must be at least 0.')
+
+        self.bound = bound
+        self.depth = depth
+        self.max_nodes = max_nodes
+        self.directory = directory
+        self.threes = threes
+        self.modulus = 2*3**threes
+
+        # a node with r levels remaining is kept while it is below the limit of its class.
+        limits = residue_limits(bound, depth, threes)
+        # nodes at level t are at most 2^t and kept nodes are doubled so they must fit in half the dtype.
+        peak = max(min(int(limits[depth - level].max()), 2**level) for level in range(depth + 1))
+        self.dtype = np.uint64 if 2*peak < 2**64 else object
+        if self.dtype is not object:
+            # larger limits than any node could reach don't change anything.
+            limits = [np.minimum(limit, 2**63).astype(np.uint64) for limit in limits]
+        self.limits = limits
+
+        # the number of nodes and of nodes below the bound of every level.
+        self.counts = []
+        self.spilled = 0
+        self._temp = None
+        self._files = 0
+
+    def __repr__(self):
+        return f'ReverseTree(bound={self.bound}, depth={self.depth}, max_nodes={self.max_nodes})'
+
+    # region runs
+    def _spill(self, run:np.ndarray):
+        """
+        Writes a sorted run to a temporary file and returns its path.
+        """
+        if self._temp is None:
+            self._temp = tempfile.TemporaryDirectory(dir=self.directory, prefix='reverse')
+        path = pathlib.Path(self._temp.name) / f'{self._files}.npy'
+        self._files += 1
+        np.save(path, run, allow_pickle=self.dtype is object)
+        self.spilled += len(run)
+        return path
+
+    def _load(self, run) -> np.ndarray:
+        if isinstance(run, np.ndarray):
+            return run
+        if self.dtype is object:
+            return np.load(run, allow_pickle=True)
+        return np.load(run, mmap_mode='r')
+
+    def _discard(self, runs:list):
+        for run in runs:
+            if not isinstance(run, np.ndarray):
+                os.remove(run)
+
+    def _chunks(self, runs:list, size:int):
+        for run in runs:
+            run = self._load(run)
+            for start in range(0, len(run), size):
+                yield np.asarray(run[start:start + size])
+
+    def _merge(self, runs:list, size:int):
+        """
+        Yields the nodes of the sorted runs in sorted batches of about `size` nodes.
+        Each round takes the next `size`/len(runs) nodes of every run and emits everything up to the smallest of
+        their last nodes, which is everything that can come before the nodes still to be read.
+        """
+        runs = [self._load(run) for run in runs]
+        runs = [run for run in runs if len(run)]
+        positions = [0]*len(runs)
+        step = max(size//max(len(runs), 1), 1)
+        while runs:
+            ends = [min(position + step, len(run)) for run, position in zip(runs, positions)]
+            # runs that are read to the end don't limit the batch.
+            cut = min((run[end - 1] for run, end in zip(runs, ends) if end < len(run)), default=None)
+
+            parts = []
+            for i, run in enumerate(runs):
+                stop = ends[i] if cut is None else positions[i] + int(np.searchsorted(run[positions[i]:ends[i]], cut, side='right'))
+                parts.append(np.asarray(run[positions[i]:stop]))
+                positions[i] = stop
+
+            batch = np.concatenate(parts)
+            batch.sort()
+            if len(batch):
+                yield batch
+
+            alive = [i for i, run in enumerate(runs) if positions[i] < len(run)]
+            runs, positions = [runs[i] for i in alive], [positions[i] for i in alive]
+    # endregion
+
+    def _children(self, nodes:np.ndarray, remaining:int) -> np.ndarray:
+        """
+        Returns the predecessors of the nodes that are kept with `remaining` levels left.
+        """
+        doubles = nodes*2
+        untriple = (nodes % 6 == 4) & (nodes != 4)
+        untriples = (nodes[untriple] - 1)//3
+        children = np.concatenate([doubles, untriples.astype(self.dtype)])
+
+        limits = self.limits[remaining][(children % self.modulus).astype(np.int64)]
+        return children[(children < limits).astype(bool)]
+
+    def _build(self, runs:list, level:int) -> list:
+        """
+        Builds the runs of the next level from the runs of `level`.
+        """
+        remaining = self.depth - level - 1
+        buffer, buffered, runs_out = [], 0, []
+        for nodes in self._chunks(runs, max(self.max_nodes//4, 1)):
+            children = self._children(nodes, remaining)
+            buffer.append(children)
+            buffered += len(children)
+            if buffered >= self.max_nodes//2:
+                run = np.concatenate(buffer)
+                run.sort()
+                runs_out.append(self._spill(run))
+                buffer, buffered = [], 0
+
+        if buffer:
+            run = np.concatenate(buffer)
+            run.sort()
+            runs_out.append(run if not runs_out else self._spill(run))
+        return runs_out
+
+    def __iter__(self):
+        runs = [np.array([1], dtype=self.dtype)]
+        try:
+            for level in range(self.depth + 1):
+                below = 0
+                for batch in self._merge(runs, max(self.max_nodes//2, 1)):
+                    batch = batch[:np.searchsorted(batch, self.bound)]
+                    below += len(batch)
+                    if len(batch):
+                        yield level, batch
+
+                nodes = sum(len(self._load(run)) for run in runs)
+                if level < self.depth:
+                    built = self._build(runs, level)
+                    self._discard(runs)
+                    runs = built
+                self.counts.append({"level": level, "nodes": nodes, "below": below})
+        finally:
+            self._discard(runs)
+            self.close()
+
+    def close(self):
+        if self._temp is not None:
+            self._temp.cleanup()
+            self._temp = None
+
+    def level(self, t:int):
+        """
+        Yields the sorted batches of the numbers below the bound with a total stopping time of `t`.
+        Only the levels up to `t` are built.
+        """
+        tree = ReverseTree(self.bound, t, self.max_nodes, self.directory, self.threes)
+        for level, batch in tree:
+            if level == t:
+                yield batch
+
+def total_stopping_times(bound:int, depth:int, max_nodes:int = DEFAULT_MAX_NODES) -> dict[int, int]:
+    """
+    Returns the number of numbers below `bound` with each total stopping time up to `depth`.
+    """
+    counts = {}
+    for level, batch in ReverseTree(bound, depth, max_nodes):
+        counts[level] = counts.get(level, 0) + len(batch)
+    return counts
+
+
+if __name__ == "__main__":
+    import argparse, time
+    parser = argparse.ArgumentParser(description="Count the numbers below a bound by total stopping time with the reverse tree.")
+    parser.add_argument("bound", type=int)
+    parser.add_argument("depth", type=int)
+    parser.add_argument("--max-nodes", type=int, default=DEFAULT_MAX_NODES)
+    arguments = parser.parse_args()
+
+    began = time.perf_counter()
+    tree = ReverseTree(arguments.bound, arguments.depth, arguments.max_nodes)
+    counts = {}
+    for level, batch in tree:
+        counts[level] = counts.get(level, 0) + len(batch)
+    for stats in tree.counts:
+        print(f"{stats['level']}: {counts.get(stats['level'], 0)} below {arguments.bound} ({stats['nodes']} nodes)")
+    print(f"{sum(stats['nodes'] for stats in tree.counts)} nodes in {time.perf_counter() - began:.2f}s, {tree.spilled} spilled.")
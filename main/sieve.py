@@ -0,0 +1,264 @@
+"""
+A NumPy engine for sieving forms 2^k n + b.
+
+`Form.compute_set` steps one `Form` at a time which limits it to small moduli. The functions here step every
+residue b of a power of two modulus at once, keeping the a and b coefficients of the forms in integer arrays
+and masking lanes out as they fall or their parity becomes unknown. The results are identical to `compute_set`.
+"""
+from __future__ import annotations
+import numpy as np
+from main import Form, Transform
+
+# For a modulus 2^k the a coefficient of a form is at most 2*3^k and b is always smaller than a.
+# 2*3^39 is the largest such value that fits in an int64.
+MAX_BITS = 39
+
+# The number of residues stepped together. This bounds the memory used by the engine.
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+# `survivor_table` refines larger moduli from the survivors of this one.
+REFINE_BASE = 2**16
+
+class SieveTable():
+    """
+    Column oriented results of `Form.compute_set` for the forms `modulus`n + b.
+    Row i describes the form `modulus`n + start_b[i] which reaches the form end_a[i]n + end_b[i] after steps[i] steps.
+    min_value[i] is 0 when the fall is unconditional (or there is no fall).
+    """
+    COLUMNS = ('start_b', 'end_a', 'end_b', 'steps', 'has_fallen', 'min_value')
+
+    def __init__(self, modulus:int, start_b:np.ndarray, end_a:np.ndarray, end_b:np.ndarray, steps:np.ndarray,
+                 has_fallen:np.ndarray, min_value:np.ndarray, full:bool = False):
+        """
+        modulus: The a value shared by every starting form.
+        full: True if the table holds the results of compute_full rather than compute_fall.
+        The remaining arguments are equal length arrays, one entry per form.
+        """
+        self.modulus = modulus
+        self.full = full
+        self.start_b = start_b
+        self.end_a = end_a
+        self.end_b = end_b
+        self.steps = steps
+        self.has_fallen = has_fallen
+        self.min_value = min_value
+
+    def __len__(self):
+        return len(self.start_b)
+
+    def __repr__(self):
+        return f'SieveTable(modulus={self.modulus}, rows={len(self)}, full={self.full})'
+
+    def select(self, rows:np.ndarray) -> SieveTable:
+        """
+        Returns a new table of the given rows. `rows` is a boolean mask or an array of indices.
+        """
+        return SieveTable(self.modulus, *(getattr(self, column)[rows] for column in self.COLUMNS), self.full)
+
+    def survivors(self) -> SieveTable:
+        """
+        Returns the rows that have not fallen below their starting form.
+        Tables from compute_full don't track falls so they are returned unchanged.
+        """
+        return self if self.full else self.select(~self.has_fallen)
+
+    def transform(self, i:int) -> Transform:
+        """
+        Returns row `i` as a `Transform`.
+        """
+        start = Form._new(self.modulus, int(self.start_b[i]))
+        end = Form._new(int(self.end_a[i]), int(self.end_b[i]))
+        min_value = int(self.min_value[i])
+        return Transform._new(start, end, None, int(self.steps[i]),
+                              None if self.full else bool(self.has_fallen[i]), min_value if min_value else None)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.transform(i)
+
+    def transforms(self) -> list[Transform]:
+        """
+        Returns the table as the list of `Transform`s that `Form.compute_set` would return.
+        """
+        return list(self)
+
+    @classmethod
+    def concatenate(cls, modulus:int, tables:list[SieveTable], full:bool = False) -> SieveTable:
+        """
+        Joins the rows of `tables` (in order) into a single table.
+        """
+        if not tables:
+            empty = np.empty(0, dtype=np.int64)
+            return cls(modulus, empty, empty, empty, empty, np.empty(0, dtype=bool), empty, full)
+
+        return cls(modulus, *(np.concatenate([getattr(table, column) for table in tables]) for column in cls.COLUMNS), full)
+
+def _check_modulus(a:int):
+    """
+    Raises a ValueError if `a` is not a power of two supported by the engine.
+    """
+    if a < 1 or a & (a - 1):
+        raise ValueError(f'The modulus: {a} must be a power of two.')
+
+    if a.bit_length() - 1 > MAX_BITS:
+        raise ValueError(f'The modulus: {a} is larger than the largest supported modulus: 2^{MAX_BITS}.')
+
+def _min_values(modulus:int, start_b:np.ndarray, end_a:np.ndarray, end_b:np.ndarray) -> np.ndarray:
+    """
+    Returns the min_value column for forms that have fallen from `modulus`n + start_b to end_a n + end_b.
+    """
+    # the fall is conditional when the forms intersect at n >= 1, see `Form.compute_fall`.
+    # intersect = (end_b - start_b) / (modulus - end_a) so the fall holds from floor(intersect) + 1.
+    rise = end_b - start_b
+    gap = modulus - end_a
+    conditional = (gap > 0) & (rise >= gap)
+    min_value = np.zeros(len(start_b), dtype=np.int64)
+    min_value[conditional] = rise[conditional] // gap[conditional] + 1
+    return min_value
+
+def step_forms(modulus:int, start_b:np.ndarray, end_a:np.ndarray, end_b:np.ndarray, steps:np.ndarray, full:bool = False):
+    """
+    Steps the forms end_a[i]n + end_b[i], which started as `modulus`n + start_b[i] and have already been
+    stepped steps[i] times, until they fall below their starting form or their parity becomes unknown.
+    If `full` is True then the forms are only stepped until their parity becomes unknown.
+    Returns the resulting columns `end_a, end_b, steps, has_fallen, min_value` in the order of `start_b`.
+    The input arrays are not modified.
+    """
+    count = len(start_b)
+    out_a = np.empty(count, dtype=np.int64)
+    out_b = np.empty(count, dtype=np.int64)
+    out_steps = np.empty(count, dtype=np.int64)
+    out_fallen = np.zeros(count, dtype=bool)
+    out_min = np.zeros(count, dtype=np.int64)
+
+    # the lanes that are still being stepped.
+    lanes = np.arange(count)
+    a = end_a.astype(np.int64, copy=True)
+    b = end_b.astype(np.int64, copy=True)
+    s = steps.astype(np.int64, copy=True)
+    b0 = start_b.astype(np.int64, copy=False)
+
+    while len(lanes):
+        # retire the lanes whose parity is unknown.
+        unknown = (a & 1) == 1
+        if unknown.any():
+            done = lanes[unknown]
+            out_a[done], out_b[done], out_steps[done] = a[unknown], b[unknown], s[unknown]
+            keep = ~unknown
+            lanes, a, b, s, b0 = lanes[keep], a[keep], b[keep], s[keep], b0[keep]
+
+        # step every remaining lane. a is even so the parity of each lane is the parity of b.
+        # an odd step always leaves an even form that has risen so it is combined with the halving that follows it.
+        odd = (b & 1) == 1
+        a = np.where(odd, 3*(a >> 1), a >> 1)
+        b = np.where(odd, (3*b + 1) >> 1, b >> 1)
+        s += 1 + odd
+
+        if full:
+            continue
+
+        # retire the lanes that have fallen below their starting form.
+        fallen = (a < modulus) | ((a == modulus) & (b < b0))
+        if fallen.any():
+            done = lanes[fallen]
+            fa, fb = a[fallen], b[fallen]
+            out_a[done], out_b[done], out_steps[done] = fa, fb, s[fallen]
+            out_fallen[done] = True
+
+            out_min[done] = _min_values(modulus, b0[fallen], fa, fb)
+
+            keep = ~fallen
+            lanes, a, b, s, b0 = lanes[keep], a[keep], b[keep], s[keep], b0[keep]
+
+    return out_a, out_b, out_steps, out_fallen, out_min
+
+def compute_table(a:int, full:bool = False, filter_fallen:bool = False, chunk_size:int = DEFAULT_CHUNK_SIZE) -> SieveTable:
+    """
+    Vectorized equivalent of `Form.compute_set` for a power of two `a`.
+    Computes all forms: `a`n + b where b ranges from 0 to `a` - 1 and returns the results as a `SieveTable`.
+    if filter_fallen is True remove results that fall below their starting form.
+    The residues are processed `chunk_size` at a time to bound memory use.
+    """
+    return SieveTable.concatenate(a, list(iter_table(a, full, filter_fallen, chunk_size=chunk_size)), full)
+
+def iter_table(a:int, full:bool = False, filter_fallen:bool = False, start:int = 0, stop:int = None, chunk_size:int = DEFAULT_CHUNK_SIZE):
+    """
+    Generator version of `compute_table` that yields a `SieveTable` for each chunk of `chunk_size` residues
+    as soon as it is computed so memory use stays flat for any modulus.
+    Only the forms `a`n + b where b ranges from `start` to `stop` - 1 (`a` - 1 if stop is None) are computed.
+    """
+    _check_modulus(a)
+    stop = a if stop is None else min(stop, a)
+
+    for chunk in range(start, stop, chunk_size):
+        yield compute_range(a, chunk, min(chunk + chunk_size, stop), full, filter_fallen)
+
+def compute_range(a:int, start:int, stop:int, full:bool = False, filter_fallen:bool = False) -> SieveTable:
+    """
+    Computes the forms: `a`n + b where b ranges from `start` to `stop` - 1 in a single batch.
+    See `compute_table`.
+    """
+    _check_modulus(a)
+
+    start_b = np.arange(start, stop, dtype=np.int64)
+    columns = step_forms(a, start_b, np.full(len(start_b), a, dtype=np.int64), start_b, np.zeros(len(start_b), dtype=np.int64), full)
+    table = SieveTable(a, start_b, *columns, full)
+
+    return table.survivors() if filter_fallen else table
+
+def refine_table(table:SieveTable, filter_fallen:bool = False, chunk_size:int = DEFAULT_CHUNK_SIZE) -> SieveTable:
+    """
+    Vectorized equivalent of `Form.refine_set` with 2 parts.
+    Refines the results for the modulus 2^k into the results for 2^(k + 1), resuming each form from its end form.
+    With filter_fallen the rows that have fallen are dropped first so the cost is proportional to the number of survivors.
+    The rows of `table` must be in the order of `compute_table` and are returned in the same order.
+    The rows are processed `chunk_size` at a time to bound memory use.
+    """
+    modulus = 2*table.modulus
+    _check_modulus(modulus)
+
+    parents = table.survivors() if filter_fallen else table
+
+    # an + b with n = 2n' + i becomes (2a)n' + (b + ia) for both the start and end forms.
+    # the parents are sorted by b < 2^k so every part with i = 0 comes before every part with i = 1.
+    tables = []
+    for i in range(2):
+        for start in range(0, len(parents), chunk_size):
+            rows = parents.select(slice(start, start + chunk_size))
+            start_b = rows.start_b + i*table.modulus
+            end_a = 2*rows.end_a
+            end_b = rows.end_b + i*rows.end_a
+            steps = rows.steps.copy()
+            has_fallen = rows.has_fallen.copy()
+
+            # forms that have already fallen keep their step but need their min_value recomputed for the new start.
+            resume = np.ones(len(rows), dtype=bool) if table.full else ~has_fallen
+            min_value = _min_values(modulus, start_b, end_a, end_b)
+            min_value[resume] = 0
+
+            end_a[resume], end_b[resume], steps[resume], has_fallen[resume], min_value[resume] = \
+                step_forms(modulus, start_b[resume], end_a[resume], end_b[resume], steps[resume], table.full)
+
+            refined = SieveTable(modulus, start_b, end_a, end_b, steps, has_fallen, min_value, table.full)
+            tables.append(refined.survivors() if filter_fallen else refined)
+
+    return SieveTable.concatenate(modulus, tables, table.full)
+
+def survivor_table(a:int, chunk_size:int = DEFAULT_CHUNK_SIZE, cache = None) -> SieveTable:
+    """
+    Equivalent of `compute_table(a, filter_fallen=True)` for a power of two `a`.
+    Moduli above `REFINE_BASE` are refined from its survivors one factor of 2 at a time so only survivors are ever stepped,
+    which is much faster than sieving every residue.
+    If `cache` (a `store.TableCache`) is given the table is read from it, or computed and stored if it is missing.
+    """
+    if cache is not None:
+        return cache.compute_table(a, filter_fallen=True, chunk_size=chunk_size)
+
+    _check_modulus(a)
+    if a <= REFINE_BASE:
+        return compute_table(a, filter_fallen=True, chunk_size=chunk_size)
+
+    table = compute_table(REFINE_BASE, filter_fallen=True, chunk_size=chunk_size)
+    while table.modulus < a:
+        table = refine_table(table, filter_fallen=True, chunk_size=chunk_size)
+    return table
@@ -0,0 +1,220 @@
+"""
+A binary file format and on-disk cache for `sieve.SieveTable`s.
+
+A table file is a fixed size header followed by one fixed width little endian column per field of the table:
+
+    magic      8 bytes   b'COLLATZT'
+    version    uint32
+    flags      uint32    bit 0: the table is from compute_full, bit 1: the table only holds survivors
+    modulus    uint64
+    rows       uint64
+    checksum   uint32    crc32 of everything after the header
+    (padding up to HEADER_SIZE bytes)
+    start_b, end_a, end_b, min_value   int64[rows]
+    steps                               int32[rows]
+    has_fallen                          uint8[rows]
+
+Tables are loaded with `mmap` so the columns are views of the file rather than copies and even very large
+tables open almost instantly.
+"""
+from __future__ import annotations
+import mmap, os, pathlib, struct, tempfile, time, zlib
+import numpy as np
+import sieve
+
+MAGIC = b'COLLATZT'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQQI')
+HEADER_SIZE = 64
+
+FULL = 1
+FILTERED = 2
+
+# The columns in the order they are stored. The widest types come first to keep every column aligned.
+LAYOUT = (
+    ('start_b', np.dtype('<i8')),
+    ('end_a', np.dtype('<i8')),
+    ('end_b', np.dtype('<i8')),
+    ('min_value', np.dtype('<i8')),
+    ('steps', np.dtype('<i4')),
+    ('has_fallen', np.dtype('u1')),
+)
+
+def save_table(table:sieve.SieveTable, path:pathlib.Path|str, filtered:bool = False):
+    """
+    Writes `table` to `path`. `filtered` records that the table only holds survivors.
+    The file is written to a temporary file first and then renamed into place so readers never see a partial table.
+    """
+    path = pathlib.Path(path)
+    flags = (FULL if table.full else 0) | (FILTERED if filtered else 0)
+    columns = [np.ascontiguousarray(getattr(table, name), dtype=dtype) for name, dtype in LAYOUT]
+
+    checksum = 0
+    for column in columns:
+        checksum = zlib.crc32(column.data, checksum)
+
+    header = HEADER.pack(MAGIC, VERSION, flags, table.modulus, len(table), checksum).ljust(HEADER_SIZE, b'\0')
+
+    file, temp = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix='.tmp')
+    try:
+        with os.fdopen(file, 'wb') as file:
+            file.write(header)
+            for column in columns:
+                file.write(column.data)
+        os.replace(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+def read_header(path:pathlib.Path|str) -> dict:
+    """
+    Returns the header of the table file at `path` as a dictionary.
+    """
+    with open(path, 'rb') as file:
+        data = file.read(HEADER_SIZE)
+
+    if len(data) < HEADER_SIZE:
+        raise ValueError(f'File: {path} is too small to be a table.')
+
+    magic, version, flags, modulus, rows, checksum = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f'File: {path} is not a table.')
+    if version != VERSION:
+        raise ValueError(f'Table: {path} has unsupported version: {version}.')
+
+    return {'version': version, 'full': bool(flags & FULL), 'filtered': bool(flags & FILTERED),
+            'modulus': modulus, 'rows': rows, 'checksum': checksum}
+
+def load_table(path:pathlib.Path|str, verify:bool = False) -> sieve.SieveTable:
+    """
+    Memory maps the table file at `path` and returns it as a read only `SieveTable` without copying the columns.
+    If `verify` is True the checksum is checked, which reads the whole file.
+    """
+    header = read_header(path)
+    rows = header['rows']
+
+    with open(path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        expected = HEADER_SIZE + rows*sum(dtype.itemsize for _, dtype in LAYOUT)
+        if size != expected:
+            raise ValueError(f'Table: {path} is {size} bytes but should be {expected} bytes.')
+
+        # an empty table has nothing to map.
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if rows else bytes(HEADER_SIZE)
+
+    columns = {}
+    offset = HEADER_SIZE
+    checksum = 0
+    for name, dtype in LAYOUT:
+        columns[name] = np.frombuffer(buffer, dtype=dtype, count=rows, offset=offset)
+        if verify:
+            checksum = zlib.crc32(columns[name].data, checksum)
+        offset += rows*dtype.itemsize
+
+    if verify and checksum != header['checksum']:
+        raise ValueError(f'Table: {path} failed its checksum.')
+
+    columns['has_fallen'] = columns['has_fallen'].view(bool)
+    return sieve.SieveTable(header['modulus'], *(columns[name] for name in sieve.SieveTable.COLUMNS), header['full'])
+
+class TableCache():
+    """
+    A directory of table files keyed by modulus and options.
+    `compute_table` returns the stored table when there is one and computes and stores it otherwise.
+    Files are evicted oldest first (by last use) once the cache is larger than `max_bytes`
+    or once they haven't been used for `max_age` seconds.
+    """
+    def __init__(self, directory:pathlib.Path|str, max_bytes:int = None, max_age:float = None):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def path(self, a:int, full:bool = False, filter_fallen:bool = False) -> pathlib.Path:
+        """
+        Returns the path of the file for the given table.
+        """
+        return self.directory / f'sieve-{a}{"-full" if full else ""}{"-filtered" if filter_fallen and not full else ""}.table'
+
+    def get(self, a:int, full:bool = False, filter_fallen:bool = False) -> sieve.SieveTable|None:
+        """
+        Returns the stored table or None if it isn't in the cache.
+        """
+        path = self.path(a, full, filter_fallen)
+        try:
+            table = load_table(path)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        # record the use for eviction.
+        os.utime(path)
+        return table
+
+    def put(self, table:sieve.SieveTable, filter_fallen:bool = False):
+        """
+        Stores `table` and evicts old tables.
+        """
+        save_table(table, self.path(table.modulus, table.full, filter_fallen), filter_fallen and not table.full)
+        self.evict()
+
+    def compute_table(self, a:int, full:bool = False, filter_fallen:bool = False, chunk_size:int = sieve.DEFAULT_CHUNK_SIZE) -> sieve.SieveTable:
+        """
+        Cached equivalent of `sieve.compute_table`.
+        A missing table is refined from the largest smaller table in the cache (or from `sieve.REFINE_BASE`, which is
+        computed and stored if it is missing too) rather than sieving every residue again.
+        """
+        table = self.get(a, full, filter_fallen)
+        if table is not None:
+            return table
+
+        sieve._check_modulus(a)
+        table = self.largest_below(a, full, filter_fallen)
+        if table is None:
+            table = sieve.compute_table(min(a, sieve.REFINE_BASE), full, filter_fallen, chunk_size)
+            self.put(table, filter_fallen)
+
+        while table.modulus < a:
+            table = sieve.refine_table(table, filter_fallen, chunk_size)
+            if table.modulus == a:
+                self.put(table, filter_fallen)
+
+        return table
+
+    def largest_below(self, a:int, full:bool = False, filter_fallen:bool = False) -> sieve.SieveTable|None:
+        """
+        Returns the stored table with the largest modulus smaller than `a` (a power of two) that `a` can be refined from,
+        or None if there isn't one at least as large as `sieve.REFINE_BASE`.
+        """
+        modulus = a//2
+        while modulus >= sieve.REFINE_BASE:
+            if (table := self.get(modulus, full, filter_fallen)) is not None:
+                return table
+            modulus //= 2
+        return None
+
+    def evict(self):
+        """
+        Removes tables older than `max_age` and then the least recently used tables until the cache fits in `max_bytes`.
+        """
+        files = []
+        for path in self.directory.glob('*.table'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        files.sort()
+        now = time.time()
+        total = sum(size for _, size, _ in files)
+        for used, size, path in files:
+            if (self.max_age is not None and now - used > self.max_age) or (self.max_bytes is not None and total > self.max_bytes):
+                path.unlink(missing_ok=True)
+                total -= size
+
+    def clear(self):
+        """
+        Removes every table from the cache.
+        """
+        for path in self.directory.glob('*.table'):
+            path.unlink(missing_ok=True)
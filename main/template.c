@@ -1,6 +1,7 @@
 // NOTE: The limit for the `unsigned __int128` type is: 340282366920938463463374607431768211455
 // NOTE: The Collatz Conjecture lower limit so far is : 295147905179352825856
 // NOTE: While overflow could occur when testing higher values the unsigned __int128 limit is probably high enough.
+// NOTE: Programs generated with tiered=True check for it and log the numbers that would overflow (see below).
 
 #include <stdio.h>
 #include <omp.h>
@@ -19,6 +20,61 @@ int ctz_128(unsigned __int128 num) {
     return __builtin_ctzll(lo);
 }
 
+#ifdef TIERED
+// The tiered verifier (main.generate_program(..., tiered=True)) runs each number in 64 bits while it fits and only
+// continues in 128 bits once 3n + 1 would overflow. Numbers that would overflow 128 bits are logged to stderr
+// (as their precomputed value) and counted instead of silently wrapping around.
+unsigned long long overflows = 0;
+
+void log_overflow(unsigned __int128 value) {
+    char digits[40];
+    int i = 39;
+    digits[i] = '\0';
+    do {
+        digits[--i] = '0' + (int)(value % 10);
+        value /= 10;
+    } while (value);
+
+    #pragma omp atomic
+    overflows++;
+    fprintf(stderr, "overflow %s\n", digits + i);
+}
+
+// continues a number in 128 bits from an odd num.
+void test_wide(unsigned __int128 num, unsigned __int128 init_num) {
+    while (num >= init_num) {
+        unsigned __int128 next;
+        if (__builtin_mul_overflow(num, (unsigned __int128)3, &next) || __builtin_add_overflow(next, 1, &next)) {
+            log_overflow(init_num);
+            return;
+        }
+        num = next >> ctz_128(next);
+    }
+}
+
+void test(unsigned __int128 num) {
+    unsigned __int128 init_num = num;
+    num >>= ctz_128(num); // ensure that num starts odd.
+
+    if ((unsigned long long)(init_num >> 64) != 0) {
+        test_wide(num, init_num);
+        return;
+    }
+
+    unsigned long long n = (unsigned long long)num;
+    const unsigned long long init = (unsigned long long)init_num;
+    while (n >= init) {
+        // 3n + 1 fits in 64 bits exactly when n <= (2^64 - 2) / 3, which is cheaper than checking the arithmetic.
+        if (n > 6148914691236517204ULL) {
+            // escalate to 128 bits for the rest of this number.
+            test_wide(n, init_num);
+            return;
+        }
+        const unsigned long long next = 3*n + 1;
+        n = next >> __builtin_ctzll(next);
+    }
+}
+#else
 void test(unsigned __int128 num) {
     // make a copy for comparison
     unsigned __int128 init_num = num;
@@ -40,52 +96,43 @@ void test(unsigned __int128 num) {
         // climbing again and taking longer to fall so don't do that.
     }
 }
+#endif
+
+// The precomputed forms of the values that don't fall (generated by main.generate_program).
+DECLARATIONS
 
 int main() {
-    // These values are scaled up by 10^10
+    // These values are scaled up by SCALE
     const unsigned __int128 lower = START;
     const unsigned __int128 upper = END;
 
-    // the first chunk ((unsigned __int128)10000000000 = 10^10) is the only one that needs the type cast.
+    // the first chunk ((unsigned __int128)SCALE) is the only one that needs the type cast.
     // the rest of the expression will be automatically promoted to __int128.
-    const unsigned __int128 _lower = (unsigned __int128)10000000000 * lower / 256;
-    const unsigned __int128 _upper = (unsigned __int128)10000000000 * upper / 256;
+    const unsigned __int128 _lower = (unsigned __int128)SCALE * lower / MODULUS;
+    const unsigned __int128 _upper = (unsigned __int128)SCALE * upper / MODULUS;
 
     // OpenMP uses all available threads by default.
     // The number of threads can be controlled using the OMP_NUM_THREADS environment variable.
     printf("Computing...");
 
-    // NOTE: the limits are divided by 256 as we are incrementing our loop by 1 rather than 256.
-    // each loop iteration tests the required 19 values for its 256 value chunk. This means
+    // NOTE: the limits are divided by the modulus as we are incrementing our loop by 1 rather than the modulus.
+    // each loop iteration tests the values that don't fall for its chunk. This means
     // we can use floor division to calculate the limit without missing values.
 
-    #pragma omp parallel for schedule(static) // NOTE: <= must be used to include the last chunk.
+    // a runtime schedule is read from the environment when the program starts (see main.generate_program).
+    #pragma omp parallel for schedule(SCHEDULE) // NOTE: <= must be used to include the last chunk.
     for (unsigned __int128 i = _lower; i <= _upper; i++) {
         // see Calculation 1 in main/calculations.py for the explination behind the following tests.
 
-        unsigned __int128 _2187 = 2187 * i;
-        unsigned __int128 _729 = 729 * i;
-
-        test(_2187 + 242);
-        test(_729  + 91);
-        test(_729  + 137);
-        test(_729  + 182);
-        test(_729  + 206);
-        test(_729  + 263);
-        test(_2187 + 890);
-        test(_729  + 319);
-        test(_2187 + 1093);
-        test(_729  + 445);
-        test(_2187 + 1367);
-        test(_729  + 479);
-        test(_2187 + 1640);
-        test(_729  + 593);
-        test(_729  + 638);
-        test(_729  + 661);
-        test(_2187 + 2051);
-        test(_729  + 719);
-        test(6561 * i + 6560);
+TESTS
+    }
+
+#ifdef TIERED
+    if (overflows) {
+        printf(" %llu numbers would have overflowed 128 bits (see stderr).\n", overflows);
+        return 3;
     }
+#endif
 
     printf(" Done.\n");
 
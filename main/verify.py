@@ -0,0 +1,298 @@
+"""
+A k-step jump table verifier.
+
+Every number can be written as 2^k q + r and, as shown by `Form.compute_full`, after k shortcut steps the form
+2^k n + r always becomes 3^m n + c. Precomputing m and c for every residue r lets a number be advanced k steps
+with one table lookup. Numbers are advanced until they fall below their starting value (their stopping time).
+
+Within a block of k steps the number could fall and climb again, so each residue also stores a lower bound on the
+values in its block and blocks that could hold the fall are taken one step at a time. The largest value in a block
+is the largest of its forms 3an + 3b + 1 (before the halving of an odd step), which is the form with the largest a
+once q is large enough, so each residue stores that form and the smallest q it holds for and the peaks stay exact.
+A number's first block starts at the number itself so where it falls in that block (if it does) is known from its
+residue too, which settles most numbers with a single lookup.
+
+Ranges are verified in uint64 NumPy lanes that jump or step together. Lanes that could overflow 64 bits are finished
+with plain Python integers (as are numbers too large for a lane) so the results are exact for any range.
+"""
+from __future__ import annotations
+import numpy as np
+
+# a lane can take a plain odd step without overflowing while x <= PEAK_LIMIT: 3x + 1 < 2^64.
+PEAK_LIMIT = (2**64 - 2)//3
+# the numbers verified together in lanes which bounds the memory used (roughly 60 bytes per lane).
+DEFAULT_CHUNK_SIZE = 1 << 18
+# lanes are compacted once this fraction of them has finished.
+COMPACT_FRACTION = 0.25
+
+def _block(k:int):
+    """
+    Steps the forms 2^k n + r for every residue r together through k halvings (see `sieve.step_forms`).
+    Yields `odd, a, b, next_a, next_b` for every step: the forms that take an odd step and the forms before and after it.
+    """
+    size = 1 << k
+    a = np.full(size, size, dtype=np.int64)
+    b = np.arange(size, dtype=np.int64)
+    for _ in range(k):
+        odd = (b & 1) == 1
+        next_a = np.where(odd, 3*(a >> 1), a >> 1)
+        next_b = np.where(odd, (3*b + 1) >> 1, b >> 1)
+        yield odd, a, b, next_a, next_b
+        a, b = next_a, next_b
+
+def _peak_bound(odd:np.ndarray, a:np.ndarray, b:np.ndarray, peak_a:np.ndarray, peak_b:np.ndarray) -> np.ndarray:
+    """
+    Returns the smallest q from which the odd steps' forms 3an + 3b + 1 are at most the peak forms (0 if they always are).
+    """
+    other = odd & (3*a < peak_a) & (3*b + 1 > peak_b)
+    return np.where(other, -(-(3*b + 1 - peak_b)//np.where(other, peak_a - 3*a, 1)), 0)
+
+class JumpTable():
+    """
+    Jump table for advancing numbers `k` shortcut steps at a time.
+    The table has 2^k entries so k trades memory (and build time) for speed.
+    """
+    def __init__(self, k:int = 16):
+        """
+        Builds the table for residues modulo 2^k.
+        """
+        if not 1 <= k <= 32:
+            raise ValueError('k must be between 1 and 32.')
+
+        self.k = k
+        self.mask = (1 << k) - 1
+
+        size = 1 << k
+        r = np.arange(size, dtype=np.int64)
+        steps = np.zeros(size, dtype=np.int64)
+        low = np.full(size, size, dtype=np.int64)
+        # the form 3an + 3b + 1 with the largest a, before the halving of an odd step (0n + 0 if there isn't one).
+        peak_a = np.zeros(size, dtype=np.int64)
+        peak_b = np.zeros(size, dtype=np.int64)
+
+        # the first block of n = 2^k q + r (which starts at n itself) ends at the first form with a < 2^k, where n falls.
+        # first_q is the smallest q for which it neither falls earlier nor later and the peak form holds.
+        first_steps = np.zeros(size, dtype=np.int64)
+        first_peak_a = np.zeros(size, dtype=np.int64)
+        first_peak_b = np.zeros(size, dtype=np.int64)
+        first_q = np.zeros(size, dtype=np.int64)
+        survives = np.ones(size, dtype=bool)
+        for odd, a, b, next_a, next_b in _block(k):
+            larger = odd & (3*a > peak_a)
+            peak_a = np.where(larger, 3*a, peak_a)
+            peak_b = np.where(larger, 3*b + 1, peak_b)
+            steps += 1 + odd
+            low = np.minimum(low, next_a)
+
+            # above n until q >= (r - b)/(a - 2^k) and below it from q > (b - r)/(2^k - a).
+            above = survives & (next_a > size) & (next_b < r)
+            first_q = np.where(above, np.maximum(first_q, -(-(r - next_b)//np.where(above, next_a - size, 1))), first_q)
+            fallen = survives & (next_a < size)
+            below = np.where(fallen & (next_b >= r), (next_b - r)//np.where(fallen, size - next_a, 1) + 1, 0)
+            first_q = np.where(fallen, np.maximum(first_q, below), first_q)
+            first_steps = np.where(fallen, steps, first_steps)
+            first_peak_a = np.where(fallen, peak_a, first_peak_a)
+            first_peak_b = np.where(fallen, peak_b, first_peak_b)
+            survives &= ~fallen
+
+        # the first block of a survivor is its whole block.
+        first_steps = np.where(survives, steps, first_steps)
+        first_peak_a = np.where(survives, peak_a, first_peak_a)
+        first_peak_b = np.where(survives, peak_b, first_peak_b)
+
+        # every other odd form 3a'n + 3b' + 1 (a' < peak_a) is at most the peak form once
+        # q >= (3b' + 1 - peak_b)/(peak_a - 3a') so the block is stepped again to find the largest such bound.
+        peak_q = np.zeros(size, dtype=np.int64)
+        before = np.ones(size, dtype=bool)
+        for odd, a, b, next_a, _ in _block(k):
+            peak_q = np.maximum(peak_q, _peak_bound(odd, a, b, peak_a, peak_b))
+            first_q = np.maximum(first_q, _peak_bound(odd & before, a, b, first_peak_a, first_peak_b))
+            before &= next_a >= size
+
+        # every value in the block lies between low*q and the peak form, and after it the number is a*q + b.
+        self.multiplier = next_a.tolist()
+        self.offset = next_b.tolist()
+        self.steps = steps.tolist()
+        self.low = low.tolist()
+        self.peak_a = peak_a.tolist()
+        self.peak_b = peak_b.tolist()
+        self.peak_q = peak_q.tolist()
+        self.first_steps = first_steps.tolist()
+        self.first_peak_a = first_peak_a.tolist()
+        self.first_peak_b = first_peak_b.tolist()
+        self.first_q = first_q.tolist()
+        self.survives = survives.tolist()
+
+        # the lanes' copies of the table and the largest q for which a block's values still fit in a lane.
+        self._multiplier, self._offset, self._low = next_a.astype(np.uint64), next_b.astype(np.uint64), low.astype(np.uint64)
+        self._peak_a, self._peak_b, self._peak_q = peak_a.astype(np.uint64), peak_b.astype(np.uint64), peak_q.astype(np.uint64)
+        self._steps = steps
+        self._first_peak_a, self._first_peak_b, self._first_q = first_peak_a.astype(np.uint64), first_peak_b.astype(np.uint64), first_q.astype(np.uint64)
+        self._first_steps, self._survives = first_steps, survives
+        self._max_q = np.uint64(2**64 - 1)//(np.maximum(peak_a, next_a).astype(np.uint64) + np.uint64(1)) - np.uint64(1)
+
+    def __repr__(self):
+        return f'JumpTable(k={self.k})'
+
+    def _replay(self, x:int, n:int, peak:int, steps:int):
+        """
+        Advances x one step at a time through a block of k halvings, stopping early if it falls below n.
+        Returns `x, peak, steps, has_fallen`.
+        """
+        for _ in range(self.k):
+            if x & 1:
+                x = 3*x + 1
+                steps += 1
+                if x > peak:
+                    peak = x
+
+            x >>= 1
+            steps += 1
+            if x < n:
+                return x, peak, steps, True
+
+        return x, peak, steps, False
+
+    def stopping_time(self, n:int, x:int = None, peak:int = None, steps:int = 0) -> tuple[int, int]:
+        """
+        Returns the stopping time of `n` (the number of steps until it is smaller than `n`)
+        and the largest value reached before then. `n` must be at least 2.
+        If `x` is given the count continues from `x`, which n reaches after `steps` steps without falling
+        and with the largest value `peak` (x if None) on the way.
+        """
+        if n < 2:
+            raise ValueError('n must be at least 2.')
+
+        k, mask = self.k, self.mask
+        multiplier, offset, table_steps, low = self.multiplier, self.offset, self.steps, self.low
+        peak_a, peak_b, peak_q = self.peak_a, self.peak_b, self.peak_q
+
+        if x is None:
+            q, r = n >> k, n & mask
+            if q >= self.first_q[r]:
+                # the first block is known from the residue: n either falls at its end or jumps over it.
+                peak = max(n, self.first_peak_a[r]*q + self.first_peak_b[r])
+                if not self.survives[r]:
+                    return self.first_steps[r], peak
+                x, steps = multiplier[r]*q + offset[r], table_steps[r]
+            else:
+                x = n
+        peak = x if peak is None else peak
+        while True:
+            q, r = x >> k, x & mask
+            if low[r]*q >= n and q >= peak_q[r]:
+                # the number can't fall in this block and its largest value is the peak form so jump over it.
+                peak = max(peak, peak_a[r]*q + peak_b[r])
+                x = multiplier[r]*q + offset[r]
+                steps += table_steps[r]
+                continue
+
+            x, peak, steps, has_fallen = self._replay(x, n, peak, steps)
+            if has_fallen:
+                return steps, peak
+
+    def _lanes(self, n:np.ndarray) -> tuple[np.ndarray, np.ndarray, dict]:
+        """
+        Returns the stopping times and peaks of the numbers `n` (uint64, at least 2) stepped together in lanes.
+        Each lane jumps over its block when it can and otherwise takes one shortcut step.
+        The peaks of the lanes that had to be finished with Python integers are returned in a dictionary by index
+        (their entries in the peaks array are 0).
+        """
+        count = len(n)
+        out_steps = np.zeros(count, dtype=np.int64)
+        out_peak = np.zeros(count, dtype=np.uint64)
+        escalated = {}
+
+        k, mask, one = np.uint64(self.k), np.uint64(self.mask), np.uint64(1)
+
+        # the first block of most numbers is known from their residue: they fall at its end or jump over it.
+        q, r = n >> k, (n & mask).astype(np.intp)
+        known = (q >= self._first_q[r]) & (q <= self._max_q[r])
+        with np.errstate(over='ignore'):
+            peak = np.where(known, np.maximum(n, self._first_peak_a[r]*q + self._first_peak_b[r]), n)
+            x = np.where(known, self._multiplier[r]*q + self._offset[r], n)
+        steps = np.where(known, self._first_steps[r], 0)
+        fallen = known & ~self._survives[r]
+        out_steps[fallen], out_peak[fallen] = steps[fallen], peak[fallen]
+
+        keep = ~fallen
+        lanes, n, x, peak, steps = np.flatnonzero(keep), n[keep], x[keep], peak[keep], steps[keep]
+        done = np.zeros(len(lanes), dtype=bool)
+        while len(lanes):
+            q, r = x >> k, (x & mask).astype(np.intp)
+            jump = (q <= self._max_q[r]) & (self._low[r]*q >= n) & (q >= self._peak_q[r])
+
+            # lanes whose next step could overflow are finished in Python.
+            odd = (x & one).astype(bool)
+            risky = ~jump & odd & (x > np.uint64(PEAK_LIMIT)) & ~done
+            for i in np.flatnonzero(risky):
+                escalated[lanes[i]] = (int(n[i]), int(x[i]), int(peak[i]), int(steps[i]))
+            done |= risky
+
+            # the overflowing values of the lanes that don't jump (or step) are discarded by np.where.
+            with np.errstate(over='ignore'):
+                jumped = self._multiplier[r]*q + self._offset[r]
+                peak = np.maximum(peak, np.where(jump, self._peak_a[r]*q + self._peak_b[r], np.where(odd, 3*x + one, x)))
+                x = np.where(jump, jumped, np.where(odd, (3*x + one) >> one, x >> one))
+            steps += np.where(jump, self._steps[r], np.where(odd, 2, 1))
+
+            fallen = (x < n) & ~done
+            if fallen.any():
+                out_steps[lanes[fallen]] = steps[fallen]
+                out_peak[lanes[fallen]] = peak[fallen]
+                done |= fallen
+
+            if done.sum() > COMPACT_FRACTION*len(lanes):
+                keep = ~done
+                lanes, n, x, peak, steps, done = lanes[keep], n[keep], x[keep], peak[keep], steps[keep], done[keep]
+
+        for i, (number, value, largest, taken) in escalated.items():
+            out_steps[i], escalated[i] = self.stopping_time(number, value, largest, taken)
+        return out_steps, out_peak, escalated
+
+    def _chunks(self, start:int, stop:int, chunk_size:int = DEFAULT_CHUNK_SIZE):
+        """
+        Yields `first, stopping_times, peaks, escalated` for each chunk of up to `chunk_size` numbers from `start` to
+        `stop` - 1 (numbers below 2 are skipped) where `first` is the chunk's first number (see `_lanes`).
+        Numbers that don't fit in a lane are verified with Python integers and their peaks are an object array.
+        """
+        for first in range(max(start, 2), stop, chunk_size):
+            last = min(first + chunk_size, stop)
+            if last <= 2**64:
+                yield first, *self._lanes(np.arange(first, last, dtype=np.uint64))
+            else:
+                steps, peaks = zip(*(self.stopping_time(n) for n in range(first, last)))
+                yield first, np.array(steps, dtype=np.int64), np.array(peaks, dtype=object), {}
+
+    def iter_range(self, start:int, stop:int):
+        """
+        Yields `n, stopping_time, peak` for every n from `start` to `stop` - 1 (numbers below 2 are skipped).
+        """
+        for first, steps, peaks, escalated in self._chunks(start, stop):
+            peaks = peaks.tolist()
+            for i, peak in escalated.items():
+                peaks[i] = peak
+            yield from zip(range(first, first + len(peaks)), steps.tolist(), peaks)
+
+    def verify_range(self, start:int, stop:int) -> dict:
+        """
+        Verifies that every n from `start` to `stop` - 1 falls below itself and returns a summary
+        of the numbers with the longest stopping time and the highest peak.
+        """
+        summary = {'start': start, 'stop': stop, 'count': 0, 'max_steps': 0, 'max_steps_n': None, 'max_peak': 0, 'max_peak_n': None}
+        for first, steps, peaks, escalated in self._chunks(start, stop):
+            summary['count'] += len(steps)
+            # argmax returns the first of the largest values, as a scan in order would.
+            i = int(np.argmax(steps))
+            if steps[i] > summary['max_steps']:
+                summary['max_steps'], summary['max_steps_n'] = int(steps[i]), first + i
+            i = int(np.argmax(peaks))
+            peak = int(peaks[i])
+            # the peaks of the escalated lanes are only in `escalated` (their entries are 0).
+            for j, value in escalated.items():
+                if value > peak or (value == peak and j < i):
+                    peak, i = value, j
+            if peak > summary['max_peak']:
+                summary['max_peak'], summary['max_peak_n'] = peak, first + i
+
+        return summary
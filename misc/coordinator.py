@@ -0,0 +1,366 @@
+"""
+An asyncio work distribution server for the work database.
+
+The coordinator wraps a `ColatzDatabase` (or a `JournaledDatabase`) and serves it to worker processes over local TCP or a
+Unix socket. Ranges are handed out under time limited leases. A worker confirms the ranges of a lease as it scans them
+(all at once or in pieces) and can renew a lease that is taking longer than expected. Leases that aren't renewed
+before they expire have their remaining ranges moved to "failed ranges" so they are assigned again.
+
+The protocol is one JSON object per line in each direction. Every request has an "operation" and gets one response:
+
+    {"operation": "checkout", "size": 1000000, "count": 4, "worker": "name"}
+        -> {"leases": [{"id": 1, "ranges": [[start, stop]], "expires": 1700000000.0}, ...]}
+    {"operation": "confirm", "ranges": [[lease, start, stop], ...]}  -> {"confirmed": 2, "errors": []}
+    {"operation": "fail", "leases": [1, 2]}                          -> {"failed": 2, "errors": []}
+    {"operation": "renew", "leases": [1, 2]}                         -> {"expires": {"1": 1700000000.0}, "errors": [...]}
+    {"operation": "stats"}                                           -> {...}
+
+Checkout and confirm take many ranges per request so a worker only needs one round trip per batch.
+Confirm, fail and renew act on every range or lease they can and report the rest in "errors".
+Failed requests get {"error": message}.
+"""
+import argparse, asyncio, heapq, json, pathlib, time
+from core import ColatzDatabase, IntervalSet
+
+DEFAULT_LEASE = 600.0
+# lines can hold thousands of ranges.
+LINE_LIMIT = 2**24
+
+class Lease():
+    """
+    A set of ranges checked out to a worker until `expires`.
+    """
+    __slots__ = ('id', 'worker', 'remaining', 'expires')
+
+    def __init__(self, id:int, worker:str, ranges:list, expires:float):
+        self.id = id
+        self.worker = worker
+        self.remaining = IntervalSet(ranges)
+        self.expires = expires
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "ranges": self.remaining.to_list(), "expires": self.expires}
+
+class Coordinator():
+    """
+    Serves `database` to workers, leasing ranges for `lease_time` seconds.
+    """
+    def __init__(self, database:ColatzDatabase = None, lease_time:float = DEFAULT_LEASE, max_count:int = 1024):
+        self.database = database or ColatzDatabase()
+        self.lease_time = lease_time
+        self.max_count = max_count
+
+        self.leases = {}
+        # (expires, id) pairs, stale entries (renewed or finished leases) are skipped when popped.
+        self._expiry = []
+        self._next_id = 1
+        self._server = None
+
+        self.started = time.time()
+        self.counters = {"requests": 0, "connections": 0, "checkouts": 0, "assigned": 0, "confirms": 0, "confirmed": 0,
+                         "fails": 0, "expired": 0, "renewals": 0, "errors": 0}
+
+    # region leases
+    def checkout(self, size:int, count:int = 1, worker:str = None, force_size:bool = True, force_consecutive:bool = True) -> list[Lease]:
+        """
+        Leases `count` ranges of `size` numbers.
+        """
+        if not 1 <= count <= self.max_count:
+            raise ValueError(f"count must be between 1 and {self.max_count}.")
+
+        self.expire()
+        expires = time.time() + self.lease_time
+        leases = []
+        for _ in range(count):
+            ranges = self.database.assign_range(size, force_size, force_consecutive)
+            lease = Lease(self._next_id, worker, ranges, expires)
+            self._next_id += 1
+            self.leases[lease.id] = lease
+            heapq.heappush(self._expiry, (expires, lease.id))
+            leases.append(lease)
+            self.counters["assigned"] += sum(stop - start for start, stop in ranges)
+
+        self.counters["checkouts"] += count
+        return leases
+
+    def confirm(self, id:int, start:int, stop:int):
+        """
+        Confirms the range [start, stop) of lease `id`. The range must not have been confirmed already.
+        """
+        lease = self.leases.get(id) if type(id) is int else None
+        if lease is None:
+            raise ValueError(f"Lease: {id} does not exist or has expired.")
+        if not lease.remaining.contains(start, stop):
+            raise ValueError(f"Range: [{start}, {stop}) is not pending in lease: {id}.")
+
+        self.database.confirm_range(start, stop)
+        lease.remaining.remove(start, stop)
+        if not lease.remaining:
+            del self.leases[id]
+
+        self.counters["confirms"] += 1
+        self.counters["confirmed"] += stop - start
+
+    def fail(self, id:int):
+        """
+        Returns the remaining ranges of lease `id` to the database as failed ranges.
+        """
+        lease = self.leases.pop(id, None) if type(id) is int else None
+        if lease is None:
+            raise ValueError(f"Lease: {id} does not exist or has expired.")
+
+        for start, stop in lease.remaining:
+            self.database.fail_range(start, stop)
+        self.counters["fails"] += 1
+
+    def renew(self, id:int) -> float:
+        """
+        Extends lease `id` by `lease_time` seconds from now and returns the new expiry time.
+        """
+        lease = self.leases.get(id) if type(id) is int else None
+        if lease is None:
+            raise ValueError(f"Lease: {id} does not exist or has expired.")
+
+        lease.expires = time.time() + self.lease_time
+        heapq.heappush(self._expiry, (lease.expires, id))
+        self.counters["renewals"] += 1
+        return lease.expires
+
+    def expire(self, now:float = None) -> int:
+        """
+        Fails every lease that has expired and returns how many there were.
+        """
+        now = time.time() if now is None else now
+        expired = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, id = heapq.heappop(self._expiry)
+            lease = self.leases.get(id) if type(id) is int else None
+            if lease is None or lease.expires != expires:
+                continue
+
+            del self.leases[id]
+            for start, stop in lease.remaining:
+                self.database.fail_range(start, stop)
+            expired += 1
+
+        self.counters["expired"] += expired
+        return expired
+
+    def stats(self) -> dict:
+        """
+        Returns the counters along with the lease and database state and the request and confirmation rates.
+        """
+        uptime = time.time() - self.started
+        return {
+            **self.counters,
+            "uptime": uptime,
+            "requests_per_second": self.counters["requests"]/uptime if uptime else 0.0,
+            "confirmed_per_second": self.counters["confirmed"]/uptime if uptime else 0.0,
+            "active_leases": len(self.leases),
+            "leased_numbers": sum(lease.remaining.size() for lease in self.leases.values()),
+            "next_expiry": min((lease.expires for lease in self.leases.values()), default=None),
+            "number": self.database.number,
+            "pending": self.database.pending.size(),
+            "failed": self.database.failed.size(),
+        }
+    # endregion
+
+    # region server
+    def handle_request(self, request:dict) -> dict:
+        """
+        Runs one protocol request and returns the response.
+        """
+        self.counters["requests"] += 1
+        if not isinstance(request, dict):
+            raise ValueError("Requests must be JSON objects.")
+        operation = request.get("operation")
+
+        if operation == "checkout":
+            leases = self.checkout(request["size"], request.get("count", 1), request.get("worker"),
+                                   request.get("force_size", True), request.get("force_consecutive", True))
+            return {"leases": [lease.to_dict() for lease in leases]}
+
+        if operation == "confirm":
+            # confirm as much of the batch as possible and report the rest.
+            confirmed, errors = 0, []
+            for entry in request["ranges"]:
+                try:
+                    if not (isinstance(entry, list) and len(entry) == 3 and all(type(value) is int for value in entry)):
+                        raise ValueError(f"Invalid range: {entry}, expected [lease, start, stop].")
+                    self.confirm(*entry)
+                    confirmed += 1
+                except ValueError as err:
+                    errors.append(str(err))
+            return {"confirmed": confirmed, "errors": errors}
+
+        if operation == "fail":
+            # fail every lease that can be failed and report the rest.
+            failed, errors = 0, []
+            for id in request["leases"]:
+                try:
+                    self.fail(id)
+                    failed += 1
+                except ValueError as err:
+                    errors.append(str(err))
+            return {"failed": failed, "errors": errors}
+
+        if operation == "renew":
+            # one expired lease mustn't stop the others from being renewed.
+            expires, errors = {}, []
+            for id in request["leases"]:
+                try:
+                    expires[str(id)] = self.renew(id)
+                except ValueError as err:
+                    errors.append(str(err))
+            return {"expires": expires, "errors": errors}
+
+        if operation == "stats":
+            return self.stats()
+
+        raise ValueError(f"Unknown operation: {operation}")
+
+    async def _handle_connection(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+        self.counters["connections"] += 1
+        try:
+            while line := await reader.readline():
+                try:
+                    response = self.handle_request(json.loads(line))
+                except (ValueError, KeyError, TypeError) as err:
+                    self.counters["errors"] += 1
+                    response = {"error": str(err)}
+                writer.write(json.dumps(response, separators=(',', ':')).encode() + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _expire_periodically(self, interval:float):
+        while True:
+            await asyncio.sleep(interval)
+            self.expire()
+
+    async def start(self, host:str = "127.0.0.1", port:int = 0, path:pathlib.Path|str = None) -> asyncio.AbstractServer:
+        """
+        Starts listening on the Unix socket `path` if given or on `host`:`port` otherwise.
+        Returns the server, `port` 0 picks a free port (see `address`).
+        """
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._handle_connection, str(path), limit=LINE_LIMIT)
+        else:
+            self._server = await asyncio.start_server(self._handle_connection, host, port, limit=LINE_LIMIT)
+        self._expirer = asyncio.create_task(self._expire_periodically(min(self.lease_time/4, 10.0)))
+        return self._server
+
+    @property
+    def address(self):
+        return self._server.sockets[0].getsockname()
+
+    async def serve_forever(self):
+        try:
+            await self._server.serve_forever()
+        finally:
+            self._expirer.cancel()
+
+    async def stop(self):
+        self._expirer.cancel()
+        self._server.close()
+        await self._server.wait_closed()
+        # a journaled database only syncs every so often.
+        if hasattr(self.database, "sync"):
+            self.database.sync()
+    # endregion
+
+class Client():
+    """
+    An asyncio client for a `Coordinator`. Requests on one client are sent one at a time.
+    """
+    def __init__(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter, worker:str = None):
+        self.reader = reader
+        self.writer = writer
+        self.worker = worker
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    async def connect(cls, host:str = "127.0.0.1", port:int = None, path:pathlib.Path|str = None, worker:str = None):
+        """
+        Connects to the coordinator on the Unix socket `path` if given or on `host`:`port` otherwise.
+        """
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(str(path), limit=LINE_LIMIT)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=LINE_LIMIT)
+        return cls(reader, writer, worker)
+
+    async def request(self, request:dict) -> dict:
+        """
+        Sends `request` and returns the response, raising a `RuntimeError` if the coordinator reports an error.
+        """
+        async with self._lock:
+            self.writer.write(json.dumps(request, separators=(',', ':')).encode() + b'\n')
+            await self.writer.drain()
+            line = await self.reader.readline()
+
+        if not line:
+            raise ConnectionError("The coordinator closed the connection.")
+        response = json.loads(line)
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response
+
+    async def checkout(self, size:int, count:int = 1, force_size:bool = True, force_consecutive:bool = True) -> list[dict]:
+        response = await self.request({"operation": "checkout", "size": size, "count": count, "worker": self.worker,
+                                       "force_size": force_size, "force_consecutive": force_consecutive})
+        return response["leases"]
+
+    async def confirm(self, ranges:list) -> dict:
+        """
+        Confirms every `(lease, start, stop)` in `ranges`.
+        """
+        return await self.request({"operation": "confirm", "ranges": [list(rng) for rng in ranges]})
+
+    async def fail(self, leases:list[int]) -> dict:
+        return await self.request({"operation": "fail", "leases": list(leases)})
+
+    async def renew(self, leases:list[int]) -> dict:
+        return (await self.request({"operation": "renew", "leases": list(leases)}))["expires"]
+
+    async def stats(self) -> dict:
+        return await self.request({"operation": "stats"})
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the work database to local workers.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="Listen on this Unix socket instead of TCP.")
+    parser.add_argument("--database", help="A database.json file to serve (changes are saved back on exit).")
+    parser.add_argument("--journal", help="A journal directory to serve (see journal.py).")
+    parser.add_argument("--lease", type=float, default=DEFAULT_LEASE, help="Lease time in seconds.")
+    arguments = parser.parse_args()
+
+    if arguments.journal:
+        from journal import JournaledDatabase
+        database = JournaledDatabase(arguments.journal)
+    else:
+        database = ColatzDatabase(arguments.database)
+
+    async def main():
+        coordinator = Coordinator(database, arguments.lease)
+        await coordinator.start(arguments.host, arguments.port, arguments.unix)
+        print(f"Serving on {coordinator.address}")
+        await coordinator.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if arguments.journal:
+            database.close()
+        elif arguments.database:
+            database.save_database()
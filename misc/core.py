@@ -9,8 +9,240 @@ process confirms the range which is added back to the database. Ranges are gener
 and are just the next n avalable numbers where n is the requested size. If worker tasks ever fail to
 confirm their range then a gap will appear in the range of scanned numbers. This gap will just be
 added to the next requested task. Tasks are assumed to be honest about their results.
+
+Ranges are half open lists `[start, stop]` that cover the numbers start, start + 1, ..., stop - 1.
 """
-import os,json,pathlib
+import os,json,pathlib,random
+
+class _Node():
+    """
+    A node of the treap behind `IntervalSet`: the range [start, stop) along with the number of ranges, the number of
+    integers and the length of the longest range in its subtree.
+    """
+    __slots__ = ('start', 'stop', 'priority', 'left', 'right', 'count', 'total', 'longest')
+
+    def __init__(self, start:int, stop:int, priority:float):
+        self.start = start
+        self.stop = stop
+        self.priority = priority
+        self.left = None
+        self.right = None
+        self.update()
+
+    def update(self):
+        length = self.stop - self.start
+        count, total, longest = 1, length, length
+        if self.left is not None:
+            count, total, longest = count + self.left.count, total + self.left.total, max(longest, self.left.longest)
+        if self.right is not None:
+            count, total, longest = count + self.right.count, total + self.right.total, max(longest, self.right.longest)
+        self.count, self.total, self.longest = count, total, longest
+        return self
+
+def _split(node:_Node, key:int) -> tuple[_Node, _Node]:
+    """
+    Splits a treap into the ranges that start before `key` and the rest.
+    """
+    if node is None:
+        return None, None
+    if node.start < key:
+        node.right, right = _split(node.right, key)
+        return node.update(), right
+    left, node.left = _split(node.left, key)
+    return left, node.update()
+
+def _merge(left:_Node, right:_Node) -> _Node:
+    """
+    Joins two treaps where every range of `left` comes before every range of `right`.
+    """
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        return left.update()
+    right.left = _merge(left, right.left)
+    return right.update()
+
+def _last(node:_Node) -> _Node:
+    while node is not None and node.right is not None:
+        node = node.right
+    return node
+
+class IntervalSet():
+    """
+    A set of integers stored as sorted, disjoint, coalesced half open ranges.
+    The ranges are kept in a treap ordered by their starts where every subtree knows its longest range, so adding,
+    removing and finding ranges (including the lowest range of at least a given length) is O(log n) in the number of
+    ranges and the size of the set is O(1).
+    """
+    def __init__(self, ranges:list = ()):
+        self.root = None
+        # the priorities only shape the tree so a fixed seed keeps it reproducible.
+        self._random = random.Random(0)
+        for start, stop in ranges:
+            self.add(start, stop)
+
+    def __len__(self):
+        return self.root.count if self.root else 0
+
+    def __iter__(self):
+        stack, node = [], self.root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.start, node.stop
+            node = node.right
+
+    def __bool__(self):
+        return self.root is not None
+
+    def __repr__(self):
+        return f'IntervalSet({self.to_list()})'
+
+    def to_list(self) -> list:
+        return [[start, stop] for start, stop in self]
+
+    def size(self) -> int:
+        """
+        Returns the number of integers in the set.
+        """
+        return self.root.total if self.root else 0
+
+    def first(self) -> tuple[int, int]|None:
+        """
+        Returns the lowest range or None if the set is empty.
+        """
+        node = self.root
+        while node is not None and node.left is not None:
+            node = node.left
+        return (node.start, node.stop) if node else None
+
+    def last_stop(self) -> int|None:
+        node = _last(self.root)
+        return node.stop if node else None
+
+    def _floor(self, value:int) -> _Node:
+        """
+        Returns the range with the largest start that is at most `value` (or None).
+        """
+        node, floor = self.root, None
+        while node is not None:
+            if node.start <= value:
+                floor, node = node, node.right
+            else:
+                node = node.left
+        return floor
+
+    def overlaps(self, start:int, stop:int) -> bool:
+        """
+        Returns True if any number in [start, stop) is in the set.
+        """
+        # the last range that starts in [start, stop), or the range before it.
+        floor = self._floor(max(start, stop - 1))
+        return floor is not None and floor.stop > start
+
+    def contains(self, start:int, stop:int) -> bool:
+        """
+        Returns True if every number in [start, stop) is in the set.
+        """
+        floor = self._floor(start)
+        return floor is not None and floor.stop >= stop
+
+    def _node(self, start:int, stop:int) -> _Node:
+        return _Node(start, stop, self._random.random())
+
+    def add(self, start:int, stop:int):
+        """
+        Adds [start, stop) to the set, merging it with any ranges it overlaps or touches.
+        """
+        if start >= stop:
+            return
+
+        left, right = _split(self.root, start)
+        # the range before may reach into [start, stop).
+        last = _last(left)
+        if last is not None and last.stop >= start:
+            left, _ = _split(left, last.start)
+            start, stop = last.start, max(stop, last.stop)
+
+        # the ranges that start up to stop overlap or touch [start, stop) and are replaced.
+        middle, right = _split(right, stop + 1)
+        last = _last(middle)
+        if last is not None:
+            stop = max(stop, last.stop)
+
+        self.root = _merge(_merge(left, self._node(start, stop)), right)
+
+    def remove(self, start:int, stop:int):
+        """
+        Removes [start, stop) from the set, splitting any range it cuts through.
+        """
+        if start >= stop:
+            return
+
+        left, right = _split(self.root, start)
+        pieces = []
+        # the range before may reach into (or through) [start, stop).
+        last = _last(left)
+        if last is not None and last.stop > start:
+            left, _ = _split(left, last.start)
+            pieces.append((last.start, start))
+            if last.stop > stop:
+                pieces.append((stop, last.stop))
+
+        # the ranges that start before stop are removed, keeping whatever the last of them holds past stop.
+        middle, right = _split(right, stop)
+        last = _last(middle)
+        if last is not None and last.stop > stop:
+            pieces.append((stop, last.stop))
+
+        for piece in pieces:
+            left = _merge(left, self._node(*piece))
+        self.root = _merge(left, right)
+
+    def take(self, size:int, consecutive:bool = True, exact:bool = True) -> list:
+        """
+        Removes up to `size` numbers from the lowest ranges and returns them as a list of ranges.
+        If `consecutive` is True the numbers come from a single range, the lowest one that is large
+        enough if `exact` is True or the lowest range otherwise.
+        """
+        taken = []
+        if consecutive:
+            if exact:
+                if self.root is None or self.root.longest < size:
+                    return taken
+                # descend to the lowest range of at least `size` numbers.
+                node = self.root
+                while True:
+                    if node.left is not None and node.left.longest >= size:
+                        node = node.left
+                    elif node.stop - node.start >= size:
+                        break
+                    else:
+                        node = node.right
+                found = (node.start, node.stop)
+            else:
+                found = self.first()
+                if found is None:
+                    return taken
+
+            start, stop = found[0], min(found[0] + size, found[1])
+            self.remove(start, stop)
+            taken.append([start, stop])
+            return taken
+
+        while size > 0 and self:
+            start, stop = self.first()
+            stop = min(start + size, stop)
+            self.remove(start, stop)
+            taken.append([start, stop])
+            size -= stop - start
+
+        return taken
 
 class ColatzDatabase():
     """
@@ -29,8 +261,8 @@ class ColatzDatabase():
     }
 
     def __init__(self, database:pathlib.Path|str = None):
-        self.data = None
         self.database = None
+        self.load_data(json.loads(json.dumps(self.DEFAULT_DATABASE)))
         if database:
             self.load_database(database)
 
@@ -45,24 +277,61 @@ class ColatzDatabase():
         except TypeError:
             raise TypeError("Failed to converd `path` to type `pathlib.Path`.")
 
-        if not path.is_file():
-            raise ValueError(f"Path: {path} must be a regular or symlink file.")
-
         if not path.exists():
             raise FileNotFoundError(f"Failed to find path: {path}")
 
+        if not path.is_file():
+            raise ValueError(f"Path: {path} must be a regular or symlink file.")
+
         return path
 
     def load_database(self, database:pathlib.Path|str):
         self.database = self.pathify(database)
 
-        data = json.load(str(self.database))
+        with open(self.database, 'r') as file:
+            data = json.load(file)
+
         if not self.validate_data(data):
             raise ValueError("Invalid Database")
 
-        self.data = data
+        self.load_data(data)
+
+    def load_data(self, data:dict):
+        """
+        Replaces the state of the database with `data` (in the format of `DEFAULT_DATABASE`).
+        """
+        self.number = data["number"]
+        self.pending = IntervalSet(data["pending ranges"])
+        self.failed = IntervalSet(data["failed ranges"])
+        self.confirmed = IntervalSet(data["confirmed ranges"])
+        self._advance()
+
+    @property
+    def data(self) -> dict:
+        """
+        The state of the database in the format of `DEFAULT_DATABASE`.
+        """
+        return {
+            "number": self.number,
+            "pending ranges": self.pending.to_list(),
+            "failed ranges": self.failed.to_list(),
+            "confirmed ranges": self.confirmed.to_list(),
+        }
+
+    def save_database(self, database:pathlib.Path|str = None):
+        """
+        Writes the database to `database` (or the file it was loaded from).
+        """
+        database = pathlib.Path(database) if database else self.database
+        if database is None:
+            raise ValueError("No database file to save to.")
+
+        with open(database, 'w') as file:
+            json.dump(self.data, file, indent=4)
+
+        self.database = database
 
-    def validate_data(self, data:dict = None) -> dict:
+    def validate_data(self, data:dict = None) -> bool:
         """
         Confirms that `data` (or `self.data` if `data` is not provided) is a valid database.
         This will return `False` if any of the checks fail and will return `True` otherwise.
@@ -75,14 +344,35 @@ class ColatzDatabase():
             assert "pending ranges" in data.keys(), "No 'pending ranges' key found."
             assert "failed ranges" in data.keys(), "No 'failed ranges' key found."
             assert "confirmed ranges" in data.keys(), "No 'confirmed ranges' key found."
-            assert "needs confirmation" in data.keys(), "No 'needs confirmation' key found."
-            assert "steps" in data.keys(), "No 'steps' key found."
             assert type(data["number"]) is int, "'number' must be an integer."
             assert data["number"] > 0, "'number' must be strictly greater than 0."
+            for key in ("pending ranges", "failed ranges", "confirmed ranges"):
+                for rng in data[key]:
+                    assert len(rng) == 2 and all(type(value) is int for value in rng), f"Invalid range in '{key}'."
+                    assert rng[0] < rng[1], f"Empty range in '{key}'."
         except AssertionError:
             return False
 
-    def assign_range(self, size:int, force_size = True, force_consecutive = True):
+        return True
+
+    @property
+    def frontier(self) -> int:
+        """
+        The lowest number above which nothing has been assigned.
+        """
+        return max([self.number, *filter(None, (self.pending.last_stop(), self.failed.last_stop(), self.confirmed.last_stop()))])
+
+    def _advance(self):
+        """
+        Moves `number` past any confirmed ranges that start at it.
+        """
+        first = self.confirmed.first()
+        while first and first[0] <= self.number:
+            self.number = max(self.number, first[1])
+            self.confirmed.remove(*first)
+            first = self.confirmed.first()
+
+    def assign_range(self, size:int, force_size = True, force_consecutive = True) -> list:
         """
         Checks a range of numbers out of the central data file of length `size `for scanning.
         `size` is the requested size of the range.
@@ -91,7 +381,42 @@ class ColatzDatabase():
         of this method.
         If `force_size` is `True` then the range will be of exactly `size` length.
         If `False` then `size` will be considered a maximum.
+        Gaps left by failed ranges are assigned before new numbers.
+        Returns the assigned ranges as a list of `[start, stop]` ranges which are now pending.
+        """
+        if size < 1:
+            raise ValueError("`size` must be at least 1.")
+
+        # fill the gaps first.
+        assigned = self.failed.take(size, force_consecutive, force_size)
+        remaining = size - sum(stop - start for start, stop in assigned)
+
+        if remaining and not (force_consecutive and assigned):
+            start = self.frontier
+            assigned.append([start, start + remaining])
+
+        for start, stop in assigned:
+            self.pending.add(start, stop)
+
+        return assigned
+
+    def confirm_range(self, start:int, stop:int):
+        """
+        Confirms that the pending range [start, stop) has been scanned.
+        """
+        if not self.pending.contains(start, stop):
+            raise ValueError(f"Range: [{start}, {stop}) is not pending.")
+
+        self.pending.remove(start, stop)
+        self.confirmed.add(start, stop)
+        self._advance()
+
+    def fail_range(self, start:int, stop:int):
+        """
+        Returns the pending range [start, stop) unscanned so that it will be assigned again.
         """
-        # TODO
+        if not self.pending.contains(start, stop):
+            raise ValueError(f"Range: [{start}, {stop}) is not pending.")
 
-    # TODO...
\ No newline at end of file
+        self.pending.remove(start, stop)
+        self.failed.add(start, stop)
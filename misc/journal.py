@@ -0,0 +1,227 @@
+"""
+An append-only journal for the work database.
+
+Rewriting `database.json` on every checkout and confirmation costs I/O proportional to the size of the database and a
+crash mid-write loses everything. `JournaledDatabase` instead appends one line per assign/confirm/fail event to a
+journal and only fsyncs every `sync_every` events or, through a timer started by the first unsynced event, within
+`sync_interval` seconds of it even if nothing else is appended. Every `snapshot_every` events the full
+state is written to a snapshot through a temporary file that is renamed into place and the journal is started again.
+
+Each event and snapshot carries a sequence number so startup loads the snapshot and replays only the events after it.
+A partially written last line (from a crash mid-append) is dropped, any other line that can't be read is an error.
+"""
+import json, os, pathlib, tempfile, threading, time
+from core import ColatzDatabase
+
+SNAPSHOT = "snapshot.json"
+JOURNAL = "journal.log"
+
+class JournaledDatabase(ColatzDatabase):
+    """
+    A `ColatzDatabase` persisted to the snapshot and journal in `directory`.
+    """
+    def __init__(self, directory:pathlib.Path|str, sync_every:int = 256, sync_interval:float = 1.0, snapshot_every:int = 100000):
+        super().__init__()
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.snapshot_every = snapshot_every
+
+        self.sequence = 0
+        self.snapshot_sequence = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        # the timer syncs from another thread so the file is only touched while holding the lock.
+        self._lock = threading.RLock()
+        self._timer = None
+
+        self._recover()
+        self._file = open(self.directory / JOURNAL, 'a')
+
+    @property
+    def snapshot_path(self) -> pathlib.Path:
+        return self.directory / SNAPSHOT
+
+    @property
+    def journal_path(self) -> pathlib.Path:
+        return self.directory / JOURNAL
+
+    # region recovery
+    def _recover(self):
+        """
+        Loads the snapshot (if any) and replays the journal events that follow it.
+        """
+        if self.snapshot_path.exists():
+            with open(self.snapshot_path, 'r') as file:
+                snapshot = json.load(file)
+            if not self.validate_data(snapshot):
+                raise ValueError("Invalid snapshot")
+            self.load_data(snapshot)
+            self.sequence = self.snapshot_sequence = snapshot["sequence"]
+
+        if not self.journal_path.exists():
+            return
+
+        with open(self.journal_path, 'rb') as file:
+            *lines, last = file.read().split(b'\n')
+
+        for number, line in enumerate(lines, 1):
+            try:
+                event = json.loads(line)
+            except ValueError:
+                # every append ends with a newline so a complete line that doesn't parse is corruption, not a crash.
+                raise ValueError(f"Invalid journal line {number} in {self.journal_path}")
+            self._replay(event)
+
+        # the last line has no newline after it: it is either whole (the newline was never written) or torn mid-append.
+        if last:
+            try:
+                event = json.loads(last)
+            except ValueError:
+                event = None
+
+            if event is None:
+                os.truncate(self.journal_path, os.path.getsize(self.journal_path) - len(last))
+            else:
+                self._replay(event)
+                # finish the line so the next append starts on a fresh one.
+                with open(self.journal_path, 'ab') as file:
+                    file.write(b'\n')
+                    file.flush()
+                    os.fsync(file.fileno())
+
+    def _replay(self, event:dict):
+        if event["sequence"] > self.sequence:
+            self._apply(event)
+            self.sequence = event["sequence"]
+
+    def _apply(self, event:dict):
+        """
+        Applies a journal event to the in memory state.
+        """
+        operation = event["operation"]
+        if operation == "assign":
+            for start, stop in event["ranges"]:
+                self.failed.remove(start, stop)
+                self.pending.add(start, stop)
+        elif operation == "confirm":
+            ColatzDatabase.confirm_range(self, *event["range"])
+        elif operation == "fail":
+            ColatzDatabase.fail_range(self, *event["range"])
+        else:
+            raise ValueError(f"Unknown journal operation: {operation}")
+    # endregion
+
+    # region writing
+    def _append(self, event:dict):
+        with self._lock:
+            self.sequence += 1
+            event["sequence"] = self.sequence
+            self._file.write(json.dumps(event, separators=(',', ':')) + '\n')
+            self._unsynced += 1
+
+            if self.sequence - self.snapshot_sequence >= self.snapshot_every:
+                self.snapshot()
+            elif self._unsynced >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+                self.sync()
+            elif self._timer is None:
+                # sync these events even if no more are appended.
+                self._timer = threading.Timer(self.sync_interval, self._sync_later)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _sync_later(self):
+        with self._lock:
+            self._timer = None
+            if self._unsynced and not self._file.closed:
+                self.sync()
+
+    def sync(self):
+        """
+        Flushes and fsyncs the journal. Events are only durable once synced.
+        """
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+            self._last_sync = time.monotonic()
+
+    def snapshot(self):
+        """
+        Atomically writes the full state to the snapshot and starts a new, empty journal.
+        """
+        with self._lock:
+            self._snapshot()
+
+    def _snapshot(self):
+        data = {**self.data, "sequence": self.sequence}
+        fd, temp = tempfile.mkstemp(dir=self.directory, prefix=SNAPSHOT, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(data, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp, self.snapshot_path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+        self._sync_directory()
+
+        # events up to `sequence` are in the snapshot so a crash before the journal is emptied only replays nothing.
+        self._file.close()
+        self._file = open(self.journal_path, 'w')
+        self._sync_directory()
+        self.snapshot_sequence = self.sequence
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _sync_directory(self):
+        if os.name == "posix":
+            fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def close(self):
+        """
+        Syncs and closes the journal.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+        with self._lock:
+            self._timer = None
+            if self._file.closed:
+                return
+            self.sync()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+    # endregion
+
+    def assign_range(self, size:int, force_size = True, force_consecutive = True) -> list:
+        assigned = super().assign_range(size, force_size, force_consecutive)
+        self._append({"operation": "assign", "ranges": assigned})
+        return assigned
+
+    def confirm_range(self, start:int, stop:int):
+        super().confirm_range(start, stop)
+        self._append({"operation": "confirm", "range": [start, stop]})
+
+    def fail_range(self, start:int, stop:int):
+        super().fail_range(start, stop)
+        self._append({"operation": "fail", "range": [start, stop]})
+
+    def save_database(self, database:pathlib.Path|str = None):
+        """
+        Writes a snapshot, or exports the state to the JSON file `database` if given.
+        """
+        if database is None:
+            self.snapshot()
+        else:
+            super().save_database(database)
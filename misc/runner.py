@@ -0,0 +1,328 @@
+"""
+A worker that runs compiled verifier programs over ranges from the work database.
+
+One executable is generated with `main.generate_range_program` (which takes its range as arguments) and built through
+the build cache. Ranges come from a `ColatzDatabase` or from a coordinator (see coordinator.py) and several copies of
+the executable run at once, each on its own range. The executables report every completed chunk of blocks on stdout,
+the chunk is confirmed straight away and the progress of every range is checkpointed so that a killed worker resumes
+where it stopped, losing at most one chunk per range.
+
+With `records` the executable is built with records (see `main.generate_range_program`) and prints the stopping time,
+total stopping time and peak records of each chunk before reporting it, which are merged into a `records.Records`
+file as the chunk is confirmed. These cover the numbers the verifier follows, the survivors of its sieve.
+"""
+import argparse, asyncio, json, os, pathlib, sys, tempfile, time
+from core import ColatzDatabase
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / "main"))
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / "c"))
+import main
+from benchmark import DEFAULT_FLAGS
+from build import BuildCache
+
+DEFAULT_CHECKPOINT = pathlib.Path(__file__).parent / "worker" / "checkpoint.json"
+
+class DatabaseSource():
+    """
+    Takes ranges straight from a `ColatzDatabase`. Leases are just numbered locally.
+    The database is saved (or its journal synced) after every batch of confirmations.
+    """
+    def __init__(self, database:ColatzDatabase):
+        self.database = database
+        self._next_id = 1
+
+    async def checkout(self, size:int, count:int) -> list[tuple[int, int, int]]:
+        leases = []
+        for _ in range(count):
+            for start, stop in self.database.assign_range(size):
+                leases.append((self._next_id, start, stop))
+                self._next_id += 1
+        self.save()
+        return leases
+
+    async def confirm(self, ranges:list) -> list[str]:
+        errors = []
+        for _, start, stop in ranges:
+            try:
+                self.database.confirm_range(start, stop)
+            except ValueError as err:
+                errors.append(str(err))
+        self.save()
+        return errors
+
+    async def fail(self, lease:int, start:int, stop:int):
+        try:
+            self.database.fail_range(start, stop)
+        except ValueError:
+            # the range isn't pending any more so there is nothing to return.
+            pass
+        self.save()
+
+    async def renew(self, leases:list[int]):
+        pass
+
+    def save(self):
+        if hasattr(self.database, "sync"):
+            self.database.sync()
+        elif self.database.database:
+            self.database.save_database()
+
+class CoordinatorSource():
+    """
+    Takes ranges from a coordinator through a `coordinator.Client`.
+    """
+    def __init__(self, client):
+        self.client = client
+
+    async def checkout(self, size:int, count:int) -> list[tuple[int, int, int]]:
+        leases = await self.client.checkout(size, count)
+        return [(lease["id"], start, stop) for lease in leases for start, stop in lease["ranges"]]
+
+    async def confirm(self, ranges:list) -> list[str]:
+        return (await self.client.confirm(ranges))["errors"]
+
+    async def fail(self, lease:int, start:int, stop:int):
+        try:
+            await self.client.fail([lease])
+        except RuntimeError:
+            # the lease has already expired so its ranges are failed anyway.
+            pass
+
+    async def renew(self, leases:list[int]):
+        try:
+            await self.client.renew(leases)
+        except RuntimeError:
+            pass
+
+class Runner():
+    """
+    Runs `executable` on up to `concurrency` ranges of `size` numbers at once, each using `threads` OpenMP threads.
+    `blocks` is the number of blocks of `modulus` numbers per reported (and confirmed) chunk.
+    """
+    def __init__(self, source, executable:pathlib.Path, modulus:int, size:int, concurrency:int = None, threads:int = None,
+                 blocks:int = 4096, checkpoint:pathlib.Path|str = DEFAULT_CHECKPOINT, renew_interval:float = 60.0,
+                 records:pathlib.Path|str = None):
+        self.source = source
+        self.executable = pathlib.Path(executable)
+        self.modulus = modulus
+        self.size = size
+        self.concurrency = concurrency or os.cpu_count() or 1
+        self.threads = threads or max((os.cpu_count() or 1)//self.concurrency, 1)
+        self.blocks = blocks
+        self.checkpoint = pathlib.Path(checkpoint)
+        self.renew_interval = renew_interval
+
+        # the records of every confirmed chunk (only if the executable is built with records).
+        self.records_path = pathlib.Path(records) if records else None
+        self.records = None
+        if self.records_path:
+            from records import Records
+            self.records = Records.load_json(self.records_path) if self.records_path.exists() else Records(modulus)
+
+        # start -> [lease, start, stop, done] for every range being (or waiting to be) scanned. Ranges are keyed by their
+        # start as lease ids are only unique within one run of a source and active ranges never overlap.
+        self.active = {}
+        self.confirmed = 0
+        self.failed = 0
+        self.started = None
+
+    # region checkpoints
+    def load_checkpoint(self) -> list:
+        """
+        Returns the unfinished ranges `[lease, start, stop, done]` recorded in the checkpoint file.
+        """
+        if not self.checkpoint.exists():
+            return []
+        with open(self.checkpoint, 'r') as file:
+            data = json.load(file)
+        if isinstance(data, dict):
+            # checkpoints used to be keyed by lease.
+            return [[int(lease), *value] for lease, value in data.items()]
+        return data
+
+    def save_checkpoint(self):
+        """
+        Atomically writes the progress of every active range.
+        """
+        self.checkpoint.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=self.checkpoint.parent, prefix=self.checkpoint.name, suffix=".tmp")
+        with os.fdopen(fd, 'w') as file:
+            json.dump(list(self.active.values()), file)
+        os.replace(temp, self.checkpoint)
+
+    def save_records(self):
+        """
+        Atomically writes the merged records.
+        """
+        self.records_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=self.records_path.parent, prefix=self.records_path.name, suffix=".tmp")
+        with os.fdopen(fd, 'w') as file:
+            json.dump(self.records.to_dict(), file, indent=4)
+        os.replace(temp, self.records_path)
+    # endregion
+
+    async def _run_range(self, lease:int, start:int, stop:int, done:int):
+        """
+        Runs the executable over [done, stop), confirming each chunk as it is reported.
+        """
+        environment = {**os.environ, "OMP_NUM_THREADS": str(self.threads)}
+        # a line of records can be far longer than the default limit.
+        process = await asyncio.create_subprocess_exec(str(self.executable), str(done), str(stop), str(self.blocks),
+                                                       stdout=asyncio.subprocess.PIPE, env=environment, limit=1 << 26)
+        chunk = None
+        try:
+            while line := await process.stdout.readline():
+                if line.startswith(b"records "):
+                    if self.records is not None:
+                        from records import Records
+                        chunk = Records.from_dict(json.loads(line[len(b"records "):]))
+                    continue
+
+                parts = line.split()
+                if len(parts) != 2 or parts[0] != b"done":
+                    continue
+
+                upto = min(int(parts[1])*self.modulus, stop)
+                if upto <= done:
+                    continue
+
+                errors = await self.source.confirm([(lease, done, upto)])
+                if errors:
+                    # the range is no longer ours (e.g. the lease expired) so the rest of it is given up.
+                    print(f"Lease: {lease} confirm failed: {errors[0]}")
+                    if process.returncode is None:
+                        process.kill()
+                    break
+                self.confirmed += upto - done
+                done = upto
+                self.active[start][3] = done
+                if chunk is not None:
+                    # a crash between these saves counts the chunk twice when it is resumed.
+                    self.records.merge(chunk)
+                    self.save_records()
+                    chunk = None
+                self.save_checkpoint()
+
+            returncode = await process.wait()
+        except BaseException:
+            # leave the range in the checkpoint so it is resumed next time.
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+
+        if returncode != 0 or done < stop:
+            print(f"Lease: {lease} [{start}, {stop}) failed with return code: {returncode} at: {done}")
+            await self.source.fail(lease, done, stop)
+            self.failed += stop - done
+
+        del self.active[start]
+        self.save_checkpoint()
+
+    async def _slot(self, queue:asyncio.Queue, limit:int):
+        while True:
+            if not queue.empty():
+                lease, start, stop, done = queue.get_nowait()
+            elif limit is not None and self.checked_out >= limit:
+                return
+            else:
+                self.checked_out += 1
+                (lease, start, stop), *rest = await self.source.checkout(self.size, 1)
+                # non consecutive assignments are queued for the other slots.
+                for extra in rest:
+                    self.active[extra[1]] = [*extra, extra[1]]
+                    queue.put_nowait((*extra, extra[1]))
+                done = start
+                self.active[start] = [lease, start, stop, done]
+                self.save_checkpoint()
+
+            await self._run_range(lease, start, stop, done)
+
+    async def _renew(self):
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            if self.active:
+                await self.source.renew(sorted({lease for lease, *_ in self.active.values()}))
+
+    async def run(self, ranges:int = None, progress_interval:float = 10.0):
+        """
+        Resumes any checkpointed ranges and then keeps every slot busy with new ranges.
+        Stops after checking out `ranges` new ranges (or runs forever if `ranges` is None).
+        """
+        self.started = time.monotonic()
+        self.checked_out = 0
+
+        queue = asyncio.Queue()
+        for lease, start, stop, done in self.load_checkpoint():
+            self.active[start] = [lease, start, stop, done]
+            queue.put_nowait((lease, start, stop, done))
+
+        renewer = asyncio.create_task(self._renew())
+        reporter = asyncio.create_task(self._report(progress_interval))
+        try:
+            await asyncio.gather(*(self._slot(queue, ranges) for _ in range(self.concurrency)))
+        finally:
+            renewer.cancel()
+            reporter.cancel()
+        self.print_progress()
+
+    async def _report(self, interval:float):
+        while True:
+            await asyncio.sleep(interval)
+            self.print_progress()
+
+    def print_progress(self):
+        elapsed = time.monotonic() - self.started
+        print(f"{self.confirmed} numbers confirmed in {elapsed:.1f}s ({self.confirmed/elapsed if elapsed else 0:.4g} numbers/s), "
+              f"{len(self.active)} active ranges, {self.failed} numbers failed.")
+
+def build_executable(modulus:int = 2**16, flags:list = DEFAULT_FLAGS, cache:BuildCache = None, records:bool = False) -> pathlib.Path:
+    """
+    Generates and builds (or fetches from the build cache) the range program for `modulus`, with records if `records`.
+    """
+    cache = cache or BuildCache()
+    return cache.build(main.generate_range_program(modulus, schedule="dynamic,64", records=records), flags)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify ranges from the work database with compiled programs.")
+    parser.add_argument("--database", help="A database.json file to take ranges from.")
+    parser.add_argument("--journal", help="A journal directory to take ranges from (see journal.py).")
+    parser.add_argument("--host", default="127.0.0.1", help="The coordinator's host (used if no database is given).")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="The coordinator's Unix socket.")
+    parser.add_argument("--size", type=int, default=10**10, help="The size of each range.")
+    parser.add_argument("--modulus", type=int, default=2**16)
+    parser.add_argument("--blocks", type=int, default=4096, help="Blocks of `modulus` numbers per checkpointed chunk.")
+    parser.add_argument("--concurrency", type=int, default=None, help="Programs to run at once.")
+    parser.add_argument("--threads", type=int, default=None, help="OpenMP threads per program.")
+    parser.add_argument("--ranges", type=int, default=None, help="Stop after this many new ranges.")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--records", help="Keep the stopping time, total stopping time and peak records of the tested numbers in this JSON file.")
+    arguments = parser.parse_args()
+
+    async def run():
+        client = None
+        if arguments.journal:
+            from journal import JournaledDatabase
+            source = DatabaseSource(JournaledDatabase(arguments.journal))
+        elif arguments.database:
+            source = DatabaseSource(ColatzDatabase(arguments.database))
+        else:
+            from coordinator import Client
+            client = await Client.connect(arguments.host, arguments.port, arguments.unix, worker=f"runner-{os.getpid()}")
+            source = CoordinatorSource(client)
+
+        executable = build_executable(arguments.modulus, records=bool(arguments.records))
+        runner = Runner(source, executable, arguments.modulus, arguments.size, arguments.concurrency, arguments.threads,
+                        arguments.blocks, arguments.checkpoint, records=arguments.records)
+        try:
+            await runner.run(arguments.ranges)
+        finally:
+            if client:
+                await client.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,56 @@
+import time
+import pytest
+from journal import JournaledDatabase
+
+def test_reload_torn_last_line(tmp_path):
+    with JournaledDatabase(tmp_path) as database:
+        database.assign_range(10)
+        database.assign_range(10)
+    with open(tmp_path / "journal.log", 'ab') as file:
+        file.write(b'{"operation":"assign","ran')
+
+    with JournaledDatabase(tmp_path) as database:
+        assert database.pending.to_list() == [[1, 21]]
+        database.assign_range(5)
+
+    with JournaledDatabase(tmp_path) as database:
+        assert database.pending.to_list() == [[1, 26]]
+
+def test_reload_unterminated_last_line(tmp_path):
+    with JournaledDatabase(tmp_path) as database:
+        database.assign_range(10)
+        database.assign_range(10)
+    # a complete event whose newline was never written.
+    path = tmp_path / "journal.log"
+    path.write_bytes(path.read_bytes()[:-1])
+
+    with JournaledDatabase(tmp_path) as database:
+        assert database.pending.to_list() == [[1, 21]]
+        database.assign_range(5)
+
+    with JournaledDatabase(tmp_path) as database:
+        assert database.pending.to_list() == [[1, 26]]
+
+def test_reload_corrupt_line_raises(tmp_path):
+    with JournaledDatabase(tmp_path) as database:
+        database.assign_range(10)
+        database.assign_range(10)
+    path = tmp_path / "journal.log"
+    first, rest = path.read_bytes().split(b'\n', 1)
+    path.write_bytes(first[:-1] + b'\n' + rest)
+
+    with pytest.raises(ValueError):
+        JournaledDatabase(tmp_path)
+    # nothing after the corrupt line is truncated.
+    assert path.read_bytes().endswith(rest)
+
+def test_sync_interval_without_appends(tmp_path):
+    database = JournaledDatabase(tmp_path, sync_every=1000, sync_interval=0.1)
+    try:
+        database.assign_range(10)
+        # nothing is appended after the event, the timer still syncs it.
+        time.sleep(0.5)
+        assert (tmp_path / "journal.log").read_bytes().count(b'\n') == 1
+        assert JournaledDatabase(tmp_path).pending.to_list() == [[1, 11]]
+    finally:
+        database.close()